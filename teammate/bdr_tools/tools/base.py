@@ -1,10 +1,30 @@
-from kubiya_sdk.tools import Tool
+import inspect
+
+from kubiya_sdk.tools import Tool, FileSpec
+
+from shared import slack_notifier, tracing, resilience
 
 # from tools.common import (COMMON_ENVIRONMENT_VARIABLES, COMMON_FILE_SPECS)
 
 
 ICON_URL = "https://cloud.google.com/_static/cloud/images/social-icon-google-cloud-1200-630.png"
 
+# Shared modules the scripts import (slack_notifier and its imports), shipped flat to /tmp
+SHARED_FILES = [
+    FileSpec(
+        destination="/tmp/slack_notifier.py",
+        content=inspect.getsource(slack_notifier),
+    ),
+    FileSpec(
+        destination="/tmp/tracing.py",
+        content=inspect.getsource(tracing),
+    ),
+    FileSpec(
+        destination="/tmp/resilience.py",
+        content=inspect.getsource(resilience),
+    ),
+]
+
 class BDRTool(Tool):
     def __init__(self, name, description, content, args, long_running=False, mermaid_diagram=None):
         super().__init__(
@@ -13,14 +33,15 @@ class BDRTool(Tool):
             icon_url=ICON_URL,
             type="docker",
             image="python:3.11-bullseye",
-            content=content,
+            content=f"export PYTHONPATH=/tmp:$PYTHONPATH\n{content}",
             args=args,
             env=["GITHUB_TOKEN"],
             # with_files=COMMON_FILE_SPECS,
+            with_files=SHARED_FILES,
             long_running=long_running,
             mermaid=mermaid_diagram
         )
 
 def register_bdr_tool(tool):
     from kubiya_sdk.tools.registry import tool_registry
-    tool_registry.register("bdr", tool)
\ No newline at end of file
+    tool_registry.register("bdr", tool)
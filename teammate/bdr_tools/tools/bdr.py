@@ -12,9 +12,11 @@ get_envs = BDRTool(
 get_github_repo_commit_list = BDRTool(
     name="get_github_repo_commit_list",
     description="Retrieve all the recent code committers from a github repo using this url",
-    content="python ./gitusers.py --github_repo_url '$github_repo_url' ",
+    content="python ./gitusers.py --github_repo_url '$github_repo_url' ${backend:+--backend \"$backend\"} ${report_format:+--format \"$report_format\"}",
     args=[
         Arg(name="github_repo_url", type="str", description="Github repo endpoint", required=True),
+        Arg(name="backend", type="str", description="Github API backend: 'rest' or 'graphql'", required=False, default="rest"),
+        Arg(name="report_format", type="str", description="Report format: 'csv', 'jsonl' or 'parquet'", required=False, default="csv"),
     ],
     mermaid_diagram="..."  # Add mermaid diagram here
 )
@@ -1,21 +1,33 @@
 import os
-import csv
 import json
+import time
+import argparse
 from datetime import datetime, timedelta
 
 import requests
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+
+try:
+  from shared import slack_notifier
+except ImportError:  # shipped flat next to this script
+  import slack_notifier
+from identity import IdentityIndex, noreply_login
+from report import ReportWriter, REPORT_FORMATS
 
 # Provide your personal access token to avoid API rate limits (optional but recommended)
-GITHUB_URL="https://api.github.com/"
+GITHUB_URL=os.environ.get('GITHUB_URL', "https://api.github.com/")
+GITHUB_GRAPHQL_URL=os.environ.get('GITHUB_GRAPHQL_URL', GITHUB_URL.rstrip('/') + '/graphql')
 GITHUB_TOKEN=os.environ.get('GITHUB_TOKEN')
 GITHUB_HEADERS = {
     'Authorization': f'token {GITHUB_TOKEN}',
     'Accept': 'application/vnd.github.v3+json'
 }
 GITHUB_REPO_URL=os.environ.get('GITHUB_ORG_URL')
-CSV=os.environ['CSV_FILE_PATH']
+GITHUB_BACKEND=os.environ.get('GITHUB_BACKEND', 'rest')
+COMMIT_WINDOW_DAYS=int(os.environ.get('COMMIT_WINDOW_DAYS', '30'))
+CSV=os.environ.get('CSV_FILE_PATH', './user_data.csv')
+REPORT_FORMAT=os.environ.get('REPORT_FORMAT', 'csv')
+IDENTITY_INDEX_PATH=os.environ.get('IDENTITY_INDEX_PATH', './identity_index.json.gz')
+ORG_EMAIL_DOMAINS={d.strip().lower() for d in os.environ.get('ORG_EMAIL_DOMAINS', '').split(',') if d.strip()}
 
 THREAD_TS = os.environ.get('SLACK_THREAD')
 CHANNEL_ID = os.environ.get('SLACK_CHANNEL')
@@ -23,83 +35,373 @@ SLACK_TOKEN = os.environ.get('SLACK_API_TOKEN')
 SUBJECT = os.environ.get('ALERT_SUBJECT')
 OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY')
 
+# REST caps pages at 100 items; GraphQL history connections allow the same page size
+# but carry author identity inline, and user lookups can be aliased into one query.
+REST_PAGE_SIZE = 100
+GRAPHQL_PAGE_SIZE = 100
+GRAPHQL_USER_BATCH = 50
+
+# Number of HTTP round trips made per backend, used by --compare
+API_CALLS = {'rest': 0, 'graphql': 0}
+
+session = requests.Session()
+session.headers.update(GITHUB_HEADERS)
+
+GRAPHQL_ORG_REPOS_QUERY = """
+query($org: String!, $after: String) {
+  organization(login: $org) {
+    repositories(first: 100, after: $after, isFork: false) {
+      pageInfo { hasNextPage endCursor }
+      nodes { name }
+    }
+  }
+}
+"""
+
+GRAPHQL_HISTORY_QUERY = """
+query($owner: String!, $repo: String!, $since: GitTimestamp!, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $repo) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $first, since: $since, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              committedDate
+              author { name email user { login } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def rest_get(path, params=None):
+  """GET a GitHub REST path (or absolute url) and count the call."""
+  url = path if path.startswith('http') else GITHUB_URL.rstrip('/') + '/' + path.lstrip('/')
+  API_CALLS['rest'] += 1
+  return session.get(url, params=params)
+
+
+def graphql(query, variables):
+  """Run a GitHub GraphQL query and return its `data` block.
+
+  Args:
+      query (str): GraphQL document
+      variables (dict): query variables
+
+  Returns:
+      dict: the `data` member of the response
+
+  Raises:
+      RuntimeError: if the API answers with a non-200 status or top level errors
+  """
+  API_CALLS['graphql'] += 1
+  response = session.post(GITHUB_GRAPHQL_URL,
+                          json={'query': query, 'variables': variables},
+                          headers={'Authorization': f'bearer {GITHUB_TOKEN}'})
+  if response.status_code != 200:
+    raise RuntimeError(f"GraphQL error: {response.status_code}, {response.text}")
+  body = response.json()
+  # Unknown logins come back as NOT_FOUND errors next to partial data; those are fine
+  errors = [e for e in body.get('errors') or [] if e.get('type') != 'NOT_FOUND']
+  if errors:
+    raise RuntimeError(f"GraphQL error: {errors}")
+  return body.get('data') or {}
+
+
+def parse_github_url(repo_url):
+  """Split a github url into (owner, repo). repo is None for an org url."""
+  parts = [p for p in repo_url.rstrip('/').split('/') if p]
+  if 'github.com' in parts:
+    parts = parts[parts.index('github.com') + 1:]
+  if len(parts) == 1:
+    return parts[0], None
+  return parts[-2], parts[-1]
+
+
+def list_org_repos(org, backend='rest'):
+  """List the (non fork) repositories of an organization."""
+  repos = []
+  if backend == 'graphql':
+    after = None
+    while True:
+      data = graphql(GRAPHQL_ORG_REPOS_QUERY, {'org': org, 'after': after})
+      conn = data['organization']['repositories']
+      repos.extend(node['name'] for node in conn['nodes'])
+      if not conn['pageInfo']['hasNextPage']:
+        return repos
+      after = conn['pageInfo']['endCursor']
+
+  url = f"orgs/{org}/repos"
+  params = {'per_page': REST_PAGE_SIZE, 'type': 'sources'}
+  while url:
+    response = rest_get(url, params=params)
+    if response.status_code != 200:
+      print(f"Error: {response.status_code}, {response.json()}")
+      return repos
+    repos.extend(repo['name'] for repo in response.json())
+    url, params = response.links.get('next', {}).get('url'), None
+  return repos
+
+
+def iter_commits_rest(owner, repo, since):
+  """Yield (repo, login, name, email, date) for every commit since `since`, page by page."""
+  url = f"repos/{owner}/{repo}/commits"
+  params = {'since': since, 'per_page': REST_PAGE_SIZE}
+  while url:
+    response = rest_get(url, params=params)
+    if response.status_code != 200:
+      print(f"Error: {response.status_code}, {response.json()}")
+      return
+    for commit in response.json():
+      git_author = commit['commit']['author'] or {}
+      login = commit['author']['login'] if commit.get('author') else None
+      yield repo, login, git_author.get('name'), git_author.get('email'), git_author.get('date')
+    url, params = response.links.get('next', {}).get('url'), None
+
+
+def iter_commits_graphql(owner, repo, since):
+  """Yield (repo, login, name, email, date) for every commit since `since` using GraphQL history."""
+  after = None
+  while True:
+    data = graphql(GRAPHQL_HISTORY_QUERY, {'owner': owner, 'repo': repo, 'since': since,
+                                           'first': GRAPHQL_PAGE_SIZE, 'after': after})
+    ref = (data.get('repository') or {}).get('defaultBranchRef')
+    if not ref:
+      return
+    history = ref['target']['history']
+    for node in history['nodes']:
+      author = node['author'] or {}
+      login = (author.get('user') or {}).get('login')
+      yield repo, login, author.get('name'), author.get('email'), node['committedDate']
+    if not history['pageInfo']['hasNextPage']:
+      return
+    after = history['pageInfo']['endCursor']
+
+
+def aggregate_committers(commits, index=None):
+  """Fold a commit stream into one record per person.
+
+  Every commit is indexed by login, email, noreply address and name, so commits
+  without a linked Github account are kept and aliases of one person collapse
+  into a single record. Only per-identity aggregates are kept in memory, never
+  the commits themselves.
+
+  Args:
+      commits (iterable): (repo, login, name, email, date) tuples
+      index (IdentityIndex): alias index to update, a fresh one when None
+
+  Returns:
+      dict: person key -> committer record ('login' is None for people never seen with an account)
+  """
+  index = index if index is not None else IdentityIndex()
+  identities = {}
+  for repo, login, name, email, date in commits:
+    key = index.add(login=login, name=name, email=email)
+    if key is None:
+      continue
+    record = identities.get(key)
+    if record is None:
+      # a noreply address is enough to know the account, whichever key ends up the person's root
+      record = identities[key] = {'login': login or noreply_login(email), 'name': name, 'email': email, 'company': None,
+                                  'commit_count': 0, 'first_commit': date, 'last_commit': date,
+                                  'repos': set()}
+    record['commit_count'] += 1
+    record['repos'].add(repo)
+    if date and (not record['first_commit'] or date < record['first_commit']):
+      record['first_commit'] = date
+    if date and (not record['last_commit'] or date > record['last_commit']):
+      record['last_commit'] = date
+
+  # Aliases can be joined by a later commit, so merge per person only once the stream is done
+  committers = {}
+  for key, record in identities.items():
+    person = index.root(key)
+    merged = committers.get(person)
+    if merged is None:
+      if not record['login'] and person.startswith('login:'):
+        record['login'] = person[len('login:'):]
+      committers[person] = record
+      continue
+    merged['commit_count'] += record['commit_count']
+    merged['repos'] |= record['repos']
+    for field in ('login', 'name', 'email'):
+      merged[field] = merged[field] or record[field]
+    if record['first_commit'] and (not merged['first_commit'] or record['first_commit'] < merged['first_commit']):
+      merged['first_commit'] = record['first_commit']
+    if record['last_commit'] and (not merged['last_commit'] or record['last_commit'] > merged['last_commit']):
+      merged['last_commit'] = record['last_commit']
+  return committers
+
+
+def is_org_email(email):
+  """True when the email belongs to one of ORG_EMAIL_DOMAINS."""
+  return bool(email) and email.rsplit('@', 1)[-1].lower() in ORG_EMAIL_DOMAINS
+
 
 def is_member_of_org(org, username):
   """Check if a user is a member of the given organization."""
-  url = f"https://api.github.com/orgs/{org}/members/{username}"
-  headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-  
-  response = requests.get(url, headers=headers)
-  
+  response = rest_get(f"orgs/{org}/members/{username}")
+
   # Status 204 means the user is a member, 404 means they are not
   return response.status_code == 204
 
-def get_committers(repo_url):
-  
-  """ Get all the committers usernames from a Github org
+
+def enrich_profile_rest(record):
+  """Fill name/email/company from the user's public profile (one call per user)."""
+  response = rest_get(f"users/{record['login']}")
+  if response.status_code == 200:
+    profile = response.json()
+    record['name'] = profile.get('name') or record['name']
+    record['email'] = profile.get('email') or record['email']
+    record['company'] = profile.get('company')
+
+
+def fetch_profiles_graphql(org, logins):
+  """Fetch profiles and org membership for many users with aliased GraphQL queries.
 
   Args:
-      repo_url (_type_): str
+      org (str): organization login used for the membership check
+      logins (list): user logins
 
   Returns:
-      _type_: list
-  """ 
-
-  # Extract owner and repo from the URL
-  parts = repo_url.rstrip('/').split('/')
-  owner, repo = parts[-2], parts[-1]
-
-  # GitHub API endpoint for commits
-  api_url = f"https://api.github.com/repos/{owner}/{repo}/commits"
-  
-  # Calculate the timestamp for the past month
-  since = (datetime.now() - timedelta(days=30)).isoformat()
-  
-  # Make the request to fetch commits
-  headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-  response = requests.get(api_url, params={"since": since}, headers=headers)
-  
-  if response.status_code != 200:
-      print(f"Error: {response.status_code}, {response.json()}")
-      return []
-
-  # Extract unique committers
-  commits = response.json()
-  committers = {commit['author']['login']: {'name': commit['author']['name'], 
-                                            'email': commit['author']['email'],
-                                            'url': commit['author']['url'],
-                                            'blog': commit['author']['blog'],
-                                            } for commit in commits if commit['author']}
-  
-  committers_dict = {commit['author']['login']: {'name': commit['author']['name'], 
-                                              'email': commit['author']['email'],
-                                              'url': commit['author']['url'],
-                                              'blog': commit['author']['blog'],
-                                              } for commit in commits if commit['author']}
-
-  
+      dict: login -> {'name', 'email', 'company', 'member'}
+  """
+  profiles = {}
+  for start in range(0, len(logins), GRAPHQL_USER_BATCH):
+    batch = logins[start:start + GRAPHQL_USER_BATCH]
+    fields = "login name email company organization(login: $org) { login }"
+    body = "\n".join(f'u{i}: user(login: {json.dumps(login)}) {{ {fields} }}'
+                     for i, login in enumerate(batch))
+    data = graphql(f"query($org: String!) {{\n{body}\n}}", {'org': org})
+    for i, login in enumerate(batch):
+      user = data.get(f'u{i}') or {}
+      profiles[login] = {'name': user.get('name'),
+                         'email': user.get('email'),
+                         'company': user.get('company'),
+                         'member': bool(user.get('organization'))}
+  return profiles
+
+
+def iter_external_committers(repo_url, backend='rest', enrich=False, days=COMMIT_WINDOW_DAYS):
+
+  """ Stream the external committers of a Github repo or org
+
+  Commits are folded into per-person aggregates while they are paged in; records are
+  yielded one by one as soon as their org membership is known, so report writers
+  can consume them without the full list ever being materialized.
+
+  Args:
+      repo_url (str): repo url (https://github.com/owner/repo) or org url (https://github.com/owner)
+      backend (str): 'rest' or 'graphql'
+      enrich (bool): fill name/email/company from user profiles. Always done for graphql
+        since it costs one query per GRAPHQL_USER_BATCH users.
+      days (int): size of the commit window
+
+  Yields:
+      dict: committer record of a person who is not a member of the org, with 'membership'
+        'external', or 'unknown' for people without an account when ORG_EMAIL_DOMAINS is unset
+  """
+
+  owner, repo = parse_github_url(repo_url)
+  repos = [repo] if repo else list_org_repos(owner, backend)
+
+  # Calculate the timestamp for the commit window
+  since = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+  iter_commits = iter_commits_graphql if backend == 'graphql' else iter_commits_rest
+  index = IdentityIndex.load(IDENTITY_INDEX_PATH)
+  committers = aggregate_committers((commit for name in repos
+                                     for commit in iter_commits(owner, name, since)), index)
+  if IDENTITY_INDEX_PATH:
+    index.save(IDENTITY_INDEX_PATH)
+
+  # People never seen with a Github account can only be matched on their email domain;
+  # without ORG_EMAIL_DOMAINS they are reported as unknown rather than external
+  for record in committers.values():
+    if not record['login'] and not is_org_email(record['email']):
+      record['membership'] = 'external' if ORG_EMAIL_DOMAINS else 'unknown'
+      yield record
+
   # Filter out committers who are part of the organization
-  external_committers = [
-      user for user in committers_dict if not is_member_of_org(owner, user)
-  ]
-  
-  return external_committers
-
-def SaveExternalCommitersData(external_committers, path='./user_data.csv'):
-  with open(path, 'a', newline='') as file:
-    # create headers
-      writer = csv.writer(file, delimiter=',')
-      writer.writerow([ # str(res.json()['name']),
-                       # str(res.json()['login']),
-                       # str(res.json()['company']),
-                       # str(res.json()['organizations_url']),
-                       # str(res.json()['email']),
-                       # str(res.json()['url']),
-                       # str(res.json()['blog']),
-                      ]
-                    )
-      
-  file.close()
+  with_login = [record for record in committers.values() if record['login']]
+  if backend == 'graphql':
+    for start in range(0, len(with_login), GRAPHQL_USER_BATCH):
+      batch = with_login[start:start + GRAPHQL_USER_BATCH]
+      profiles = fetch_profiles_graphql(owner, [record['login'] for record in batch])
+      for record in batch:
+        profile = profiles[record['login']]
+        if profile['member']:
+          continue
+        record['name'] = profile['name'] or record['name']
+        record['email'] = profile['email'] or record['email']
+        record['company'] = profile['company']
+        record['membership'] = 'external'
+        yield record
+    return
+
+  for record in with_login:
+    if is_member_of_org(owner, record['login']):
+      continue
+    if enrich:
+      enrich_profile_rest(record)
+    record['membership'] = 'external'
+    yield record
+
+
+def get_committers(repo_url, backend='rest', enrich=False, days=COMMIT_WINDOW_DAYS):
+
+  """ Get all the external committers of a Github repo or org
+
+  Args:
+      repo_url (str): repo url or org url
+      backend (str): 'rest' or 'graphql'
+      enrich (bool): fill name/email/company from user profiles
+      days (int): size of the commit window
+
+  Returns:
+      list: committer records of users who are not members of the org
+  """
+
+  return list(iter_external_committers(repo_url, backend=backend, enrich=enrich, days=days))
+
+
+def compare_backends(repo_url):
+  """Run both backends with profile enrichment and print API calls and wall time for each."""
+  results = {}
+  for backend in ('rest', 'graphql'):
+    API_CALLS[backend] = 0
+    started = time.perf_counter()
+    committers = get_committers(repo_url, backend=backend, enrich=True)
+    results[backend] = {'api_calls': API_CALLS[backend],
+                        'wall_time_s': round(time.perf_counter() - started, 3),
+                        'external_committers': len(committers),
+                        'logins': sorted(c['login'] or c['email'] or '' for c in committers)}
+  print(json.dumps({backend: {k: v for k, v in res.items() if k != 'logins'}
+                    for backend, res in results.items()}, indent=2))
+  if results['rest']['logins'] != results['graphql']['logins']:
+    print("Warning: backends disagree on the external committer list")
+  return results
+
+
+def SaveExternalCommitersData(external_committers, path='./user_data.csv', fmt='csv', compress=False):
+  """ Stream committer records into a report file
+
+  Args:
+      external_committers (iterable): committer records, typically iter_external_committers()
+      path (str): report path; the extension is replaced to match the format
+      fmt (str): 'csv', 'jsonl' or 'parquet'
+      compress (bool): gzip the output
+
+  Returns:
+      tuple: (path of the written report, number of rows)
+  """
+  with ReportWriter(path, fmt=fmt, compress=compress) as writer:
+    rows = writer.write_all(external_committers)
+  return writer.path, rows
 
 def ExtractSlackResponseInfo(response):
   return {
@@ -110,40 +412,55 @@ def ExtractSlackResponseInfo(response):
       "timestamp": response.get("file", {}).get("timestamp")
   }
 
-def SendSlackFileToThread(token, 
-                          channel_id, 
-                          thread_ts, 
-                          file_path, 
+def SendSlackFileToThread(token,
+                          channel_id,
+                          thread_ts,
+                          file_path,
                           initial_comment):
-    
-  client = WebClient(token=token)
+
+  notifier = slack_notifier.get_notifier(token)
   try:
-    response = client.files_upload_v2(
-        channel=channel_id,
-        file=file_path,
+    response = notifier.upload_file(
+        channel_id,
+        file_path,
         initial_comment=initial_comment,
         thread_ts=thread_ts
     )
     return response
-  except SlackApiError as e:
+  except slack_notifier.SlackError as e:
     print(f"Error sending file to Slack thread: {e}")
     raise
 
 
-# Example usage
-repo_url = GITHUB_REPO_URL
-initial_comment = (f"Github Contrib CSV for Github Org '{GITHUB_REPO_URL}'")
-committers = get_committers(repo_url)
-print("External users who committed in the last month:", committers)
-# do something with the data
-slack_response = SendSlackFileToThread(SLACK_TOKEN, 
-                                        CHANNEL_ID, 
-                                        THREAD_TS, 
-                                        CSV, 
-                                        initial_comment)
-
-# Extract relevant information from the Slack response
-response_info = ExtractSlackResponseInfo(slack_response)
-print(json.dumps(response_info, indent=2))
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Find external committers of a Github repo or org.")
+  parser.add_argument("--github_repo_url", default=GITHUB_REPO_URL, help="Github repo or org url.")
+  parser.add_argument("--backend", choices=['rest', 'graphql'], default=GITHUB_BACKEND,
+                      help="Github API used to read commit history and profiles.")
+  parser.add_argument("--enrich", action='store_true',
+                      help="Fetch name/email/company from user profiles (REST: one call per user).")
+  parser.add_argument("--compare", action='store_true',
+                      help="Run both backends and report API calls and wall time.")
+  parser.add_argument("--output", default=CSV, help="Report path; the extension follows --format.")
+  parser.add_argument("--format", choices=REPORT_FORMATS, default=REPORT_FORMAT, help="Report format.")
+  parser.add_argument("--gzip", action='store_true', help="Gzip the csv/jsonl report.")
+  args = parser.parse_args()
 
+  repo_url = args.github_repo_url
+  if args.compare:
+    compare_backends(repo_url)
+  else:
+    committers = iter_external_committers(repo_url, backend=args.backend, enrich=args.enrich)
+    report, rows = SaveExternalCommitersData(committers, path=args.output, fmt=args.format, compress=args.gzip)
+    print(f"Wrote {rows} external committers to {report}")
+    print(f"{args.backend} API calls: {API_CALLS[args.backend]}")
+    initial_comment = (f"Github Contrib report for Github Org '{repo_url}': {rows} external committers in the last {COMMIT_WINDOW_DAYS} days")
+    slack_response = SendSlackFileToThread(SLACK_TOKEN,
+                                            CHANNEL_ID,
+                                            THREAD_TS,
+                                            report,
+                                            initial_comment)
 
+    # Extract relevant information from the Slack response
+    response_info = ExtractSlackResponseInfo(slack_response)
+    print(json.dumps(response_info, indent=2))
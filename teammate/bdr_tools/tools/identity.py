@@ -0,0 +1,156 @@
+import os
+import re
+import gzip
+import json
+
+IDENTITY_INDEX_VERSION = 1
+
+# <id>+<login>@users.noreply.github.com or <login>@users.noreply.github.com
+NOREPLY_EMAIL = re.compile(r'^(?:\d+\+)?(?P<login>[^@]+)@users\.noreply\.github\.com$')
+
+# Names that many unrelated people commit under; they never join identities
+GENERIC_NAMES = {'root', 'ubuntu', 'admin', 'user', 'unknown', 'your name', 'github',
+                 'github action', 'github actions', 'dependabot[bot]', 'renovate[bot]'}
+
+
+def normalize_email(email):
+  return email.strip().lower() if email and '@' in email else None
+
+
+def noreply_login(email):
+  """The Github login behind a noreply commit address, None for any other email."""
+  email = normalize_email(email)
+  noreply = NOREPLY_EMAIL.match(email) if email else None
+  return noreply.group('login') if noreply else None
+
+
+def normalize_name(name):
+  name = ' '.join(name.split()).casefold() if name else ''
+  # single token names ("dev", "bob") are too ambiguous to merge people on
+  if ' ' not in name or name in GENERIC_NAMES:
+    return None
+  return name
+
+
+class IdentityIndex:
+  """Union-find over commit identities (login, email, noreply address and name).
+
+  Every distinct identity key is interned to an integer; keys seen on the same
+  commit are unioned, so one person committing under several emails or logins
+  resolves to a single root. Union by size plus path halving keeps a pass over
+  millions of commits near linear. The index is persisted as gzipped json and
+  reloaded on the next run so aliases accumulate across runs.
+
+  Example:
+    >>> index = IdentityIndex()
+    >>> index.add(login='octocat', email='octo@example.com')
+    'login:octocat'
+    >>> index.add(email='12345+octocat@users.noreply.github.com')
+    'email:12345+octocat@users.noreply.github.com'
+    >>> index.same('email:octo@example.com', 'login:octocat')
+    True
+  """
+
+  def __init__(self, merge_names=True):
+    self.merge_names = merge_names
+    self.ids = {}
+    self.keys = []
+    self.parent = []
+    self.size = []
+
+  def __len__(self):
+    return len(self.keys)
+
+  def _intern(self, key):
+    i = self.ids.get(key)
+    if i is None:
+      i = self.ids[key] = len(self.keys)
+      self.keys.append(key)
+      self.parent.append(i)
+      self.size.append(1)
+    return i
+
+  def find(self, i):
+    parent = self.parent
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  def union(self, a, b):
+    ra, rb = self.find(a), self.find(b)
+    if ra == rb:
+      return ra
+    if self.size[ra] < self.size[rb]:
+      ra, rb = rb, ra
+    self.parent[rb] = ra
+    self.size[ra] += self.size[rb]
+    return ra
+
+  def add(self, login=None, name=None, email=None):
+    """Index the identity keys of one commit author.
+
+    Args:
+        login (str): Github login, None when the commit is not linked to an account
+        name (str): git author name
+        email (str): git author email
+
+    Returns:
+        str: the primary key of this author (login, else email, else name), None if
+          the commit carries nothing usable
+    """
+    keys = []
+    if login:
+      keys.append('login:' + login.lower())
+    email = normalize_email(email)
+    if email:
+      keys.append('email:' + email)
+      login = noreply_login(email)
+      if login:
+        keys.append('login:' + login.lower())
+    name = normalize_name(name)
+    if name and (self.merge_names or not keys):
+      keys.append('name:' + name)
+    if not keys:
+      return None
+
+    first = self._intern(keys[0])
+    for key in keys[1:]:
+      self.union(first, self._intern(key))
+    return keys[0]
+
+  def root(self, key):
+    """Return the canonical key of the person `key` belongs to."""
+    return self.keys[self.find(self.ids[key])]
+
+  def same(self, a, b):
+    return a in self.ids and b in self.ids and self.find(self.ids[a]) == self.find(self.ids[b])
+
+  def people(self):
+    """Number of distinct people in the index."""
+    return sum(1 for i, p in enumerate(self.parent) if i == p)
+
+  def save(self, path):
+    """Persist the index, flattening every key onto its root."""
+    roots = [self.find(i) for i in range(len(self.keys))]
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+      json.dump({'version': IDENTITY_INDEX_VERSION, 'keys': self.keys, 'parent': roots}, file)
+
+  @classmethod
+  def load(cls, path, merge_names=True):
+    """Load a persisted index, or return an empty one if `path` does not exist."""
+    index = cls(merge_names=merge_names)
+    if not path or not os.path.exists(path):
+      return index
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+      data = json.load(file)
+    if data.get('version') != IDENTITY_INDEX_VERSION:
+      print(f"Ignoring identity index {path} with version {data.get('version')}")
+      return index
+    index.keys = data['keys']
+    index.parent = data['parent']
+    index.ids = {key: i for i, key in enumerate(index.keys)}
+    index.size = [0] * len(index.keys)
+    for root in index.parent:
+      index.size[root] += 1
+    return index
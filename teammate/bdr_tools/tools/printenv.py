@@ -1,35 +1,82 @@
 import os
-import json 
+import re
+import json
+import argparse
 import logging
+import tempfile
 
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+try:
+  from shared import slack_notifier
+except ImportError:  # shipped flat next to this script
+  import slack_notifier
 
 logger = logging.getLogger(__name__)
 
 THREAD_TS = os.environ.get('SLACK_THREAD')
 CHANNEL_ID = os.environ.get('SLACK_CHANNEL')
-SLACK_TOKEN = os.environ.get('SLACK_API_TOKEN')
+SLACK_TOKEN = os.environ.get('SLACK_API_TOKEN') or os.environ.get("SLACK_BOT_TOKEN")
 
+# Keys that look like credentials are masked unless they are explicitly allowlisted
+SECRET_KEY_PATTERN = re.compile(
+    r'(SECRET|TOKEN|PASS|PWD|KEY|AUTH|CREDENTIAL|PRIVATE|SESSION|COOKIE|SIGNATURE|DSN|WEBHOOK|CERT)',
+    re.IGNORECASE)
+# user:password@ inside urls (redis://, postgres://, https://...)
+URL_CREDENTIALS = re.compile(r'(?P<scheme>[a-z][a-z0-9+.-]*://)[^/@\s]+@', re.IGNORECASE)
+DEFAULT_ALLOWLIST = {'SLACK_CHANNEL', 'SLACK_THREAD', 'SLACK_CHANNEL_ID', 'SLACK_THREAD_TS',
+                     'KUBIYA_USER_EMAIL', 'KUBIYA_USER_ORG', 'KUBI_UUID'}
+ENV_ALLOWLIST = DEFAULT_ALLOWLIST | {k.strip() for k in os.environ.get('PRINTENV_ALLOWLIST', '').split(',') if k.strip()}
+MASK = '********'
 
-client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
-initial_comment = (f"Getting all the envs for this teammate'")
+# chat.postMessage truncates text after 40k characters; longer reports go out as a file
+SLACK_MESSAGE_LIMIT = 39000
 
-if __name__ == "__main__":
-  try: 
-    result = client.chat_postMessage(
-        channel=CHANNEL_ID,
-        text=initial_comment
-    )
 
+def redact(name, value):
+  """Mask a value whose key looks secret, and strip credentials embedded in urls."""
+  if name not in ENV_ALLOWLIST and SECRET_KEY_PATTERN.search(name):
+    return MASK
+  return URL_CREDENTIALS.sub(r'\g<scheme>' + MASK + '@', value)
 
-    for name, value in os.environ.items():
-        result = client.chat_postMessage(
-          channel=CHANNEL_ID,
-          text="{0}: {1}".format(name, value)
-            )
 
-  except SlackApiError as e:
-      print(f"Error: {e}")
+def build_report(environ, fmt='text'):
+  """Render one redacted report of the environment.
+
+  Args:
+    environ (Mapping): environment to report, usually os.environ
+    fmt (str): 'text' for a sorted KEY: value listing, 'json' for an object
+
+  Returns:
+    str: the report
+  """
+  redacted = {name: redact(name, value) for name, value in sorted(environ.items())}
+  if fmt == 'json':
+    return json.dumps(redacted, indent=2)
+  return '\n'.join(f"{name}: {value}" for name, value in redacted.items())
+
 
+def send_report(notifier, report, fmt='text', upload=False):
+  """Send the report with a single Slack API call, as a message or a file upload."""
+  title = "Getting all the envs for this teammate"
+  if upload or len(report) > SLACK_MESSAGE_LIMIT:
+    suffix = '.json' if fmt == 'json' else '.txt'
+    with tempfile.NamedTemporaryFile('w', suffix=suffix, prefix='env-', delete=False) as file:
+      file.write(report)
+    try:
+      return notifier.upload_file(CHANNEL_ID, file.name, title=title,
+                                  initial_comment=title, thread_ts=THREAD_TS)
+    finally:
+      os.unlink(file.name)
+  return notifier.post_message(CHANNEL_ID, f"{title}\n```{report}```", thread_ts=THREAD_TS)
 
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Post a redacted dump of the teammate environment to Slack.")
+  parser.add_argument("--format", choices=['text', 'json'], default='text', help="Report format.")
+  parser.add_argument("--upload", action='store_true', help="Send the report as a file instead of a message.")
+  args = parser.parse_args()
+
+  notifier = slack_notifier.get_notifier(SLACK_TOKEN)
+  try:
+    send_report(notifier, build_report(os.environ, args.format), args.format, args.upload)
+  except slack_notifier.SlackError as e:
+      print(f"Error: {e}")
@@ -0,0 +1,122 @@
+import csv
+import gzip
+import io
+import json
+
+# pyarrow is only needed for parquet reports
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = pq = None
+
+REPORT_COLUMNS = ['login', 'name', 'email', 'company', 'commit_count',
+                  'first_commit', 'last_commit', 'repos', 'membership']
+REPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Rows buffered per parquet row group; this bounds writer memory for any org size
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+def report_path(path, fmt, compress=False):
+  """Return `path` with the extension matching the report format."""
+  base = path
+  for ext in ('.gz', '.csv', '.jsonl', '.parquet'):
+    if base.endswith(ext):
+      base = base[:-len(ext)]
+  path = f"{base}.{fmt}"
+  if compress and fmt != 'parquet':
+    path += '.gz'
+  return path
+
+
+def _row(record):
+  """Project a committer record onto REPORT_COLUMNS."""
+  row = {column: record.get(column) for column in REPORT_COLUMNS}
+  repos = row['repos']
+  if isinstance(repos, (set, list, tuple)):
+    row['repos'] = ';'.join(sorted(repos))
+  return row
+
+
+class ReportWriter:
+  """Stream committer records to a csv, jsonl or parquet file.
+
+  Rows are written as they arrive; the header is written once when the file is
+  opened. csv and jsonl can be gzipped on the fly, parquet is always compressed
+  internally and buffers at most PARQUET_ROW_GROUP_SIZE rows.
+
+  Example:
+    >>> with ReportWriter('./user_data.csv', fmt='jsonl', compress=True) as writer:
+    ...   writer.write_all(iter_external_committers(url))
+  """
+
+  def __init__(self, path, fmt='csv', compress=False):
+    if fmt not in REPORT_FORMATS:
+      raise ValueError(f"Unsupported report format: {fmt}")
+    if fmt == 'parquet' and pq is None:
+      raise ImportError("pyarrow is required for parquet reports")
+    self.path = report_path(path, fmt, compress)
+    self.fmt = fmt
+    self.compress = compress
+    self.rows = 0
+    self._file = None
+    self._csv = None
+    self._parquet = None
+    self._buffer = []
+
+  def __enter__(self):
+    self.open()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.close()
+
+  def open(self):
+    if self.fmt == 'parquet':
+      schema = pa.schema([(column, pa.int64() if column == 'commit_count' else pa.string())
+                          for column in REPORT_COLUMNS])
+      self._parquet = pq.ParquetWriter(self.path, schema, compression='gzip' if self.compress else 'snappy')
+      return
+    if self.compress:
+      self._file = io.TextIOWrapper(gzip.open(self.path, 'wb'), encoding='utf-8', newline='')
+    else:
+      self._file = open(self.path, 'w', newline='', encoding='utf-8')
+    if self.fmt == 'csv':
+      self._csv = csv.DictWriter(self._file, fieldnames=REPORT_COLUMNS)
+      self._csv.writeheader()
+
+  def write(self, record):
+    """Write one committer record."""
+    row = _row(record)
+    if self.fmt == 'csv':
+      self._csv.writerow(row)
+    elif self.fmt == 'jsonl':
+      self._file.write(json.dumps(row) + '\n')
+    else:
+      self._buffer.append(row)
+      if len(self._buffer) >= PARQUET_ROW_GROUP_SIZE:
+        self._flush_row_group()
+    self.rows += 1
+    return record
+
+  def write_all(self, records):
+    """Drain an iterable of records into the report and return the row count."""
+    for record in records:
+      self.write(record)
+    return self.rows
+
+  def _flush_row_group(self):
+    if self._buffer:
+      columns = {column: [row[column] for row in self._buffer] for column in REPORT_COLUMNS}
+      self._parquet.write_table(pa.table(columns, schema=self._parquet.schema))
+      self._buffer = []
+
+  def close(self):
+    if self._parquet is not None:
+      self._flush_row_group()
+      self._parquet.close()
+      self._parquet = None
+    if self._file is not None:
+      self._file.close()
+      self._file = None
@@ -0,0 +1,311 @@
+"""End-to-end benchmarks for the JIT and BDR flows against local stand-ins.
+
+Every external service is replaced by benchmarks/fakes.py and Redis by fakeredis
+(or a real server with --redis_url), so the numbers measure our own code plus
+the configured upstream latency. For each scenario and concurrency level the
+p50/p95/p99 latency, throughput and error count are reported.
+
+    python benchmarks/bench_e2e.py --concurrency 1,8,32 --requests 200
+    python benchmarks/bench_e2e.py --latency llm=800,slack=40,iam=60 --rate_429 slack=0.05
+    python benchmarks/bench_e2e.py --scenarios generate_policy --latency llm=800,ollama=200
+    python benchmarks/bench_e2e.py --scenarios generate_policy --token_ms 20 --bad_policy_rate 0.2
+    python benchmarks/bench_e2e.py --output baseline.json
+    python benchmarks/bench_e2e.py --baseline baseline.json --tolerance 0.25   # exits 1 on regressions
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+from argparse import Namespace
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bdr_tools', 'tools')]
+
+from benchmarks.fakes import FakeServices  # noqa: E402
+
+SCENARIOS = ('request_access', 'generate_policy', 'approve', 'webhook', 'get_committers_rest', 'get_committers_graphql')
+APPROVER = 'adsaunde1@gmail.com'
+REQUESTER = 'engineer@example.com'
+
+
+class Skip(Exception):
+    """The scenario cannot run in this environment (e.g. an optional dependency is missing)."""
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def summarize(scenario, concurrency, latencies, errors, wall):
+    return {'scenario': scenario,
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': errors,
+            'wall_time_s': round(wall, 3),
+            'throughput_per_s': round(len(latencies) / wall, 1) if wall else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2)}
+
+
+def run_threads(fn, count, concurrency):
+    """Call fn(i) for i in range(count) on `concurrency` threads; return (latencies, errors, wall)."""
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def one(i):
+        began = time.perf_counter()
+        try:
+            fn(i)
+        except Exception:
+            with lock:
+                errors[0] += 1
+        with lock:
+            latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    return latencies, errors[0], time.perf_counter() - began
+
+
+class Context:
+    """Redis clients and warm HTTP/IAM clients shared by the scenarios."""
+
+    def __init__(self, redis_url=None):
+        self.redis_url = redis_url
+        if redis_url:
+            import redis
+            self.rd = redis.Redis.from_url(redis_url)
+        else:
+            import fakeredis
+            self.server = fakeredis.FakeServer()
+            self.rd = fakeredis.FakeRedis(server=self.server)
+
+    def async_redis(self):
+        if self.redis_url:
+            import redis.asyncio as aioredis
+            return aioredis.Redis.from_url(self.redis_url)
+        import fakeredis
+        return fakeredis.FakeAsyncRedis(server=self.server)
+
+
+# --- scenarios: each returns (fn(i), count) or raises Skip --- #
+
+def scenario_request_access(ctx, count):
+    import importlib.util
+    if importlib.util.find_spec('litellm') is None:  # imported lazily, so check up front
+        raise Skip("request_access dependencies missing: litellm")
+    from jit_tools import request_access
+
+    def fn(i):
+        args = Namespace(purpose=['bench'], ttl='1h', permission_set_name=['bench'],
+                         policy_description=['read', 's3', f"bucket-{i}"], region='us-east-1',
+                         aws_account_id='123456789012')
+        request_access.submit_request(ctx.rd, args, f"kubiya-jit-bench-{uuid.uuid4()}")
+    return fn
+
+
+def scenario_generate_policy(ctx, count):
+    """Policy generation routed between the fake OpenAI-compatible and Ollama backends, with hedging."""
+    from jit_tools import policy_gen
+    backends = policy_gen.build_backends([
+        {'name': 'openai', 'type': 'openai', 'model': 'gpt-4o', 'base_url': os.environ['GPT_ENDPOINT']},
+        {'name': 'ollama', 'type': 'ollama', 'model': 'llama3.1', 'base_url': os.environ['OLLAMA_URL']},
+        {'name': 'rules', 'type': 'rules'}])
+    router = policy_gen.Router(backends, ctx.rd)
+
+    def fn(i):
+        router.generate(f"read s3 objects in bucket-{i} - region: us-east-1 - account ID: 123456789012")
+    return fn
+
+
+def scenario_approve(ctx, count):
+    import requests
+    from jit_tools import approve, request_state, records
+    policy = json.dumps({'Version': '2012-10-17',
+                         'Statement': [{'Effect': 'Allow', 'Action': ['s3:GetObject'], 'Resource': '*'}]})
+    request_ids = []
+    pipe = ctx.rd.pipeline(transaction=False)
+    for _ in range(count):
+        request_id = f"kubiya-jit-bench-{uuid.uuid4()}"
+        request_ids.append(request_id)
+        records.store_request(pipe, request_id, {
+            'status': 'pending', 'ttl_min': 60, 'policy_name': request_id, 'permission_set_name': 'bench',
+            'llm_policy': policy, 'requested_at': datetime.utcnow().isoformat(),
+            'expires_at': datetime.utcnow().isoformat(), 'user_email': REQUESTER,
+            'slack_channel_id': 'CBENCH', 'slack_thread_ts': None, 'purpose': 'bench'})
+        request_state.create_state(pipe, request_id, user_email=REQUESTER)
+    pipe.execute()
+    iam_client, http = approve.create_iam_client(), requests.Session()
+
+    def fn(i):
+        approve.process_decision(ctx.rd, request_ids[i], 'approve', APPROVER, iam_client=iam_client, http=http)
+    return fn
+
+
+def scenario_webhook(ctx, count, concurrency):
+    """Drive the ASGI receiver in-process; returns (latencies, errors, wall)."""
+    from jira_tools import webhook_server, jira_event_gen
+    arc = ctx.async_redis()
+    webhook_server.get_redis = lambda: arc
+    start = int(time.time() * 1000)
+    bodies = [json.dumps(jira_event_gen.make_event(start + i)).encode() for i in range(count)]
+
+    async def one(i, semaphore, latencies, errors):
+        async with semaphore:
+            sent = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': bodies[i], 'more_body': False}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'path': webhook_server.JIRA_WEBHOOK_PATH, 'method': 'POST',
+                     'headers': [(b'content-type', b'application/json'),
+                                 (b'x-hub-signature', jira_event_gen.sign(bodies[i]).encode())]}
+            began = time.perf_counter()
+            try:
+                await webhook_server.app(scope, receive, send)
+                if sent[0]['status'] >= 300:
+                    errors.append(sent[0]['status'])
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - began)
+
+    async def run():
+        semaphore, latencies, errors = asyncio.Semaphore(concurrency), [], []
+        began = time.perf_counter()
+        await asyncio.gather(*(one(i, semaphore, latencies, errors) for i in range(count)))
+        return latencies, len(errors), time.perf_counter() - began
+
+    return asyncio.run(run())
+
+
+def scenario_get_committers(backend):
+    def build(ctx, count):
+        import gitusers
+
+        def fn(i):
+            gitusers.get_committers('https://github.com/acme', backend)
+        return fn
+    return build
+
+
+BUILDERS = {
+    'request_access': scenario_request_access,
+    'generate_policy': scenario_generate_policy,
+    'approve': scenario_approve,
+    'get_committers_rest': scenario_get_committers('rest'),
+    'get_committers_graphql': scenario_get_committers('graphql'),
+}
+
+
+def run_scenario(ctx, scenario, count, concurrency):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if scenario == 'webhook':
+            latencies, errors, wall = scenario_webhook(ctx, count, concurrency)
+        else:
+            fn = BUILDERS[scenario](ctx, count)
+            latencies, errors, wall = run_threads(fn, count, concurrency)
+        # Slack notifications are sent in the background; include draining them in the run
+        from shared import slack_notifier
+        for notifier in slack_notifier._notifiers.values():
+            notifier.flush(60)
+    return summarize(scenario, concurrency, latencies, errors, wall)
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions: p95 up or throughput down by more than `tolerance`."""
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if not before or 'skipped' in result or 'skipped' in before:
+            continue
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}@{result['concurrency']}: p95 "
+                               f"{before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if before['throughput_per_s'] and result['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}@{result['concurrency']}: throughput "
+                               f"{before['throughput_per_s']}/s -> {result['throughput_per_s']}/s")
+    return regressions
+
+
+def parse_mapping(value, cast=float):
+    """'slack=40,llm=800' -> {'slack': 40.0, 'llm': 800.0}"""
+    return {k.strip(): cast(v) for k, v in (item.split('=', 1) for item in value.split(',') if item)} if value else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JIT and BDR flows against local fakes.")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS), help="Comma separated scenarios.")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=200, help="Calls per scenario and concurrency level.")
+    parser.add_argument("--committer_runs", type=int, default=10, help="Calls for the get_committers scenarios.")
+    parser.add_argument("--latency", default="", help="Fake upstream latency in ms, e.g. llm=800,slack=40.")
+    parser.add_argument("--rate_429", default="", help="Fraction of throttled calls, e.g. slack=0.05.")
+    parser.add_argument("--retry_after", type=float, default=0, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--token_ms", type=float, default=0, help="Fake LLM generation time per token.")
+    parser.add_argument("--bad_policy_rate", type=float, default=0, help="Fraction of invalid generated policies.")
+    parser.add_argument("--redis_url", help="Use a real Redis instead of fakeredis.")
+    parser.add_argument("--output", help="Write results as JSON.")
+    parser.add_argument("--baseline", help="Compare against a previous --output file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    fakes = FakeServices(latency_ms=parse_mapping(args.latency), rate_429=parse_mapping(args.rate_429),
+                         retry_after=args.retry_after, token_ms=args.token_ms,
+                         bad_policy_rate=args.bad_policy_rate).start()
+    os.environ.update(fakes.environ())
+    os.environ.setdefault('KUBIYA_USER_EMAIL', REQUESTER)
+    # gitusers persists its identity index; keep it out of the working tree
+    index_dir = tempfile.TemporaryDirectory(prefix='bench_identity_')
+    os.environ.setdefault('IDENTITY_INDEX_PATH', os.path.join(index_dir.name, 'identity_index.json.gz'))
+    ctx = Context(args.redis_url)
+
+    results = []
+    for scenario in args.scenarios.split(','):
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            count = args.committer_runs if scenario.startswith('get_committers') else args.requests
+            try:
+                result = run_scenario(ctx, scenario, count, concurrency)
+            except Skip as e:
+                result = {'scenario': scenario, 'concurrency': concurrency, 'skipped': str(e)}
+            results.append(result)
+            if 'skipped' in result:
+                print(f"⏭️  {scenario:<24} c={concurrency:<4} skipped: {result['skipped']}")
+            else:
+                print(f"📝 {scenario:<24} c={concurrency:<4} p50={result['p50_ms']:>9}ms p95={result['p95_ms']:>9}ms "
+                      f"p99={result['p99_ms']:>9}ms {result['throughput_per_s']:>8}/s errors={result['errors']}")
+    fakes.stop()
+    index_dir.cleanup()
+
+    report = {'results': results, 'upstreams': fakes.stats,
+              'config': {'latency_ms': fakes.latency_ms, 'rate_429': fakes.rate_429, 'requests': args.requests}}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""Local stand-ins for every external service the JIT and BDR tools call.
+
+One threaded HTTP server answers for all of them under a path prefix each:
+
+    /slack/   Slack Web API (chat.postMessage, file uploads)
+    /kubiya/  Kubiya API (scheduled tasks, groups) and the JIT webhook
+    /github/  GitHub REST and GraphQL over a synthetic organization
+    /llm/     OpenAI compatible chat completions with canned policies
+    /ollama/  Ollama native /api/chat with the same canned policies
+    /iam/     AWS IAM query API, enough of it for boto3
+
+Every service has its own configurable latency and 429 injection rate, so the
+benchmarks can show how the tools behave under slow or throttling upstreams.
+
+    fakes = FakeServices(latency_ms={'llm': 800, 'slack': 40}, rate_429={'slack': 0.05})
+    fakes.start()
+    os.environ.update(fakes.environ())
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+SERVICES = ('slack', 'kubiya', 'github', 'llm', 'ollama', 'iam')
+IAM_NS = 'https://iam.amazonaws.com/doc/2010-05-08/'
+FAKE_ACCOUNT_ID = '123456789012'
+MAX_POLICY_VERSIONS = 5
+ATTACHMENT_KINDS = {'User': 'PolicyUsers', 'Role': 'PolicyRoles', 'Group': 'PolicyGroups'}
+
+# Canned least privilege policies, picked by the first service named in the prompt
+CANNED_POLICIES = {
+    's3': ['s3:GetObject', 's3:ListBucket'],
+    'ec2': ['ec2:DescribeInstances', 'ec2:DescribeTags'],
+    'dynamodb': ['dynamodb:GetItem', 'dynamodb:Query'],
+    'logs': ['logs:GetLogEvents', 'logs:FilterLogEvents'],
+    'iam': ['iam:GetRole', 'iam:PassRole'],
+}
+
+
+NUMBERED = re.compile(r'^(\d+)\. (.+)$', re.M)
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def canned_policy(prompt):
+    lowered = prompt.lower()
+    service = next((s for s in CANNED_POLICIES if s in lowered), 'ec2')
+    return {'Version': '2012-10-17',
+            'Statement': [{'Effect': 'Allow', 'Action': CANNED_POLICIES[service], 'Resource': '*'}]}
+
+
+class FakeGithubOrg:
+    """A deterministic synthetic organization: repos, commits, members and profiles."""
+
+    def __init__(self, org='acme', repos=5, commits_per_repo=300, people=120, members=0.6, seed=7):
+        rnd = random.Random(seed)
+        self.org = org
+        self.repos = [f"repo-{i}" for i in range(repos)]
+        self.people = []
+        for i in range(people):
+            login = f"dev{i}" if rnd.random() > 0.1 else None  # some authors have no linked account
+            self.people.append({'login': login, 'name': f"Dev {i} Person", 'email': f"dev{i}@example{i % 7}.com",
+                                'company': rnd.choice([None, 'Acme', 'Initech', 'Globex']),
+                                'member': rnd.random() < members})
+        now = datetime.now(timezone.utc)
+        self.commits = {}
+        for repo in self.repos:
+            self.commits[repo] = [
+                (rnd.choice(self.people), (now - timedelta(minutes=rnd.randint(1, 60 * 24 * 25))).strftime('%Y-%m-%dT%H:%M:%SZ'))
+                for _ in range(commits_per_repo)]
+        self.by_login = {p['login']: p for p in self.people if p['login']}
+
+
+class FakeServices:
+    """Start/stop the fake upstreams and collect per-service request counts."""
+
+    def __init__(self, latency_ms=None, rate_429=None, retry_after=0, jitter=0.2, github=None, seed=1,
+                 bad_policy_rate=0.0, token_ms=0.0):
+        self.latency_ms = {s: 0.0 for s in SERVICES}
+        self.latency_ms.update(latency_ms or {})
+        self.rate_429 = {s: 0.0 for s in SERVICES}
+        self.rate_429.update(rate_429 or {})
+        self.retry_after = retry_after
+        self.bad_policy_rate = bad_policy_rate  # fraction of generated policies that come back invalid
+        self.token_ms = token_ms  # delay per streamed LLM token, after the service latency (time to first token)
+        self.jitter = jitter
+        self.github = github or FakeGithubOrg()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {s: {'requests': 0, 'throttled': 0} for s in SERVICES}
+        self.policies = {}  # IAM policy name -> {'arn', 'default', 'versions': {id: (document, created)}, ...}
+        self.scheduled_tasks = []
+        self.webhooks = []
+        self.server = None
+        self.thread = None
+
+    # --- lifecycle --- #
+    def start(self, host='127.0.0.1', port=0):
+        fakes = self
+
+        class Handler(FakeHandler):
+            services = fakes
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-services', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, service):
+        return f"{self.base_url}/{service}/"
+
+    def add_policy(self, name, document='{}', created=None, tags=None):
+        """Create a managed policy directly, e.g. orphans for the reaper; None if the name is taken."""
+        with self.lock:
+            if name in self.policies:
+                return None
+            self.policies[name] = {
+                'name': name, 'id': 'ANPA' + hashlib.sha1(name.encode()).hexdigest()[:17].upper(),
+                'arn': f"arn:aws:iam::{FAKE_ACCOUNT_ID}:policy/{name}", 'default': 'v1', 'next': 2,
+                'created': created or _now(), 'versions': {'v1': (document, created or _now())},
+                'attached': {kind: set() for kind in ATTACHMENT_KINDS}, 'tags': dict(tags or {})}
+            return self.policies[name]
+
+    def environ(self):
+        """Environment pointing every tool at the fakes; apply before importing the tools."""
+        return {
+            'SLACK_API_URL': self.url('slack'),
+            'SLACK_API_TOKEN': 'xoxb-fake',
+            'KUBIYA_API_URL': self.url('kubiya'),
+            'KUBIYA_JIT_WEBHOOK': self.url('kubiya') + 'webhook',
+            'JIT_API_KEY': 'fake-key',
+            'GITHUB_URL': self.url('github'),
+            'GITHUB_GRAPHQL_URL': self.url('github') + 'graphql',
+            'GITHUB_TOKEN': 'ghp_fake',
+            'GPT_ENDPOINT': self.url('llm').rstrip('/'),
+            'GPT_API_KEY': 'sk-fake',
+            'OPENAI_API_KEY': 'sk-fake',
+            'OLLAMA_URL': self.url('ollama').rstrip('/'),
+            'IAM_ENDPOINT_URL': self.url('iam').rstrip('/'),
+            'AWS_ACCESS_KEY_ID': 'AKIAFAKE',
+            'AWS_SECRET_ACCESS_KEY': 'fake-secret',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'JIRA_WEBHOOK_SECRET': 'fake-webhook-secret',
+        }
+
+    # --- behaviour shared by all services --- #
+    def admit(self, service):
+        """Apply latency; return False when this request should be throttled."""
+        with self.lock:
+            self.stats[service]['requests'] += 1
+            throttled = self.random.random() < self.rate_429[service]
+            if throttled:
+                self.stats[service]['throttled'] += 1
+            spread = 1 + self.random.uniform(-self.jitter, self.jitter)
+        delay = self.latency_ms[service] / 1000 * spread
+        if delay > 0:
+            time.sleep(delay)
+        return not throttled
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    services = None
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in one segment; otherwise Nagle + delayed ACK add ~40ms per call
+    disable_nagle_algorithm = True
+    wbufsize = 1 << 16
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # clients close a connection after abandoning a streamed response
+
+    # --- plumbing --- #
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, events, content_type='text/event-stream'):
+        """Send `events` (bytes) as HTTP chunks, token_ms apart; stops when the client hangs up."""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+        try:
+            # straight to the socket: nothing is left buffered if the client hangs up
+            for event in events:
+                if self.services.token_ms:
+                    time.sleep(self.services.token_ms / 1000)
+                self.connection.sendall(b'%x\r\n%s\r\n' % (len(event), event))
+            self.connection.sendall(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            with self.services.lock:
+                self.services.stats[self.service]['aborted'] = self.services.stats[self.service].get('aborted', 0) + 1
+            self.close_connection = True
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/', 1)
+        service, rest = parts[0], (parts[1] if len(parts) > 1 else '')
+        self.service = service
+        body = self._body()
+        if service not in SERVICES:
+            return self._send(404, {'error': 'unknown service'})
+        if not self.services.admit(service):
+            if service == 'iam':
+                return self._iam_error(400, 'Throttling', 'Rate exceeded')
+            return self._send(429, {'ok': False, 'error': 'ratelimited'},
+                              headers={'Retry-After': str(self.services.retry_after)})
+        handler = getattr(self, f"{service}_{method.lower()}", None)
+        if handler is None:
+            return self._send(405, {'error': 'method not allowed'})
+        handler(rest, parse_qs(url.query), body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('POST')
+
+    # --- Slack --- #
+    def slack_post(self, method, query, body):
+        if method == 'files.getUploadURLExternal':
+            file_id = 'F' + hashlib.sha1(body).hexdigest()[:10].upper()
+            return self._send(200, {'ok': True, 'file_id': file_id,
+                                    'upload_url': f"{self.services.url('slack')}upload/{file_id}"})
+        if method.startswith('upload/'):
+            return self._send(200, 'OK - uploaded', content_type='text/plain')
+        if method == 'files.completeUploadExternal':
+            return self._send(200, {'ok': True, 'files': [{'id': 'F0'}]})
+        if method == 'chat.postMessage':
+            return self._send(200, {'ok': True, 'ts': f"{time.time():.6f}"})
+        return self._send(200, {'ok': True})
+
+    # --- Kubiya --- #
+    def kubiya_post(self, path, query, body):
+        payload = json.loads(body or b'{}')
+        with self.services.lock:
+            if path.startswith('scheduled_tasks'):
+                self.services.scheduled_tasks.append(payload)
+            else:
+                self.services.webhooks.append(payload)
+        self._send(200, {'ok': True, 'id': hashlib.sha1(body).hexdigest()[:12]})
+
+    def kubiya_get(self, path, query, body):
+        if path.startswith('manage/groups/'):
+            return self._send(200, ['adsaunde1@gmail.com', 'approver@example.com'])
+        self._send(404, {'error': 'not found'})
+
+    # --- LLM --- #
+    def _policy(self, prompt):
+        with self.services.lock:
+            bad = self.services.random.random() < self.services.bad_policy_rate
+        policy = canned_policy(prompt)
+        if bad:  # a full-length policy that goes wrong early, as models do
+            policy['Statement'][0]['Effect'] = 'Permit'
+        return policy
+
+    def _completion(self, prompt):
+        """A canned policy, or one per numbered description for packed bulk prompts."""
+        numbered = NUMBERED.findall(prompt)
+        if numbered:
+            return json.dumps({n: self._policy(description) for n, description in numbered}, indent=2)
+        return json.dumps(self._policy(prompt), indent=2)
+
+    @staticmethod
+    def _tokens(content):
+        return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+    def _generate(self, content):
+        """A whole completion takes as long to generate as a streamed one."""
+        if self.services.token_ms:
+            time.sleep(self.services.token_ms * len(self._tokens(content)) / 1000)
+
+    def llm_post(self, path, query, body):
+        request = json.loads(body or b'{}')
+        prompt = '\n'.join(str(m.get('content', '')) for m in request.get('messages', []))
+        content = "Here is the policy:\n```json\n" + self._completion(prompt) + "\n```\nLet me know if you need changes."
+        if request.get('stream'):
+            def events():
+                for token in self._tokens(content):
+                    yield b'data: ' + json.dumps({'object': 'chat.completion.chunk', 'choices': [
+                        {'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}).encode() + b'\n\n'
+                yield b'data: ' + json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': {
+                    'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                    'total_tokens': (len(prompt) + len(content)) // 4}}).encode() + b'\n\n'
+                yield b'data: [DONE]\n\n'
+            return self._stream(events())
+        self._generate(content)
+        self._send(200, {
+            'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': request.get('model', 'gpt-4o'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(prompt) + len(content)) // 4},
+        })
+
+    def ollama_post(self, path, query, body):
+        if path != 'api/chat':
+            return self._send(404, {'error': 'not found'})
+        request = json.loads(body or b'{}')
+        prompt = '\n'.join(str(m.get('content', '')) for m in request.get('messages', []))
+        content = self._completion(prompt)
+        if request.get('stream', True):  # Ollama streams unless asked not to
+            def events():
+                for token in self._tokens(content):
+                    yield json.dumps({'model': request.get('model', 'llama3.1'), 'done': False,
+                                      'message': {'role': 'assistant', 'content': token}}).encode() + b'\n'
+                yield json.dumps({'model': request.get('model', 'llama3.1'), 'done': True, 'done_reason': 'stop',
+                                  'message': {'role': 'assistant', 'content': ''},
+                                  'prompt_eval_count': len(prompt) // 4, 'eval_count': len(content) // 4}).encode() + b'\n'
+            return self._stream(events(), 'application/x-ndjson')
+        self._generate(content)
+        self._send(200, {
+            'model': request.get('model', 'llama3.1'), 'created_at': datetime.now(timezone.utc).isoformat(),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True, 'done_reason': 'stop',
+            'prompt_eval_count': len(prompt) // 4, 'eval_count': len(content) // 4,
+        })
+
+    # --- GitHub --- #
+    def _page(self, items, query, path):
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        chunk = items[(page - 1) * per_page:page * per_page]
+        headers = {}
+        if page * per_page < len(items):
+            headers['Link'] = (f'<{self.services.url("github")}{path}?per_page={per_page}&page={page + 1}>; '
+                               f'rel="next"')
+        return chunk, headers
+
+    def github_get(self, path, query, body):
+        org = self.services.github
+        match = re.fullmatch(r'orgs/([^/]+)/repos', path)
+        if match:
+            chunk, headers = self._page([{'name': r} for r in org.repos], query, path)
+            return self._send(200, chunk, headers=headers)
+        match = re.fullmatch(r'repos/([^/]+)/([^/]+)/commits', path)
+        if match:
+            commits = [{'sha': hashlib.sha1(f"{match[2]}{i}".encode()).hexdigest(),
+                        'commit': {'author': {'name': person['name'], 'email': person['email'], 'date': date}},
+                        'author': {'login': person['login']} if person['login'] else None}
+                       for i, (person, date) in enumerate(org.commits.get(match[2], []))]
+            chunk, headers = self._page(commits, query, path)
+            return self._send(200, chunk, headers=headers)
+        match = re.fullmatch(r'orgs/([^/]+)/members/([^/]+)', path)
+        if match:
+            person = org.by_login.get(match[2])
+            return self._send(204 if person and person['member'] else 404)
+        match = re.fullmatch(r'users/([^/]+)', path)
+        if match and match[1] in org.by_login:
+            person = org.by_login[match[1]]
+            return self._send(200, {'login': person['login'], 'name': person['name'],
+                                    'email': person['email'], 'company': person['company']})
+        self._send(404, {'message': 'Not Found'})
+
+    def github_post(self, path, query, body):
+        if path != 'graphql':
+            return self._send(404, {'message': 'Not Found'})
+        org = self.services.github
+        request = json.loads(body or b'{}')
+        text, variables = request.get('query', ''), request.get('variables') or {}
+        if 'history(' in text:
+            first, after = variables.get('first', 100), int(variables.get('after') or 0)
+            commits = org.commits.get(variables.get('repo'), [])
+            nodes = [{'committedDate': date,
+                      'author': {'name': p['name'], 'email': p['email'],
+                                 'user': {'login': p['login']} if p['login'] else None}}
+                     for p, date in commits[after:after + first]]
+            more = after + first < len(commits)
+            history = {'pageInfo': {'hasNextPage': more, 'endCursor': str(after + first)}, 'nodes': nodes}
+            return self._send(200, {'data': {'repository': {'defaultBranchRef': {'target': {'history': history}}}}})
+        if 'repositories(' in text:
+            nodes = [{'name': r} for r in org.repos]
+            return self._send(200, {'data': {'organization': {'repositories': {
+                'pageInfo': {'hasNextPage': False, 'endCursor': None}, 'nodes': nodes}}}})
+        data = {}
+        for alias, login in re.findall(r'(u\d+): user\(login: "([^"]+)"\)', text):
+            person = org.by_login.get(login)
+            data[alias] = person and {'login': login, 'name': person['name'], 'email': person['email'],
+                                      'company': person['company'],
+                                      'organization': {'login': org.org} if person['member'] else None}
+        self._send(200, {'data': data})
+
+    # --- IAM --- #
+    def _iam(self, action, result=''):
+        request_id = hashlib.sha1(f"{time.time()}".encode()).hexdigest()[:16]
+        result_block = f"<{action}Result>{result}</{action}Result>" if result is not None else ''
+        xml = (f'<{action}Response xmlns="{IAM_NS}">{result_block}'
+               f'<ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata></{action}Response>')
+        self._send(200, xml, content_type='text/xml')
+
+    def _iam_error(self, status, code, message):
+        xml = (f'<ErrorResponse xmlns="{IAM_NS}"><Error><Type>Sender</Type><Code>{code}</Code>'
+               f'<Message>{message}</Message></Error><RequestId>fake</RequestId></ErrorResponse>')
+        self._send(status, xml, content_type='text/xml')
+
+    def _policy_xml(self, policy, tag='Policy'):
+        attachments = sum(map(len, policy['attached'].values()))
+        tags = ''.join(f"<member><Key>{k}</Key><Value>{v}</Value></member>" for k, v in policy['tags'].items())
+        return (f"<{tag}><PolicyName>{policy['name']}</PolicyName><PolicyId>{policy['id']}</PolicyId>"
+                f"<Arn>{policy['arn']}</Arn><Path>/</Path><DefaultVersionId>{policy['default']}</DefaultVersionId>"
+                f"<AttachmentCount>{attachments}</AttachmentCount><IsAttachable>true</IsAttachable>"
+                f"<CreateDate>{policy['created']}</CreateDate><UpdateDate>{policy['created']}</UpdateDate>"
+                f"{f'<Tags>{tags}</Tags>' if tags else ''}</{tag}>")
+
+    def _version_xml(self, policy, version, tag='PolicyVersion', document=True):
+        text, created = policy['versions'][version]
+        body = f"<Document>{quote(text)}</Document>" if document else ''
+        return (f"<{tag}>{body}<VersionId>{version}</VersionId>"
+                f"<IsDefaultVersion>{str(version == policy['default']).lower()}</IsDefaultVersion>"
+                f"<CreateDate>{created}</CreateDate></{tag}>")
+
+    def iam_post(self, path, query, body):
+        params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        action = params.get('Action')
+        policies = self.services.policies
+        if action == 'SimulateCustomPolicy':
+            try:
+                json.loads(params.get('PolicyInputList.member.1', ''))
+            except ValueError:
+                return self._iam_error(400, 'MalformedPolicyDocument', 'The policy is not valid JSON')
+            return self._iam(action, '<EvaluationResults></EvaluationResults><IsTruncated>false</IsTruncated>')
+        if action == 'CreatePolicy':
+            tags = {params[f"Tags.member.{i}.Key"]: params.get(f"Tags.member.{i}.Value", '')
+                    for i in range(1, 51) if f"Tags.member.{i}.Key" in params}
+            policy = self.services.add_policy(params['PolicyName'], params.get('PolicyDocument', ''), tags=tags)
+            if policy is None:
+                return self._iam_error(409, 'EntityAlreadyExists',
+                                       f"A policy called {params['PolicyName']} already exists.")
+            return self._iam(action, self._policy_xml(policy))
+        if action == 'GetUser':
+            return self._iam(action, f"<User><UserName>jit</UserName><UserId>AIDAFAKE</UserId><Path>/</Path>"
+                                     f"<Arn>arn:aws:iam::{FAKE_ACCOUNT_ID}:user/jit</Arn>"
+                                     f"<CreateDate>{_now()}</CreateDate></User>")
+        if action == 'ListPolicies':
+            # customer managed policies only, paged by name like IAM's opaque markers
+            size = int(params.get('MaxItems', 100))
+            with self.services.lock:
+                names = sorted(n for n in policies if n > params.get('Marker', ''))
+                page = [self._policy_xml(policies[n], tag='member') for n in names[:size]]
+            truncated = len(names) > size
+            marker = f"<Marker>{names[size - 1]}</Marker>" if truncated else ''
+            return self._iam(action, f"<Policies>{''.join(page)}</Policies>"
+                                     f"<IsTruncated>{str(truncated).lower()}</IsTruncated>{marker}")
+        policy = policies.get(params.get('PolicyArn', '').rsplit('/', 1)[-1])
+        if policy is None:
+            return self._iam_error(404, 'NoSuchEntity', f"Policy {params.get('PolicyArn')} does not exist.")
+        if action == 'GetPolicy':
+            return self._iam(action, self._policy_xml(policy))
+        if action == 'CreatePolicyVersion':
+            with self.services.lock:
+                if len(policy['versions']) >= MAX_POLICY_VERSIONS:
+                    return self._iam_error(409, 'LimitExceeded',
+                                           f"A managed policy can have up to {MAX_POLICY_VERSIONS} versions.")
+                version = f"v{policy['next']}"
+                policy['next'] += 1
+                policy['versions'][version] = (params.get('PolicyDocument', ''), _now())
+                if params.get('SetAsDefault') == 'true':
+                    policy['default'] = version
+            return self._iam(action, self._version_xml(policy, version))
+        if action == 'SetDefaultPolicyVersion':
+            with self.services.lock:
+                if params['VersionId'] not in policy['versions']:
+                    return self._iam_error(404, 'NoSuchEntity', f"Version {params['VersionId']} does not exist.")
+                policy['default'] = params['VersionId']
+            return self._iam(action, None)
+        if action == 'ListPolicyVersions':
+            with self.services.lock:
+                newest_first = sorted(policy['versions'], key=lambda v: int(v[1:]), reverse=True)
+                members = ''.join(self._version_xml(policy, v, tag='member', document=False) for v in newest_first)
+            return self._iam(action, f"<Versions>{members}</Versions><IsTruncated>false</IsTruncated>")
+        if action == 'DeletePolicyVersion':
+            with self.services.lock:
+                if params['VersionId'] == policy['default']:
+                    return self._iam_error(409, 'DeleteConflict', "Cannot delete the default version of a policy.")
+                if policy['versions'].pop(params['VersionId'], None) is None:
+                    return self._iam_error(404, 'NoSuchEntity', f"Version {params['VersionId']} does not exist.")
+            return self._iam(action, None)
+        if action == 'ListEntitiesForPolicy':
+            with self.services.lock:
+                entities = ''.join(f"<{tag}>" + ''.join(f"<member><{kind}Name>{name}</{kind}Name></member>"
+                                                        for name in sorted(policy['attached'][kind])) + f"</{tag}>"
+                                   for kind, tag in ATTACHMENT_KINDS.items())
+            return self._iam(action, f"{entities}<IsTruncated>false</IsTruncated>")
+        attach = re.fullmatch(r'(Attach|Detach)(User|Role|Group)Policy', action or '')
+        if attach:
+            verb, kind = attach.groups()
+            with self.services.lock:
+                (policy['attached'][kind].add if verb == 'Attach' else policy['attached'][kind].discard)(
+                    params[f"{kind}Name"])
+            return self._iam(action, None)
+        if action == 'DeletePolicy':
+            with self.services.lock:
+                if len(policy['versions']) > 1 or any(policy['attached'].values()):
+                    return self._iam_error(409, 'DeleteConflict',
+                                           "Cannot delete a policy attached to entities or with non-default versions.")
+                policies.pop(policy['name'], None)
+            return self._iam(action, None)
+        self._iam_error(400, 'InvalidAction', f"Unsupported action {action}")
@@ -0,0 +1,127 @@
+"""Startup-time budget check for the tool entry points.
+
+Every tool invocation starts a fresh interpreter, so import time is paid per
+call. Each entry point is imported under `python -X importtime` in a clean
+subprocess; the median total over --runs is checked against its budget, and the
+heavy modules it must not import at startup (boto3 for a deny, litellm before a
+cache miss) are checked as well. Exits 1 on any violation.
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --output startup.json
+    python benchmarks/importtime.py --baseline startup.json
+    python benchmarks/importtime.py --entry_points jit_tools.approve --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry point -> (budget in ms, modules that must stay lazy)
+ENTRY_POINTS = {
+    'jit_tools.request_access': (400, ('litellm', 'boto3', 'requests')),
+    'jit_tools.approve': (450, ('boto3', 'pytimeparse', 'litellm')),
+    'jit_tools.approval_worker': (450, ('boto3', 'pytimeparse', 'litellm')),
+    'jit_tools.audit': (300, ('boto3', 'litellm')),
+    'jit_tools.metrics': (300, ('boto3', 'litellm')),
+    'jira_tools.jit_webhook': (450, ('boto3', 'pytimeparse', 'litellm')),
+    'jira_tools.webhook_server': (400, ('boto3', 'litellm')),
+}
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us, depth)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def measure(entry_point):
+    """Import `entry_point` in a fresh interpreter; returns the parsed importtime table."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {entry_point}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
+
+
+def check(entry_point, budget_ms, forbidden, runs, top):
+    totals, modules = [], {}
+    for _ in range(runs):
+        modules = measure(entry_point)
+        totals.append(sum(c for _, c, depth in modules.values() if depth == 0) / 1000)
+    heaviest = sorted(((c, name) for name, (_, c, depth) in modules.items() if depth <= 1), reverse=True)[:top]
+    loaded = [name for name in forbidden if name in modules]
+    return {'entry_point': entry_point,
+            'median_ms': round(statistics.median(totals), 1),
+            'min_ms': round(min(totals), 1),
+            'budget_ms': budget_ms,
+            'modules': len(modules),
+            'eager_heavy_imports': loaded,
+            'heaviest': [{'module': name, 'cumulative_ms': round(c / 1000, 1)} for c, name in heaviest]}
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions: best-of-runs startup up by more than `tolerance` (min is the least noisy)."""
+    previous = {r['entry_point']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['entry_point'])
+        if before and result['min_ms'] > before['min_ms'] * (1 + tolerance):
+            regressions.append(f"{result['entry_point']}: {before['min_ms']}ms -> {result['min_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check tool startup time against per entry point budgets.")
+    parser.add_argument("--entry_points", default=','.join(ENTRY_POINTS), help="Comma separated modules.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point.")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest imports to report.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply all budgets, e.g. for slow CI hosts.")
+    parser.add_argument("--output", help="Write results as JSON.")
+    parser.add_argument("--baseline", help="Compare against a previous --output file.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression; startup is noisy.")
+    args = parser.parse_args()
+
+    results, violations = [], []
+    for entry_point in args.entry_points.split(','):
+        budget_ms, forbidden = ENTRY_POINTS.get(entry_point, (None, ()))
+        budget_ms = budget_ms * args.scale if budget_ms else None
+        try:
+            result = check(entry_point, budget_ms, forbidden, args.runs, args.top)
+        except RuntimeError as e:
+            print(f"⏭️  {entry_point:<28} skipped: {e}")
+            continue
+        results.append(result)
+        heaviest = ', '.join(f"{h['module']}={h['cumulative_ms']}ms" for h in result['heaviest'])
+        print(f"📝 {entry_point:<28} {result['median_ms']:>8}ms (budget {budget_ms or '-'}ms) {heaviest}")
+        if budget_ms and result['median_ms'] > budget_ms:
+            violations.append(f"{entry_point}: {result['median_ms']}ms over the {budget_ms}ms budget")
+        if result['eager_heavy_imports']:
+            violations.append(f"{entry_point}: imports {', '.join(result['eager_heavy_imports'])} at startup")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            violations += [f"Regression {r}" for r in compare(results, json.load(f), args.tolerance)]
+    for violation in violations:
+        print(f"❌ {violation}")
+    if violations:
+        sys.exit(1)
+    print("✅ All entry points within their startup budgets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""Load driver for the whole JIT flow: arrivals, approver think-time, decisions.
+
+Synthetic traffic is an open arrival process (gamma inter-arrival times, so
+--burstiness 1 is Poisson and larger values are burstier) plus optional bursts
+such as everyone requesting access right after an outage. Every request is
+decided by one of --approvers humans after a log-normal think-time, then
+provisioned by one of --workers approval workers. Think-time is multiplied by
+--time_scale, so hours of approver behaviour can be replayed in seconds.
+
+Targets:
+    local    fakes.py upstreams, fakeredis, tools called in-process
+    staging  the Redis/endpoints configured in the environment; requests are posted
+             to the Jira receiver at --webhook_url and decisions queued for the workers
+
+    python benchmarks/loadgen.py --rate 5 --duration 60 --burst 500@10/30 --time_scale 0.01
+    python benchmarks/loadgen.py --record schedule.jsonl --rate 2 --duration 600
+    python benchmarks/loadgen.py --replay schedule.jsonl
+    python benchmarks/loadgen.py --replay_audit audit_events.jsonl   # output of `audit.py query`
+    python benchmarks/loadgen.py --target staging --webhook_url https://jit-staging/webhook/jira
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bdr_tools', 'tools')]
+
+from benchmarks.fakes import FakeServices  # noqa: E402
+from benchmarks.bench_e2e import percentile  # noqa: E402
+
+APPROVER = 'adsaunde1@gmail.com'
+
+
+# --- traffic --- #
+
+def synthetic_schedule(rate, duration, burstiness=1.0, bursts=(), think_median=300.0, think_sigma=1.0,
+                       deny_ratio=0.1, seed=1):
+    """Build a list of arrivals: {'at', 'n', 'think_s', 'action'} sorted by 'at' (seconds).
+
+    Args:
+        rate (float): mean background arrivals per second
+        duration (float): length of the background traffic in seconds
+        burstiness (float): squared coefficient of variation of inter-arrival times (1 = Poisson)
+        bursts (list): (count, start_s, spread_s) extra arrivals, e.g. an outage
+        think_median (float): median approver think-time in seconds
+        think_sigma (float): log-normal sigma of the think-time
+        deny_ratio (float): fraction of requests that are denied
+    """
+    rnd = random.Random(seed)
+    times, at = [], 0.0
+    if rate > 0:
+        shape = 1.0 / max(burstiness, 1e-6)
+        while True:
+            at += rnd.gammavariate(shape, 1.0 / (rate * shape))
+            if at >= duration:
+                break
+            times.append(at)
+    for count, start, spread in bursts:
+        times.extend(start + rnd.uniform(0, spread) for _ in range(count))
+    arrivals = []
+    for n, at in enumerate(sorted(times)):
+        arrivals.append({'at': round(at, 4), 'n': n,
+                         'think_s': round(rnd.lognormvariate(math.log(think_median), think_sigma), 3),
+                         'action': 'deny' if rnd.random() < deny_ratio else 'approve'})
+    return arrivals
+
+
+def load_schedule(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def audit_schedule(path):
+    """Turn audit events (audit.py query output) into arrivals with the recorded think-times."""
+    created, decided = {}, {}
+    for event in load_schedule(path):
+        if event.get('stage') == 'created':
+            created[event['request_id']] = event['ts'] / 1000
+        elif event.get('stage') in ('approved', 'denied'):
+            decided[event['request_id']] = (event['ts'] / 1000, 'approve' if event['stage'] == 'approved' else 'deny')
+    if not created:
+        return []
+    start = min(created.values())
+    arrivals = []
+    for n, (request_id, at) in enumerate(sorted(created.items(), key=lambda item: item[1])):
+        decided_at, action = decided.get(request_id, (None, None))
+        arrivals.append({'at': round(at - start, 4), 'n': n, 'action': action,
+                         'think_s': round(decided_at - at, 3) if decided_at else None})
+    return arrivals
+
+
+# --- targets --- #
+
+class LocalTarget:
+    """In-process tools against fakes.py and fakeredis."""
+
+    def __init__(self, fakes):
+        import fakeredis
+        os.environ.update(fakes.environ())
+        from jit_tools import approve
+        from jira_tools import jit_webhook, webhook_server, jira_event_gen
+        import requests
+        self.rd = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        self.approve, self.jit_webhook = approve, jit_webhook
+        self.webhook_server, self.jira_event_gen = webhook_server, jira_event_gen
+        self.iam_client, self.http = approve.create_iam_client(), requests.Session()
+
+    def submit(self, n):
+        request_id, request = self.webhook_server.parse_jira_event(self.jira_event_gen.make_event(n))
+        self.jit_webhook.retrieve_approval_request(self.rd, request, request_id)
+        return request_id
+
+    def decide(self, request_id, action):
+        """Process the decision; returns True once the request has usable access."""
+        result = self.approve.process_decision(self.rd, request_id, action, APPROVER,
+                                               iam_client=self.iam_client, http=self.http)
+        return bool(result['policy_arn'])
+
+    def queue_depth(self):
+        return 0  # decisions are processed by the local worker pool, measured by the driver
+
+
+class StagingTarget:
+    """A deployed receiver plus approval workers, sharing the Redis in the environment."""
+
+    def __init__(self, webhook_url, access_timeout):
+        import requests
+        from jit_tools import approval_worker, request_state
+        from jira_tools import jira_event_gen
+        self.webhook_url, self.access_timeout = webhook_url, access_timeout
+        self.approval_worker, self.request_state, self.jira_event_gen = approval_worker, request_state, jira_event_gen
+        self.rd = approval_worker.create_redis_client()
+        self.http = requests.Session()
+        self.run_id = int(time.time())
+
+    def submit(self, n):
+        event = self.jira_event_gen.make_event(self.run_id * 100000 + n)
+        response = self.http.post(self.webhook_url, json=event, timeout=30)
+        response.raise_for_status()
+        return response.json()['request_id']
+
+    def decide(self, request_id, action):
+        self.approval_worker.enqueue_decision(self.rd, request_id, action, APPROVER)
+        if action != 'approve':
+            return False
+        deadline = time.monotonic() + self.access_timeout
+        while time.monotonic() < deadline:
+            status = self.request_state.get_state(self.rd, request_id)['status']
+            if status == self.request_state.PROVISIONED:
+                return True
+            if status not in (self.request_state.PENDING, self.request_state.APPROVED):
+                return False
+            time.sleep(0.25)
+        raise TimeoutError(f"{request_id} not provisioned within {self.access_timeout}s")
+
+    def queue_depth(self):
+        return self.rd.xlen(self.approval_worker.APPROVALS_STREAM)
+
+
+# --- driver --- #
+
+class Driver:
+    """Replays arrivals against a target and records what happens."""
+
+    def __init__(self, target, approvers, workers, time_scale, sample_interval=0.5):
+        self.target = target
+        self.time_scale = time_scale
+        self.sample_interval = sample_interval
+        self.submitters = ThreadPoolExecutor(max_workers=64, thread_name_prefix='submit')
+        self.approvers = ThreadPoolExecutor(max_workers=approvers, thread_name_prefix='approver')
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self.lock = threading.Lock()
+        self.errors = {'submit': 0, 'decide': 0}
+        self.counts = {'arrivals': 0, 'submitted': 0, 'approved': 0, 'denied': 0, 'undecided': 0, 'provisioned': 0}
+        self.submit_latency, self.decide_latency, self.time_to_access, self.samples = [], [], [], []
+        self.outstanding = 0
+        self.done = threading.Event()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def _finish(self):
+        with self.lock:
+            self.outstanding -= 1
+
+    def _arrive(self, arrival, arrived):
+        began = time.perf_counter()
+        try:
+            request_id = self.target.submit(arrival['n'])
+        except (Exception, SystemExit):  # the tools sys.exit() on failure
+            with self.lock:
+                self.errors['submit'] += 1
+            return self._finish()
+        with self.lock:
+            self.submit_latency.append(time.perf_counter() - began)
+        self._count('submitted')
+        if not arrival.get('action'):
+            self._count('undecided')
+            return self._finish()
+        self.approvers.submit(self._think, arrival, request_id, arrived)
+
+    def _think(self, arrival, request_id, arrived):
+        # an approver is busy for the whole think-time; arrivals queue behind busy approvers
+        time.sleep(max(arrival.get('think_s') or 0, 0) * self.time_scale)
+        self.workers.submit(self._decide, arrival, request_id, arrived)
+
+    def _decide(self, arrival, request_id, arrived):
+        began = time.perf_counter()
+        try:
+            provisioned = self.target.decide(request_id, arrival['action'])
+        except (Exception, SystemExit):  # the tools sys.exit() on failure
+            with self.lock:
+                self.errors['decide'] += 1
+            return self._finish()
+        now = time.perf_counter()
+        with self.lock:
+            self.decide_latency.append(now - began)
+            self.counts['approved' if arrival['action'] == 'approve' else 'denied'] += 1
+            if provisioned:
+                self.counts['provisioned'] += 1
+                self.time_to_access.append(now - arrived)
+        self._finish()
+
+    def _sample(self, started):
+        while not self.done.wait(self.sample_interval):
+            self.samples.append({
+                't': round(time.perf_counter() - started, 2),
+                'outstanding': self.outstanding,
+                'approver_backlog': self.approvers._work_queue.qsize(),
+                'worker_backlog': self.workers._work_queue.qsize(),
+                'queue_depth': self.target.queue_depth(),
+            })
+
+    def run(self, schedule):
+        started = time.perf_counter()
+        sampler = threading.Thread(target=self._sample, args=(started,), daemon=True)
+        sampler.start()
+        for arrival in schedule:
+            delay = started + arrival['at'] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self.lock:
+                self.outstanding += 1
+                self.counts['arrivals'] += 1
+            self.submitters.submit(self._arrive, arrival, time.perf_counter())
+        while self.outstanding:
+            time.sleep(0.05)
+        wall = time.perf_counter() - started
+        self.done.set()
+        sampler.join()
+        for pool in (self.submitters, self.approvers, self.workers):
+            pool.shutdown()
+        return self.report(wall)
+
+    def report(self, wall):
+        def stats(values):
+            return {'count': len(values),
+                    'p50_s': round(percentile(values, 50), 3),
+                    'p95_s': round(percentile(values, 95), 3),
+                    'p99_s': round(percentile(values, 99), 3),
+                    'max_s': round(max(values), 3) if values else 0.0}
+        total = max(self.counts['arrivals'], 1)
+        return {'wall_time_s': round(wall, 2),
+                'counts': self.counts,
+                'errors': self.errors,
+                'error_rate': round(sum(self.errors.values()) / total, 4),
+                'throughput_per_s': round(self.counts['submitted'] / wall, 2) if wall else None,
+                'submit_latency': stats(self.submit_latency),
+                'decision_latency': stats(self.decide_latency),
+                'time_to_access': stats(self.time_to_access),
+                'max_approver_backlog': max((s['approver_backlog'] for s in self.samples), default=0),
+                'max_worker_backlog': max((s['worker_backlog'] for s in self.samples), default=0),
+                'max_queue_depth': max((s['queue_depth'] for s in self.samples), default=0),
+                'samples': self.samples}
+
+
+def parse_burst(value):
+    """'500@10/30' -> (500 requests, starting at 10s, spread over 30s)"""
+    count, rest = value.split('@')
+    start, _, spread = rest.partition('/')
+    return int(count), float(start), float(spread or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive synthetic or recorded JIT traffic through the tools.")
+    parser.add_argument("--target", choices=['local', 'staging'], default='local')
+    parser.add_argument("--webhook_url", help="Jira receiver url (staging).")
+    parser.add_argument("--rate", type=float, default=2.0, help="Mean background arrivals per second.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Background traffic length in seconds.")
+    parser.add_argument("--burstiness", type=float, default=1.0, help="Inter-arrival CV^2; 1 is Poisson.")
+    parser.add_argument("--burst", action='append', default=[], help="COUNT@START/SPREAD extra arrivals.")
+    parser.add_argument("--think_median", type=float, default=300.0, help="Median approver think-time, seconds.")
+    parser.add_argument("--think_sigma", type=float, default=1.0, help="Log-normal sigma of the think-time.")
+    parser.add_argument("--deny_ratio", type=float, default=0.1)
+    parser.add_argument("--time_scale", type=float, default=0.01, help="Multiplier applied to think-times.")
+    parser.add_argument("--approvers", type=int, default=3, help="Humans deciding in parallel.")
+    parser.add_argument("--workers", type=int, default=4, help="Approval workers (local target).")
+    parser.add_argument("--latency", default="iam=80,kubiya=60,slack=40", help="Fake upstream latency (local).")
+    parser.add_argument("--rate_429", default="", help="Fake upstream 429 rates (local).")
+    parser.add_argument("--access_timeout", type=float, default=300.0, help="Seconds to wait for provisioning.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record", help="Write the generated schedule as JSON lines and exit.")
+    parser.add_argument("--replay", help="Replay a schedule written with --record.")
+    parser.add_argument("--replay_audit", help="Replay audit events from `audit.py query`.")
+    parser.add_argument("--output", help="Write the report as JSON.")
+    args = parser.parse_args()
+
+    if args.replay:
+        schedule = load_schedule(args.replay)
+    elif args.replay_audit:
+        schedule = audit_schedule(args.replay_audit)
+    else:
+        schedule = synthetic_schedule(args.rate, args.duration, args.burstiness,
+                                      [parse_burst(b) for b in args.burst], args.think_median,
+                                      args.think_sigma, args.deny_ratio, args.seed)
+    if args.record:
+        with open(args.record, 'w') as f:
+            for arrival in schedule:
+                f.write(json.dumps(arrival) + '\n')
+        print(f"✅ Wrote {len(schedule)} arrivals to {args.record}")
+        return
+
+    fakes = None
+    if args.target == 'local':
+        from benchmarks.bench_e2e import parse_mapping
+        fakes = FakeServices(latency_ms=parse_mapping(args.latency), rate_429=parse_mapping(args.rate_429)).start()
+        target = LocalTarget(fakes)
+    else:
+        if not args.webhook_url:
+            parser.error("--webhook_url is required for the staging target")
+        target = StagingTarget(args.webhook_url, args.access_timeout)
+
+    print(f"📝 Replaying {len(schedule)} arrivals against {args.target}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = Driver(target, args.approvers, args.workers, args.time_scale).run(schedule)
+        from shared import slack_notifier
+        for notifier in slack_notifier._notifiers.values():
+            notifier.flush(60)
+    if fakes:
+        report['upstreams'] = fakes.stats
+        fakes.stop()
+
+    summary = {k: v for k, v in report.items() if k != 'samples'}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Synthetic Jira issue-created events for load testing webhook_server.
+
+    python jira_event_gen.py --url http://localhost:8080/webhook/jira --count 5000 --concurrency 32
+    python jira_event_gen.py --dump --count 3 > events.jsonl
+"""
+import os
+import json
+import time
+import hmac
+import random
+import hashlib
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+JIRA_WEBHOOK_SECRET = os.getenv('JIRA_WEBHOOK_SECRET')
+
+SERVICES = {
+    's3': ['s3:GetObject', 's3:ListBucket', 's3:PutObject'],
+    'ec2': ['ec2:DescribeInstances', 'ec2:StartInstances', 'ec2:StopInstances'],
+    'dynamodb': ['dynamodb:GetItem', 'dynamodb:Query', 'dynamodb:PutItem'],
+    'logs': ['logs:GetLogEvents', 'logs:FilterLogEvents'],
+}
+TTLS = ['30m', '1h', '2h', '4h', '8h', '1d']
+
+
+def make_event(n, with_policy=True):
+    """Build one jira:issue_created payload shaped like Jira Cloud's."""
+    service = random.choice(list(SERVICES))
+    actions = random.sample(SERVICES[service], k=random.randint(1, len(SERVICES[service])))
+    account = f"{random.randint(10 ** 11, 10 ** 12 - 1)}"
+    policy = {'Version': '2012-10-17',
+              'Statement': [{'Effect': 'Allow', 'Action': actions, 'Resource': '*'}]}
+    fields = {
+        'summary': f"Need {service} access for incident {n}",
+        'description': {'type': 'doc', 'version': 1, 'content': [
+            {'type': 'paragraph', 'content': [
+                {'type': 'text', 'text': f"Allow {', '.join(actions)} in account {account}"}]}]},
+        'reporter': {'emailAddress': f"engineer{n % 500}@example.com"},
+        'customfield_10050': random.choice(TTLS),
+        'customfield_10051': f"{service}-jit",
+        'customfield_10052': account,
+        'customfield_10053': json.dumps(policy) if with_policy else None,
+    }
+    return {'webhookEvent': 'jira:issue_created',
+            'timestamp': int(time.time() * 1000),
+            'issue': {'id': str(10000 + n), 'key': f"JIT-{n}", 'fields': fields}}
+
+
+def sign(body, secret=None):
+    """X-Hub-Signature header value for `body`, as Jira signs deliveries."""
+    secret = secret or JIRA_WEBHOOK_SECRET
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run_load(url, count, concurrency, start=0):
+    """POST `count` events with `concurrency` keep-alive connections and report latencies."""
+    target = urlparse(url)
+    local = threading.local()
+    latencies, statuses, lock = [], {}, threading.Lock()
+
+    def connection():
+        if not hasattr(local, 'conn'):
+            cls = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+            local.conn = cls(target.hostname, target.port, timeout=30)
+        return local.conn
+
+    def post(n):
+        body = json.dumps(make_event(start + n)).encode()
+        headers = {'Content-Type': 'application/json'}
+        if JIRA_WEBHOOK_SECRET:
+            headers['X-Hub-Signature'] = sign(body)
+        began = time.perf_counter()
+        try:
+            conn = connection()
+            conn.request('POST', target.path or '/', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            local.__dict__.pop('conn', None)
+            status = 'error'
+        elapsed = time.perf_counter() - began
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post, range(count)))
+    wall = time.perf_counter() - began
+    return {'events': count,
+            'concurrency': concurrency,
+            'wall_time_s': round(wall, 3),
+            'events_per_s': round(count / wall, 1) if wall else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'statuses': {str(k): v for k, v in statuses.items()}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Jira issue-created webhook events.")
+    parser.add_argument("--url", default="http://localhost:8080/webhook/jira", help="Webhook receiver url.")
+    parser.add_argument("--count", type=int, default=1000, help="Number of events.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent connections.")
+    parser.add_argument("--start", type=int, default=0, help="First issue number, reuse to replay duplicates.")
+    parser.add_argument("--dump", action='store_true', help="Print events as JSON lines instead of sending them.")
+    args = parser.parse_args()
+
+    if args.dump:
+        for n in range(args.start, args.start + args.count):
+            print(json.dumps(make_event(n)))
+    else:
+        print(json.dumps(run_load(args.url, args.count, args.concurrency, args.start), indent=2))
@@ -5,14 +5,34 @@ import requests
 import json
 import argparse
 import redis
-from pytimeparse.timeparse import timeparse
-import boto3
+
+try:
+    from shared import slack_notifier, lazy, resilience
+except ImportError:  # shipped flat next to this script
+    import slack_notifier
+    import lazy
+    import resilience
+try:
+    from jit_tools import idempotency, request_state, audit, metrics, rules, directory, records, grants
+except ImportError:
+    import idempotency
+    import request_state
+    import audit
+    import metrics
+    import rules
+    import directory
+    import records
+    import grants
+
+# Only needed once a request is approved; a deny never imports them
+boto3 = lazy.module('boto3')
+timeparse = lazy.module('pytimeparse.timeparse')
 
 # Constants and configuration
 APPROVER_USER_EMAIL = os.getenv('KUBIYA_USER_EMAIL')
 APPROVAL_SLACK_CHANNEL = os.getenv('APPROVAL_SLACK_CHANNEL', 'C07R1TGSDPF')  # Default channel ID if not set
 REQUEST_SLACK_CHANNEL = '#jit_requests'
-APPROVING_USERS = ['adsaunde1@gmail.com']  # TODO: Replace with actual approver emails
+APPROVING_USERS = ['adsaunde1@gmail.com']  # approvers when no rules file (JIT_RULES_FILE) is deployed
 SLACK_API_TOKEN = os.getenv('SLACK_API_TOKEN')
 JIT_API_KEY = os.getenv('JIT_API_KEY')
 BACKEND_URL = os.getenv('BACKEND_URL')
@@ -22,33 +42,25 @@ BACKEND_PASS = os.getenv('BACKEND_PASS')
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 KUBI_UUID = os.getenv('KUBI_UUID', '760b34a8-bc05-4224-9137-bffc43bef24c')  # Default UUID if not set
+KUBIYA_API_URL = os.getenv('KUBIYA_API_URL', 'https://api.kubiya.ai/api/v1/')
+IAM_ENDPOINT_URL = os.getenv('IAM_ENDPOINT_URL')  # None = the AWS default endpoint
+
+class WebhookError(Exception):
+    """Raised when a decision is not allowed or provisioning fails; a redelivery resumes from the last completed stage."""
 
 def send_slack_message(channel_id, message, slack_token):
-    """Send a message to a Slack channel."""
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {slack_token}"
-    }
-    data = {
-        "channel": channel_id,
-        "text": message
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200 and response.json().get("ok"):
-        print("✅ Slack notification sent successfully")
-    else:
-        print(f"❌ Error sending Slack notification: {response.status_code} - {response.text}")
-        sys.exit(1)
+    """Queue a message to a Slack channel; it is sent in the background off the critical path."""
+    slack_notifier.get_notifier(slack_token).notify(channel_id, message)
+    print("📝 Slack notification queued")
 
 def parse_arguments():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(description="Just-in-time request processing.")
     parser.add_argument("--request_id", required=True, help="The request ID from the webhook.")
     parser.add_argument("--approval_action", required=True, help="Approval action: 'approve' or 'deny'.")
+    parser.add_argument("--payload", default='{}', help="The webhook payload as JSON.")
     args = parser.parse_args()
-    return args.request_id, args.approval_action.lower()
+    return args.request_id, args.approval_action.lower(), json.loads(args.payload)
 
 def validate_environment_variables():
     """Ensure all required environment variables are set."""
@@ -62,13 +74,15 @@ def validate_environment_variables():
         print(f"❌ Missing required environment variables: {', '.join(missing_vars)}")
         sys.exit(1)
 
-def validate_aws_policy(policy_document):
-  """Ensure all required environment variables are set."""
-  iam_client = boto3.client('iam')
-  policy_document_json = json.dumps(policy_document)
+def validate_aws_policy(policy_document, iam_client=None, rd=None):
+  """Validate the structure of a policy document with the IAM policy simulator."""
+  iam_client = iam_client or boto3.client('iam', endpoint_url=IAM_ENDPOINT_URL, config=resilience.boto_config('iam'))
+  # The stored policy is already JSON text; encoding it again would send IAM a string
+  policy_document_json = policy_document if isinstance(policy_document, str) else json.dumps(policy_document)
   try:
   # Attempt simulation with an empty list of actions, which won’t simulate but will validate structure
-    response = iam_client.simulate_custom_policy(
+    response = resilience.dependency('iam', rd).call(
+        iam_client.simulate_custom_policy,
         PolicyInputList=[policy_document_json],
         ActionNames=[],
     )
@@ -79,158 +93,253 @@ def validate_aws_policy(policy_document):
       
 
 def create_redis_client():
-    """Create a Redis client."""
+    """Create a Redis client with timeouts and retries."""
     return redis.Redis(
         host=BACKEND_URL,
         port=BACKEND_PORT,
         password=BACKEND_PASS,
+        **resilience.redis_options()
     )
 
 
 
 
-def retrieve_approval_request(rd, request, request_id):
-    """Store the approval request in Redis."""
+def build_approval_request(request, request_id):
+    """Format a webhook payload (a dict) into the stored approval request structure."""
+    now = datetime.utcnow()
+    return {
+        request_id: {
+            'status': 'pending',
+            'ttl_min': int(request['ttl']),
+            'policy_name': request_id,  # never from the payload: the grant must not take over another policy
+            'permission_set_name': request['permission_set_name'],
+            'aws_account_id': request.get('aws_account_id'),
+            'llm_policy': records.canonical_policy(request['policy']).decode('utf-8'),
+            'requested_at': now.isoformat(),
+            'expires_at': (now + timedelta(minutes=int(request['ttl']))).isoformat(),
+            'user_email': request['user_email'],
+            'slack_channel_id': request.get('slack_channel_id'),
+            'slack_thread_ts': request.get('slack_thread_ts'),
+            'purpose': request['purpose']
+        }
+    }
+
+def retrieve_approval_request(rd, request, request_id, checkpoint=None):
+    """Store the approval request in Redis; a delivery resumed at `checkpoint` reuses the stored one."""
+    if checkpoint is not None and checkpoint.done('stored'):
+        return checkpoint.get('stored')
     try:
         # Format webhook data to match expected structure
-        ap_request_json = {
-            request_id: {
-                'status': 'pending',
-                'ttl_min': request.json['ttl'],
-                'policy_name': request.json['policy_name'],
-                'permission_set_name': request.json['permission_set_name'],
-                'llm_policy': str(request.json['policy']),
-                'requested_at': datetime.utcnow().isoformat(),
-                'expires_at': (datetime.utcnow() + timedelta(minutes=request.json['ttl'])).isoformat(),
-                'user_email': request.json['user_email'],
-                'slack_channel_id': request.json['slack_channel_id'],
-                'slack_thread_ts': request.json['slack_thread_ts'],
-                'purpose': request.json['purpose']
-            }
-        }
-        
-        # Add to Redis set
-        rd.sadd(str(request_id), json.dumps(ap_request_json))
-        
+        ap_request_json = build_approval_request(request, request_id)
+
+        # Add to Redis set and register the request as pending
+        pipe = rd.pipeline()
+        records.store_request(pipe, request_id, ap_request_json[request_id])
+        request_state.create_state(pipe, str(request_id), user_email=request['user_email'])
+        audit.record(pipe, audit.CREATED, str(request_id), user=request['user_email'],
+                     actor=request['user_email'], account=request.get('aws_account_id'), source='jira')
+        metrics.request_created(pipe)
+        if checkpoint is not None:
+            checkpoint.mark('stored', ap_request_json, pipe=pipe)
+        pipe.execute()
+
         # Return the stored data
         return ap_request_json
     except Exception as e:
-        print(f"❌ Error retrieving approval request: {e}")
-        sys.exit(1)
+        raise WebhookError(f"Error storing approval request: {e}")
 
-def validate_inputs_and_permissions(approval_action, approval_request, request_id):
-    """Validate user permissions and request data."""
-    if approval_action not in ['approve', 'approved', 'rejected', 'deny', 'denied']:
-        print("❌ Invalid approval action. Use 'approve' or 'deny'.")
-        sys.exit(1)
-    if APPROVER_USER_EMAIL not in APPROVING_USERS:
-        print(f"❌ User {APPROVER_USER_EMAIL} is not authorized to approve this request.")
-        sys.exit(1)
-    if not approval_request:
-        print(f"❌ No pending approval request found for request ID {request_id}.")
-        sys.exit(1)
-    print(f"✅ Approval request with ID {request_id} has been {approval_action}.")
+def validate_inputs_and_permissions(approval_action, approval_request, request_id, rd=None):
+    """Validate user permissions and request data, recording the approver's vote when a rule needs several.
 
-def create_iam_policy(approval_request, request_id):
-    """Create an IAM policy using Boto3."""
-    validate_aws_policy(approval_request[request_id]['llm_policy'])
+    Returns:
+        rules.Ballot: the checked decision and the votes so far
+    """
+    try:
+        ballot = rules.cast(rd, request_id, approval_request[request_id] if approval_request else None,
+                            approval_action, APPROVER_USER_EMAIL,
+                            resolve=lambda email, group_id: check_user_group_via_api(email, group_id, rd),
+                            default_approvers=APPROVING_USERS)
+    except (rules.RulesError, directory.DirectoryError) as e:
+        raise WebhookError(str(e))
+    print(f"✅ Approval request with ID {request_id} has been {approval_action} ({ballot.verdict.reason}).")
+    return ballot
 
+def create_iam_policy(approval_request, request_id, expires_at, rd=None):
+    """Create an IAM policy using Boto3 whose statements stop applying at `expires_at`."""
     session = boto3.Session(
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     )
-    iam_client = session.client('iam')
+    iam_client = session.client('iam', endpoint_url=IAM_ENDPOINT_URL, config=resilience.boto_config('iam'))
+    validate_aws_policy(approval_request[request_id]['llm_policy'], iam_client, rd)
     try:
-        response = iam_client.create_policy(
-            PolicyName=approval_request[request_id]['policy_name'],
-            PolicyDocument=approval_request[request_id]['llm_policy']
-        )
-        policy_arn = response['Policy']['Arn']
+        # a retried create that had already landed returns the existing policy
+        policy_arn = resilience.dependency('iam', rd).call(
+            grants.create_policy, iam_client, approval_request[request_id]['policy_name'],
+            grants.with_expiry(approval_request[request_id]['llm_policy'], expires_at), request_id,
+            approval_request[request_id].get('aws_account_id'))
         print(f"✅ Policy created successfully: {policy_arn}")
         return policy_arn
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print(f"❌ Policy {approval_request[request_id]['policy_name']} already exists.")
-        sys.exit(1)
     except Exception as e:
-        print(f"❌ Error creating policy: {e}")
-        sys.exit(1)
+        raise WebhookError(f"Error creating policy: {e}")
 
-def schedule_policy_deletion(approval_request, request_id, policy_arn):
-    """Schedule the policy for deletion after a specified duration."""
+def grant_expiry(approval_request, request_id):
+    """When the grant ends: now plus the request's TTL, or one hour when the TTL is unusable."""
+    now = datetime.now(timezone.utc)
     try:
-        now = datetime.now(timezone.utc)
         duration_minutes = approval_request[request_id]['ttl_min']
-        duration_seconds = timeparse(f"{duration_minutes}m")
+        duration_seconds = timeparse.timeparse(f"{duration_minutes}m")
         if duration_seconds is None:
             raise ValueError("Invalid duration format")
-        schedule_time_iso = (now + timedelta(seconds=duration_seconds)).isoformat()
+        return now + timedelta(seconds=duration_seconds)
     except Exception as e:
         print(f"❌ Error calculating policy expiration time: {e}")
         print("Fallback: Policy will be removed in 1 hour.")
-        schedule_time_iso = (now + timedelta(hours=1)).isoformat()
+        return now + timedelta(hours=1)
+
+def schedule_policy_deletion(request_id, policy_arn, expires_at, rd=None):
+    """Schedule the grant's expiry; the approve tool's 'expire' action re-arms it if the grant was extended."""
+    schedule_time_iso = expires_at.isoformat()
     sch_task = {
         'cron_string': "",
         'schedule_time': schedule_time_iso,
         'channel_id': APPROVAL_SLACK_CHANNEL,
-        'task_description': f"Delete IAM policy with ARN {policy_arn}",
+        'task_description': (f"Run the approve tool with request_id {request_id} and approval_action expire "
+                             f"(IAM policy ARN {policy_arn})"),
         'selected_agent': KUBI_UUID
     }
     print(f"Scheduling task: {sch_task}")
     try:
-        response = requests.post(
-            'https://api.kubiya.ai/api/v1/scheduled_tasks',
+        response = resilience.dependency('kubiya', rd).request(
+            requests, 'POST',
+            KUBIYA_API_URL.rstrip('/') + '/scheduled_tasks',
             headers={
                 'Authorization': f'UserKey {JIT_API_KEY}',
                 'Content-Type': 'application/json'
             },
             json=sch_task
         )
-        if response.status_code != 200:
-            print(f"❌ Error scheduling task: {response.status_code} - {response.text}")
-            sys.exit(1)
-        print("✅ Task scheduled successfully")
     except Exception as e:
-        print(f"❌ Exception while scheduling task: {e}")
-        sys.exit(1)
+        raise WebhookError(f"Exception while scheduling task: {e}")
+    if response.status_code != 200:
+        raise WebhookError(f"Error scheduling task: {response.status_code} - {response.text}")
+    print("✅ Task scheduled successfully")
 
 
-def check_user_group_via_api(user_email, group_id):
-    """Check if the user is in the approver group via the Kubiya API."""
-    response = requests.get(
-        f"https://api.kubiya.ai/api/v1/manage/groups/{group_id}",
-        headers={'Authorization': f'UserKey {JIT_API_KEY}'}
-    )
-    return user_email in response.json()
+def check_user_group_via_api(user_email, group_id, rd=None):
+    """Check if the user is in the approver group, through the cached directory when `rd` is given."""
+    if rd is None:
+        return user_email.lower() in directory.fetch_group(group_id)
+    return directory.is_member(rd, group_id, user_email)
 
 
-def main():
-    """Main function to process the approval request."""
-    # Parse command-line arguments
-    request_id, approval_action = parse_arguments()
+def process_delivery(rd, request_id, approval_action, payload, checkpoint):
+    """Store the request and apply the decision, resuming at the first stage `checkpoint` lacks."""
+    approval_request = retrieve_approval_request(rd, payload, request_id, checkpoint)
 
-    # Validate environment variables
-    validate_environment_variables()
+    # Validate inputs and permissions
+    ballot = validate_inputs_and_permissions(approval_action, approval_request, request_id, rd)
+    approved = ballot.decision == 'approve'
+    user_email = approval_request[request_id]['user_email']
 
-    # Create Redis client and retrieve approval request
-    rd = create_redis_client()
-    approval_request = retrieve_approval_request(rd, request_id)
+    # Rules such as "prod writes need 2 approvers" hold the request until enough distinct votes
+    if ballot.status is not None:
+        print(f"✅ Request ID {request_id} is already {ballot.status}; the approval was not recorded.")
+        return
+    required = ballot.verdict.required_approvals
+    if ballot.votes is not None and ballot.votes < required:
+        audit.record(rd, audit.VOTED, request_id, user=user_email, actor=APPROVER_USER_EMAIL,
+                     votes=ballot.votes, required=required)
+        print(f"✅ Approval {ballot.votes}/{required} recorded for request ID {request_id}.")
+        return
+
+    # Only the first decision on a pending request goes on to the side effects
+    to_state = request_state.APPROVED if approved else request_state.DENIED
+    account = approval_request[request_id].get('aws_account_id')
+    requested_at = approval_request[request_id].get('requested_at')
+    hook = request_state.chain(
+        audit.transition_hook(request_id, user=user_email, actor=APPROVER_USER_EMAIL, account=account),
+        metrics.transition_hook(approval_wait_seconds=metrics.seconds_since(requested_at)))
+    if approved:
+        hook = request_state.chain(
+            hook, lambda pipe, from_state, to_state: checkpoint.mark('approved_by', APPROVER_USER_EMAIL, pipe=pipe))
+    moved = request_state.transition(rd, request_id, to_state, fields={'decided_by': APPROVER_USER_EMAIL},
+                                     pipeline_hook=hook)
+    if not moved.ok:
+        if not (approved and moved.from_state in (request_state.APPROVED, request_state.PROVISIONED)
+                and checkpoint.get('approved_by') == APPROVER_USER_EMAIL):
+            print(f"✅ Request ID {request_id} is already {moved.from_state}; '{approval_action}' was not applied.")
+            return
+        print(f"⏭️ Resuming the approval of request ID {request_id} after: {', '.join(checkpoint.stages)}")
 
-    # Validate inputs and permissions
-    validate_inputs_and_permissions(approval_action, approval_request, request_id)
-    
     # Process approval action
-    if approval_action in ['approve', 'approved']:
-        policy_arn = create_iam_policy(approval_request, request_id)
-        schedule_policy_deletion(approval_request, request_id, policy_arn)
-    
+    policy_arn = None
+    if approved:
+        started = datetime.now(timezone.utc)
+        if checkpoint.done('policy'):
+            policy_arn = checkpoint.get('policy')['arn']
+            expires_at = grants.parse_time(checkpoint.get('policy')['expires_at'])
+        else:
+            expires_at = grant_expiry(approval_request, request_id)
+            try:
+                policy_arn = create_iam_policy(approval_request, request_id, expires_at, rd)
+            except BaseException:
+                # Nothing was provisioned; reopen the request so the decision can be retried
+                request_state.transition(rd, request_id, request_state.PENDING, pipeline_hook=request_state.chain(
+                    metrics.transition_hook(),
+                    lambda pipe, from_state, to_state: checkpoint.forget('approved_by', pipe=pipe)))
+                raise
+            checkpoint.mark('policy', {'arn': policy_arn, 'expires_at': expires_at.isoformat()})
+        if not checkpoint.done('provisioned'):
+            hook = request_state.chain(
+                audit.transition_hook(request_id, user=user_email, actor=APPROVER_USER_EMAIL, account=account,
+                                      policy_arn=policy_arn),
+                metrics.transition_hook(provisioning_seconds=metrics.seconds_since(started.isoformat()),
+                                        time_to_access_seconds=metrics.seconds_since(requested_at)),
+                lambda pipe, from_state, to_state: checkpoint.mark('provisioned', pipe=pipe))
+            request_state.transition(rd, request_id, request_state.PROVISIONED,
+                                     fields={'policy_arn': policy_arn, 'policy_version': 'v1',
+                                             'expires_at': expires_at.isoformat()},
+                                     pipeline_hook=hook)
+        schedule_policy_deletion(request_id, policy_arn, expires_at, rd)
+        audit.record(rd, audit.SCHEDULED, request_id, user=user_email, actor=APPROVER_USER_EMAIL,
+                     policy_arn=policy_arn, expires_at=expires_at.isoformat())
+    checkpoint.clear()
+
     # Send Slack notification
     slack_channel_id = approval_request[request_id]['slack_channel_id']
-    user_email = approval_request[request_id]['user_email']
     message = f"<@{user_email}>, your request has been {approval_action}. \n \
                 Policy ARN: {policy_arn} \n \
                 Here is the policy requested: \n \
                 {approval_request} \n\n\n"
     send_slack_message(slack_channel_id, message, SLACK_API_TOKEN)
 
+def main():
+    """Main function to process the approval request."""
+    # Parse command-line arguments
+    request_id, approval_action, payload = parse_arguments()
+
+    # Validate environment variables
+    validate_environment_variables()
+
+    # Create Redis client and retrieve approval request
+    rd = create_redis_client()
+
+    # Retried webhook deliveries must not store the request a second time
+    delivery_id = idempotency.payload_digest(payload)
+    first, _ = idempotency.claim(rd, request_id, delivery_id)
+    if not first:
+        print(f"✅ Duplicate delivery for request ID {request_id}, nothing to do.")
+        return
+
+    checkpoint = resilience.Checkpoint(rd, f"webhook:{request_id}")
+    try:
+        process_delivery(rd, request_id, approval_action, payload, checkpoint)
+    except (WebhookError, resilience.DependencyError) as e:
+        # A redelivery resumes from the last completed stage instead of being a duplicate
+        idempotency.release(rd, request_id, delivery_id)
+        print(f"❌ {e}")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,8 @@
 from . import jit_webhook
+from shared import slack_notifier, tracing, lazy, resilience
+from jit_tools import idempotency, request_state, audit, metrics, risk, rules, directory, records, grants
 
+import os
 import inspect
 
 
@@ -33,9 +36,65 @@ python /tmp/jit_webhook.py "{{ .request_id }}"
             destination="/tmp/jit_webhook.py",
             content=inspect.getsource(jit_webhook),
         ),
+        FileSpec(
+            destination="/tmp/slack_notifier.py",
+            content=inspect.getsource(slack_notifier),
+        ),
+        FileSpec(
+            destination="/tmp/tracing.py",
+            content=inspect.getsource(tracing),
+        ),
+        FileSpec(
+            destination="/tmp/lazy.py",
+            content=inspect.getsource(lazy),
+        ),
+        FileSpec(
+            destination="/tmp/resilience.py",
+            content=inspect.getsource(resilience),
+        ),
+        FileSpec(
+            destination="/tmp/idempotency.py",
+            content=inspect.getsource(idempotency),
+        ),
+        FileSpec(
+            destination="/tmp/request_state.py",
+            content=inspect.getsource(request_state),
+        ),
+        FileSpec(
+            destination="/tmp/audit.py",
+            content=inspect.getsource(audit),
+        ),
+        FileSpec(
+            destination="/tmp/metrics.py",
+            content=inspect.getsource(metrics),
+        ),
+        FileSpec(
+            destination="/tmp/risk.py",
+            content=inspect.getsource(risk),
+        ),
+        FileSpec(
+            destination="/tmp/rules.py",
+            content=inspect.getsource(rules),
+        ),
+        FileSpec(
+            destination="/tmp/directory.py",
+            content=inspect.getsource(directory),
+        ),
+        FileSpec(
+            destination="/tmp/records.py",
+            content=inspect.getsource(records),
+        ),
+        FileSpec(
+            destination="/tmp/grants.py",
+            content=inspect.getsource(grants),
+        ),
+        FileSpec(
+            destination="/tmp/approval_rules.json",
+            content=open(os.path.join(os.path.dirname(rules.__file__), 'approval_rules.json')).read(),
+        ),
         FileSpec(
             destination="/tmp/requirements.txt",
-            content="",  # Add any requirements here
+            content=open(os.path.join(os.path.dirname(__file__), 'requirements.txt')).read(),
         ),
     ],
 )
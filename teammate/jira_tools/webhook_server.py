@@ -0,0 +1,255 @@
+"""Resident ASGI receiver for Jira JIT webhooks.
+
+Replaces the one-container-per-webhook `jira_jit_webhook` tool for issue-created
+events: the payload is parsed and validated, the approval request is written to
+Redis over a pooled connection, and the heavy work (policy generation, IAM
+validation, notifying approvers) is pushed onto a Redis Stream for the workers.
+Jira gets its acknowledgement in milliseconds.
+
+Deliveries must carry a valid X-Hub-Signature for JIRA_WEBHOOK_SECRET; without
+a secret the server refuses to start unless JIRA_WEBHOOK_INSECURE=1. Run it with:
+    uvicorn jira_tools.webhook_server:app --host 0.0.0.0 --port 8080 --workers 2
+
+and load test it with jira_tools/jira_event_gen.py.
+"""
+import os
+import json
+import hmac
+import hashlib
+
+import redis.asyncio as aioredis
+
+from jit_tools import idempotency, request_state, audit, metrics, records
+from .jit_webhook import build_approval_request
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL', 'localhost')
+BACKEND_PORT = int(os.getenv('BACKEND_PORT', '6379'))
+BACKEND_DB = int(os.getenv('BACKEND_DB') or 0)
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+JIRA_WEBHOOK_PATH = os.getenv('JIRA_WEBHOOK_PATH', '/webhook/jira')
+JIRA_WEBHOOK_SECRET = os.getenv('JIRA_WEBHOOK_SECRET')
+# accept unsigned deliveries when no secret is configured; for local testing only
+JIRA_WEBHOOK_INSECURE = os.getenv('JIRA_WEBHOOK_INSECURE', '').lower() in ('1', 'true', 'yes')
+JIRA_EVENTS_STREAM = os.getenv('JIRA_EVENTS_STREAM', 'jit:jira:events')
+JIRA_EVENTS_MAXLEN = int(os.getenv('JIRA_EVENTS_MAXLEN', '100000'))
+MAX_BODY_BYTES = int(os.getenv('JIRA_MAX_BODY_BYTES', str(1024 * 1024)))
+SLACK_CHANNEL_ID = os.getenv('APPROVAL_SLACK_CHANNEL')
+
+# Approval request field -> Jira issue field. Custom field ids differ per Jira site.
+JIRA_FIELD_MAP = {
+    'purpose': 'summary',
+    'policy_description': 'description',
+    'ttl': 'customfield_10050',
+    'permission_set_name': 'customfield_10051',
+    'aws_account_id': 'customfield_10052',
+    'policy': 'customfield_10053',
+}
+JIRA_FIELD_MAP.update(json.loads(os.getenv('JIRA_FIELD_MAP', '{}')))
+
+TTL_UNITS = {'m': 1, 'h': 60, 'd': 60 * 24}
+
+_pool = None
+
+
+class InvalidEvent(ValueError):
+    """The payload is not a usable Jira issue-created event."""
+
+
+def get_redis():
+    """Return a client on the process wide connection pool."""
+    global _pool
+    if _pool is None:
+        _pool = aioredis.ConnectionPool(host=BACKEND_URL, port=BACKEND_PORT, db=BACKEND_DB,
+                                        password=BACKEND_PASS, max_connections=REDIS_MAX_CONNECTIONS)
+    return aioredis.Redis(connection_pool=_pool)
+
+
+def adf_text(node):
+    """Flatten an Atlassian Document Format node (or a plain string) to text."""
+    if node is None or isinstance(node, str):
+        return node or ''
+    if isinstance(node, list):
+        return ' '.join(filter(None, (adf_text(n) for n in node)))
+    return node.get('text') or adf_text(node.get('content'))
+
+
+def parse_ttl(value):
+    """TTL in minutes from an int or a '{number}{m|h|d}' string."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value or '').strip().lower()
+    if value.isdigit():
+        return int(value)
+    if value[:-1].isdigit() and value[-1:] in TTL_UNITS:
+        return int(value[:-1]) * TTL_UNITS[value[-1]]
+    raise InvalidEvent(f"invalid ttl {value!r}")
+
+
+def parse_jira_event(event):
+    """Validate a Jira webhook payload and map it onto an approval request.
+
+    Args:
+        event (dict): decoded webhook body
+
+    Returns:
+        tuple: (request_id, request dict for build_approval_request)
+
+    Raises:
+        InvalidEvent: if the body is not an object, the event is not issue-created
+            or required fields are missing
+    """
+    if not isinstance(event, dict):
+        raise InvalidEvent("body must be a JSON object")
+    if event.get('webhookEvent') != 'jira:issue_created':
+        raise InvalidEvent(f"unsupported webhookEvent {event.get('webhookEvent')!r}")
+    issue = event.get('issue') or {}
+    if not isinstance(issue, dict):
+        raise InvalidEvent("issue must be an object")
+    fields = issue.get('fields') or {}
+    if not isinstance(fields, dict):
+        raise InvalidEvent("issue.fields must be an object")
+    if not issue.get('key'):
+        raise InvalidEvent("issue.key is missing")
+
+    def field(name):
+        value = fields.get(JIRA_FIELD_MAP[name])
+        # select lists arrive as {"value": ...}
+        return value.get('value') if isinstance(value, dict) and 'value' in value else value
+
+    policy = field('policy')
+    if isinstance(policy, str) and policy.strip():
+        try:
+            policy = json.loads(policy)
+        except ValueError:
+            raise InvalidEvent("policy is not valid JSON")
+    if policy and not (isinstance(policy, dict) and 'Statement' in policy):
+        raise InvalidEvent("policy has no Statement")
+    description = adf_text(field('policy_description'))
+    if not policy and not description:
+        raise InvalidEvent("either a policy or a policy description is required")
+    user_email = (fields.get('reporter') or {}).get('emailAddress')
+    if not user_email:
+        raise InvalidEvent("reporter.emailAddress is missing")
+
+    request_id = 'kubiya-jit-jira-' + issue['key'].lower()
+    request = {
+        'ttl': parse_ttl(field('ttl') or '1h'),
+        'policy_name': request_id,
+        'permission_set_name': field('permission_set_name') or issue['key'],
+        'policy': json.dumps(policy) if policy else '',
+        'policy_description': description,
+        'aws_account_id': field('aws_account_id'),
+        'user_email': user_email,
+        'slack_channel_id': SLACK_CHANNEL_ID,
+        'slack_thread_ts': None,
+        'purpose': adf_text(field('purpose')),
+        'jira_issue': issue['key'],
+    }
+    return request_id, request
+
+
+def verify_signature(body, headers):
+    """Check Jira's `X-Hub-Signature: sha256=<hmac>`; without a secret nothing passes unless JIRA_WEBHOOK_INSECURE is set."""
+    if not JIRA_WEBHOOK_SECRET:
+        return JIRA_WEBHOOK_INSECURE
+    expected = 'sha256=' + hmac.new(JIRA_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, headers.get('x-hub-signature', ''))
+
+
+async def store_event(rd, request_id, request):
+    """Persist the approval request and queue the heavy work in one round trip."""
+    approval_request = build_approval_request(request, request_id)
+    async with rd.pipeline(transaction=False) as pipe:
+        records.store_request(pipe, request_id, approval_request[request_id])
+        request_state.create_state(pipe, request_id, user_email=request['user_email'])
+        audit.record(pipe, audit.CREATED, request_id, user=request['user_email'], actor=request['user_email'],
+                     account=request.get('aws_account_id'), source='jira', jira_issue=request['jira_issue'])
+        metrics.request_created(pipe)
+        pipe.xadd(JIRA_EVENTS_STREAM,
+                  {'request_id': request_id, 'payload': json.dumps(request)},
+                  maxlen=JIRA_EVENTS_MAXLEN, approximate=True)
+        await pipe.execute()
+    return approval_request
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise InvalidEvent("payload too large")
+        if not message.get('more_body'):
+            return body
+
+
+async def respond(send, status, payload):
+    data = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(data)).encode())]})
+    await send({'type': 'http.response.body', 'body': data})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if not JIRA_WEBHOOK_SECRET and not JIRA_WEBHOOK_INSECURE:
+                await send({'type': 'lifespan.startup.failed',
+                            'message': "JIRA_WEBHOOK_SECRET is not set; set it, or JIRA_WEBHOOK_INSECURE=1 "
+                                       "to accept unsigned deliveries"})
+                return
+            await get_redis().ping()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _pool is not None:
+                await _pool.disconnect()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    if path == '/healthz':
+        return await respond(send, 200, {'ok': True})
+    if path == '/metrics' and method == 'GET':
+        data = metrics.render_prometheus(await metrics.acollect(get_redis())).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/plain; version=0.0.4'),
+                                (b'content-length', str(len(data)).encode())]})
+        return await send({'type': 'http.response.body', 'body': data})
+    if path != JIRA_WEBHOOK_PATH:
+        return await respond(send, 404, {'ok': False, 'error': 'not found'})
+    if method != 'POST':
+        return await respond(send, 405, {'ok': False, 'error': 'method not allowed'})
+
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+    try:
+        body = await read_body(receive)
+        if not verify_signature(body, headers):
+            return await respond(send, 401, {'ok': False, 'error': 'bad signature'})
+        request_id, request = parse_jira_event(json.loads(body))
+    except ValueError as e:  # InvalidEvent and JSON decode errors
+        return await respond(send, 400, {'ok': False, 'error': str(e)})
+
+    # Jira retries keep the delivery identifier; fall back to the payload digest
+    rd = get_redis()
+    delivery_id = headers.get('x-atlassian-webhook-identifier') or idempotency.payload_digest(request)
+    first, _ = await idempotency.aclaim(rd, request_id, delivery_id)
+    if not first:
+        return await respond(send, 200, {'ok': True, 'request_id': request_id, 'duplicate': True})
+    try:
+        await store_event(rd, request_id, request)
+    except Exception:
+        await idempotency.arelease(rd, request_id, delivery_id)
+        raise
+    return await respond(send, 202, {'ok': True, 'request_id': request_id})
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import multiprocessing
+
+import redis
+import requests
+from redis.exceptions import ResponseError
+
+try:
+    from . import metrics
+except ImportError:  # shipped flat next to this script
+    import metrics
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL')
+BACKEND_PORT = os.getenv('BACKEND_PORT')
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+APPROVAL_SLACK_CHANNEL = os.getenv('APPROVAL_SLACK_CHANNEL')
+SLACK_API_TOKEN = os.getenv('SLACK_API_TOKEN')
+APPROVALS_STREAM = os.getenv('JIT_APPROVALS_STREAM', 'jit:approvals')
+JIRA_EVENTS_STREAM = os.getenv('JIRA_EVENTS_STREAM', 'jit:jira:events')
+DEAD_LETTER_STREAM = os.getenv('JIT_DEAD_LETTER_STREAM', 'jit:approvals:dead')
+CONSUMER_GROUP = os.getenv('JIT_CONSUMER_GROUP', 'jit-approvers')
+STREAM_MAXLEN = int(os.getenv('JIT_STREAM_MAXLEN', '100000'))
+MAX_DELIVERIES = int(os.getenv('JIT_MAX_DELIVERIES', '5'))  # deliveries before a message is dead-lettered
+CLAIM_IDLE_MS = int(os.getenv('JIT_CLAIM_IDLE_MS', '60000'))  # pending this long = its consumer died
+BLOCK_MS = 5000
+BATCH_SIZE = 16
+BENCH_DONE_KEY = 'jit:approvals:bench:done'
+
+
+class PoisonMessage(Exception):
+    """The message can never be processed and goes straight to the dead-letter stream."""
+
+
+def create_redis_client():
+    """Create a Redis client on its own connection pool."""
+    return redis.Redis(host=BACKEND_URL, port=BACKEND_PORT, password=BACKEND_PASS)
+
+
+def enqueue_decision(rd, request_id, approval_action, approver_email, traceparent=None):
+    """Queue an approval decision for the workers.
+
+    Returns:
+        str: the stream message ID
+    """
+    message_id = rd.xadd(APPROVALS_STREAM, {
+        'request_id': request_id,
+        'approval_action': approval_action,
+        'approver_email': approver_email or '',
+        'enqueued_at': f"{time.time():.6f}",
+        'traceparent': traceparent or '',
+    }, maxlen=STREAM_MAXLEN, approximate=True)
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+
+def ensure_group(rd, stream):
+    """Create the consumer group (and the stream) if they don't exist yet."""
+    try:
+        rd.xgroup_create(stream, CONSUMER_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+class Worker:
+    """One worker process: warm clients plus the consume/ack/dead-letter loop.
+
+    The boto3 IAM client, the Redis pool and the HTTP session are created once per
+    process and reused for every message, instead of once per container launch.
+    """
+
+    def __init__(self, name, streams=(APPROVALS_STREAM,), dry_run_ms=None):
+        self.name = name
+        self.streams = list(streams)
+        self.dry_run_ms = dry_run_ms
+        self.rd = create_redis_client()
+        self.http = requests.Session()
+        self.iam_client = None
+        self.running = True
+        self.handlers = {APPROVALS_STREAM: self.handle_decision,
+                         JIRA_EVENTS_STREAM: self.handle_jira_event}
+        if dry_run_ms is None:
+            try:
+                from . import approve
+            except ImportError:
+                import approve
+            self.approve = approve
+            self.iam_client = approve.create_iam_client()
+            # Keep the approver groups named in the rules cached so decisions never wait on the groups API
+            engine = approve.rules.get_engine(default_approvers=approve.APPROVING_USERS)
+            approve.directory.start_refresher(self.rd, engine.kubiya_groups, self.http)
+
+    def stop(self, *_):
+        self.running = False
+
+    def handle_decision(self, fields):
+        if not fields.get('request_id') or not fields.get('approval_action'):
+            raise PoisonMessage("decision without request_id/approval_action")
+        if self.dry_run_ms is not None:
+            time.sleep(self.dry_run_ms / 1000)
+            self.rd.incr(BENCH_DONE_KEY)
+            return
+        try:
+            queued = time.time() - float(fields['enqueued_at'])
+        except (KeyError, ValueError):
+            queued = None
+        pipe = self.rd.pipeline(transaction=False)
+        metrics.observe(pipe, 'queue_wait_seconds', queued)
+        pipe.execute()
+        try:
+            self.approve.process_decision(self.rd, fields['request_id'], fields['approval_action'].lower(),
+                                          fields.get('approver_email') or self.approve.APPROVER_USER_EMAIL,
+                                          iam_client=self.iam_client, http=self.http,
+                                          traceparent=fields.get('traceparent') or None)
+        except self.approve.ApprovalError as e:
+            if e.transient:
+                raise  # an outage: left pending and redelivered, dead-lettered only after MAX_DELIVERIES
+            # Invalid decisions and unauthorized approvers won't get better with retries
+            raise PoisonMessage(str(e))
+
+    def handle_jira_event(self, fields):
+        """Announce a request received by the Jira webhook receiver to the approvers."""
+        try:
+            request = json.loads(fields['payload'])
+        except (KeyError, ValueError):
+            raise PoisonMessage("jira event without a JSON payload")
+        if self.dry_run_ms is not None:
+            time.sleep(self.dry_run_ms / 1000)
+            return
+        try:
+            from shared import slack_notifier
+        except ImportError:
+            import slack_notifier
+        policy = request.get('policy') or f"to be generated from: {request.get('policy_description')}"
+        slack_notifier.get_notifier(SLACK_API_TOKEN).notify(
+            APPROVAL_SLACK_CHANNEL,
+            f"📥 New access request {fields['request_id']} from {request.get('user_email')} "
+            f"(Jira {request.get('jira_issue')}) for {request.get('ttl')} minutes.\n"
+            f"Purpose: {request.get('purpose')}\nPolicy: ```{policy}```")
+
+    def process(self, stream, message_id, fields):
+        fields = {k.decode(): v.decode() for k, v in fields.items()}
+        try:
+            self.handlers[stream](fields)
+        except PoisonMessage as e:
+            self.dead_letter(stream, message_id, fields, str(e))
+            return
+        except Exception as e:
+            print(f"❌ {self.name}: {stream} {message_id} failed: {e}")
+            if self.deliveries(stream, message_id) >= MAX_DELIVERIES:
+                self.dead_letter(stream, message_id, fields, str(e))
+            # otherwise leave it pending; it is reclaimed after CLAIM_IDLE_MS
+            return
+        self.rd.xack(stream, CONSUMER_GROUP, message_id)
+
+    def deliveries(self, stream, message_id):
+        pending = self.rd.xpending_range(stream, CONSUMER_GROUP, min=message_id, max=message_id, count=1)
+        return pending[0]['times_delivered'] if pending else 0
+
+    def dead_letter(self, stream, message_id, fields, error):
+        print(f"❌ {self.name}: dead-lettering {stream} {message_id}: {error}")
+        pipe = self.rd.pipeline()
+        pipe.xadd(DEAD_LETTER_STREAM, dict(fields, stream=stream, message_id=message_id, error=error[:1000]),
+                  maxlen=STREAM_MAXLEN, approximate=True)
+        pipe.xack(stream, CONSUMER_GROUP, message_id)
+        pipe.execute()
+
+    def reclaim(self, stream):
+        """Take over messages left pending by crashed or stuck consumers."""
+        _, messages, *_ = self.rd.xautoclaim(stream, CONSUMER_GROUP, self.name, CLAIM_IDLE_MS,
+                                             start_id='0-0', count=BATCH_SIZE)
+        for message_id, fields in messages:
+            if fields:
+                self.process(stream, message_id, fields)
+
+    def run(self):
+        for stream in self.streams:
+            ensure_group(self.rd, stream)
+        signal.signal(signal.SIGTERM, self.stop)
+        last_reclaim = 0
+        while self.running:
+            if time.monotonic() - last_reclaim > CLAIM_IDLE_MS / 1000:
+                for stream in self.streams:
+                    self.reclaim(stream)
+                last_reclaim = time.monotonic()
+            batches = self.rd.xreadgroup(CONSUMER_GROUP, self.name, {s: '>' for s in self.streams},
+                                         count=BATCH_SIZE, block=BLOCK_MS)
+            for stream, messages in batches or []:
+                stream = stream.decode() if isinstance(stream, bytes) else stream
+                for message_id, fields in messages:
+                    self.process(stream, message_id, fields)
+
+
+def run_worker(name, streams, dry_run_ms=None):
+    """multiprocessing entry point."""
+    try:
+        Worker(name, streams, dry_run_ms).run()
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(processes, streams, dry_run_ms=None):
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    workers = [multiprocessing.Process(target=run_worker, args=(f"{prefix}-{i}", streams, dry_run_ms), daemon=True)
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def bench(processes, decisions, dry_run_ms):
+    """Push `decisions` synthetic decisions through N dry-run workers and report decisions/s."""
+    rd = create_redis_client()
+    rd.delete(APPROVALS_STREAM, BENCH_DONE_KEY)
+    ensure_group(rd, APPROVALS_STREAM)
+    pipe = rd.pipeline(transaction=False)
+    for n in range(decisions):
+        pipe.xadd(APPROVALS_STREAM, {'request_id': f"kubiya-jit-bench-{n}", 'approval_action': 'approve',
+                                     'approver_email': 'bench@example.com', 'enqueued_at': f"{time.time():.6f}"})
+    pipe.execute()
+
+    started = time.perf_counter()
+    workers = start_workers(processes, [APPROVALS_STREAM], dry_run_ms)
+    while int(rd.get(BENCH_DONE_KEY) or 0) < decisions:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.terminate()
+    rd.delete(APPROVALS_STREAM, BENCH_DONE_KEY)
+    result = {'processes': processes, 'decisions': decisions, 'handler_ms': dry_run_ms,
+              'wall_time_s': round(elapsed, 3), 'decisions_per_s': round(decisions / elapsed, 1)}
+    print(json.dumps(result, indent=2))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consume JIT approval decisions from Redis Streams.")
+    parser.add_argument("--processes", type=int, default=int(os.getenv('JIT_WORKER_PROCESSES', '4')),
+                        help="Number of worker processes.")
+    parser.add_argument("--jira_events", action='store_true', help="Also consume the Jira webhook event stream.")
+    parser.add_argument("--bench", type=int, metavar='N', help="Benchmark N dry-run decisions and exit.")
+    parser.add_argument("--bench_handler_ms", type=float, default=0.0,
+                        help="Simulated handler time per decision in benchmark mode.")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.processes, args.bench, args.bench_handler_ms)
+        return
+
+    streams = [APPROVALS_STREAM] + ([JIRA_EVENTS_STREAM] if args.jira_events else [])
+    workers = start_workers(args.processes, streams)
+    print(f"✅ {len(workers)} approval workers consuming {', '.join(streams)}")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,40 @@ import sys
 from datetime import datetime, timedelta, timezone
 import requests
 import json
+import time
 import argparse
 import redis
-from pytimeparse.timeparse import timeparse
-import boto3
+
+try:
+    from shared import slack_notifier, tracing, lazy, resilience
+except ImportError:  # shipped flat next to this script
+    import slack_notifier
+    import tracing
+    import lazy
+    import resilience
+try:
+    from . import idempotency, approval_worker, request_state, audit, metrics, risk, rules, directory, records, grants
+except ImportError:
+    import idempotency
+    import approval_worker
+    import request_state
+    import audit
+    import metrics
+    import risk
+    import rules
+    import directory
+    import records
+    import grants
+
+# Only needed once a request is approved; a deny never imports them
+boto3 = lazy.module('boto3')
+timeparse = lazy.module('pytimeparse.timeparse')
 
 # Constants and configuration
 APPROVER_USER_EMAIL = os.getenv('KUBIYA_USER_EMAIL')
 APPROVAL_SLACK_CHANNEL = os.getenv('APPROVAL_SLACK_CHANNEL', 'C07R1TGSDPF')  # Default channel ID if not set
 REQUEST_SLACK_CHANNEL = '#jit_requests'
-APPROVING_USERS = ['adsaunde1@gmail.com']  # TODO: Replace with actual approver emails
+APPROVING_USERS = ['adsaunde1@gmail.com']  # approvers when no rules file (JIT_RULES_FILE) is deployed
 SLACK_API_TOKEN = os.getenv('SLACK_API_TOKEN')
 JIT_API_KEY = os.getenv('JIT_API_KEY')
 BACKEND_URL = os.getenv('BACKEND_URL')
@@ -22,33 +46,28 @@ BACKEND_PASS = os.getenv('BACKEND_PASS')
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 KUBI_UUID = os.getenv('KUBI_UUID', '760b34a8-bc05-4224-9137-bffc43bef24c')  # Default UUID if not set
+KUBIYA_API_URL = os.getenv('KUBIYA_API_URL', 'https://api.kubiya.ai/api/v1/')
+IAM_ENDPOINT_URL = os.getenv('IAM_ENDPOINT_URL')  # None = the AWS default endpoint
 
 def send_slack_message(channel_id, message, slack_token):
-    """Send a message to a Slack channel."""
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {slack_token}"
-    }
-    data = {
-        "channel": channel_id,
-        "text": message
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200 and response.json().get("ok"):
-        print("✅ Slack notification sent successfully")
-    else:
-        print(f"❌ Error sending Slack notification: {response.status_code} - {response.text}")
-        sys.exit(1)
+    """Queue a message to a Slack channel; it is sent in the background off the critical path."""
+    slack_notifier.get_notifier(slack_token).notify(channel_id, message)
+    print("📝 Slack notification queued")
 
 def parse_arguments():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(description="Just-in-time request processing.")
     parser.add_argument("--request_id", required=True, help="The request ID from the webhook.")
-    parser.add_argument("--approval_action", required=True, help="Approval action: 'approve' or 'deny'.")
+    parser.add_argument("--approval_action", required=True,
+                        help="Approval action: 'approve' or 'deny', 'extend' a provisioned grant, or 'expire' it.")
+    parser.add_argument("--enqueue", action='store_true', help="Queue the decision for the approval workers instead of processing it here.")
+    parser.add_argument("--traceparent", help="W3C traceparent of the request, defaults to the one stored with it.")
+    parser.add_argument("--ttl", help="With 'extend': how much longer the grant lasts, e.g. 30m or 2h.")
+    parser.add_argument("--policy", help="With 'extend': a new policy document (JSON) replacing the granted one.")
     args = parser.parse_args()
-    return args.request_id, args.approval_action.lower()
+    if args.approval_action.lower() == 'extend' and not args.ttl:
+        parser.error("--ttl is required to extend a grant")
+    return args
 
 def validate_environment_variables():
     """Ensure all required environment variables are set."""
@@ -62,16 +81,28 @@ def validate_environment_variables():
         print(f"❌ Missing required environment variables: {', '.join(missing_vars)}")
         sys.exit(1)
 
-def validate_aws_policy(policy_document):
-  """Ensure all required environment variables are set."""
-  iam_client = boto3.client('iam')
-  policy_document_json = json.dumps(policy_document)
+
+class ApprovalError(Exception):
+    """Raised when an approval decision cannot be processed."""
+
+    @property
+    def transient(self):
+        """Whether a dependency outage caused it, so the same decision may go through later."""
+        return isinstance(self.__cause__, (resilience.DependencyError, redis.exceptions.ConnectionError,
+                                           redis.exceptions.TimeoutError))
+
+def validate_aws_policy(policy_document, iam_client=None, rd=None):
+  """Validate the structure of a policy document with the IAM policy simulator."""
+  iam_client = iam_client or boto3.client('iam', endpoint_url=IAM_ENDPOINT_URL, config=resilience.boto_config('iam'))
+  policy_document_json = policy_document if isinstance(policy_document, str) else json.dumps(policy_document)
   try:
   # Attempt simulation with an empty list of actions, which won’t simulate but will validate structure
-    response = iam_client.simulate_custom_policy(
-        PolicyInputList=[policy_document_json],
-        ActionNames=[],
-    )
+    with tracing.span('iam.simulate_custom_policy'):
+      response = resilience.dependency('iam', rd).call(
+          iam_client.simulate_custom_policy,
+          PolicyInputList=[policy_document_json],
+          ActionNames=[],
+      )
     print("Policy structure is valid.")
   except Exception as e:
       print("Policy structure is invalid:", e)
@@ -79,130 +110,272 @@ def validate_aws_policy(policy_document):
       
 
 def create_redis_client():
-    """Create a Redis client."""
+    """Create a Redis client with timeouts and retries."""
     return redis.Redis(
         host=BACKEND_URL,
         port=BACKEND_PORT,
         password=BACKEND_PASS,
+        **resilience.redis_options()
     )
 
+def create_iam_client():
+    """Create an IAM client from the configured credentials; calls are retried through resilience."""
+    session = boto3.Session(
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    )
+    return session.client('iam', endpoint_url=IAM_ENDPOINT_URL, config=resilience.boto_config('iam'))
+
 def retrieve_approval_request(rd, request_id):
     """Retrieve the approval request from Redis."""
     try:
-        res = rd.smembers(str(request_id))
-        decoded_load = [item.decode('utf-8').replace("'", '"') for item in res]
-        load = decoded_load[0]
-        approval_request = json.loads(load)
-        return approval_request
+        with tracing.span('redis.retrieve_request'):
+            approval_request = records.load_request(rd, request_id)
+        if approval_request is None:
+            raise records.RecordError(f"no record for {request_id}")
     except Exception as e:
-        print(f"❌ Error retrieving approval request: {e}")
-        sys.exit(1)
+        raise ApprovalError(f"Error retrieving approval request: {e}") from e
+    # The stored blob is written once; the live status is kept by request_state
+    approval_request[request_id]['status'] = request_state.get_state(rd, request_id)['status']
+    return approval_request
 
-def validate_inputs_and_permissions(approval_action, approval_request, request_id):
-    """Validate user permissions and request data."""
-    if approval_action not in ['approve', 'approved', 'rejected', 'deny', 'denied']:
-        print("❌ Invalid approval action. Use 'approve' or 'deny'.")
-        sys.exit(1)
-    if APPROVER_USER_EMAIL not in APPROVING_USERS:
-        print(f"❌ User {APPROVER_USER_EMAIL} is not authorized to approve this request.")
-        sys.exit(1)
-    if not approval_request:
-        print(f"❌ No pending approval request found for request ID {request_id}.")
-        sys.exit(1)
-    print(f"✅ Approval request with ID {request_id} has been {approval_action}.")
+def validate_inputs_and_permissions(approval_action, approval_request, request_id, approver_email=APPROVER_USER_EMAIL,
+                                    auto_approve=False, rd=None):
+    """Validate user permissions and request data, recording the approver's vote when a rule needs several.
 
-def create_iam_policy(approval_request, request_id):
-    """Create an IAM policy using Boto3."""
-    validate_aws_policy(approval_request[request_id]['llm_policy'])
-
-    session = boto3.Session(
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    )
-    iam_client = session.client('iam')
+    Returns:
+        rules.Ballot: the checked decision and the votes so far
+    """
+    request = approval_request[request_id] if approval_request else None
+    verdict = None
+    if auto_approve and request:
+        # The fast lane re-scores what is stored rather than trusting the caller's score
+        report = risk.score_policy(request['llm_policy'], request.get('ttl_min'), request.get('aws_account_id'))
+        if not risk.auto_approvable(report, request.get('ttl_min')):
+            raise ApprovalError(f"Request ID {request_id} scores {report.score} and needs a human approver.")
+        verdict = rules.Verdict(True, 1, (), f"auto-approved with risk score {report.score}")
     try:
-        response = iam_client.create_policy(
-            PolicyName=approval_request[request_id]['policy_name'],
-            PolicyDocument=approval_request[request_id]['llm_policy']
-        )
-        policy_arn = response['Policy']['Arn']
-        print(f"✅ Policy created successfully: {policy_arn}")
-        return policy_arn
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print(f"❌ Policy {approval_request[request_id]['policy_name']} already exists.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error creating policy: {e}")
-        sys.exit(1)
+        ballot = rules.cast(rd, request_id, request, approval_action, approver_email,
+                            resolve=lambda email, group_id: check_user_group_via_api(email, group_id, rd),
+                            default_approvers=APPROVING_USERS, verdict=verdict)
+    except rules.RulesError as e:
+        raise ApprovalError(str(e))
+    print(f"✅ Approval request with ID {request_id} has been {approval_action} ({ballot.verdict.reason}).")
+    return ballot
 
-def schedule_policy_deletion(approval_request, request_id, policy_arn):
-    """Schedule the policy for deletion after a specified duration."""
+def grant_expiry(ttl_minutes, now=None):
+    """When a grant of `ttl_minutes` starting now ends; one hour when the TTL is unusable."""
+    now = now or datetime.now(timezone.utc)
     try:
-        now = datetime.now(timezone.utc)
-        duration_minutes = approval_request[request_id]['ttl_min']
-        duration_seconds = timeparse(f"{duration_minutes}m")
+        duration_seconds = timeparse.timeparse(f"{ttl_minutes}m")
         if duration_seconds is None:
             raise ValueError("Invalid duration format")
-        schedule_time_iso = (now + timedelta(seconds=duration_seconds)).isoformat()
     except Exception as e:
         print(f"❌ Error calculating policy expiration time: {e}")
         print("Fallback: Policy will be removed in 1 hour.")
-        schedule_time_iso = (now + timedelta(hours=1)).isoformat()
+        duration_seconds = 60 * 60
+    return now + timedelta(seconds=duration_seconds)
+
+def create_iam_policy(approval_request, request_id, iam_client=None, validate=True, expires_at=None, rd=None):
+    """Create an IAM policy using Boto3; with `expires_at` its statements stop applying then."""
+    iam_client = iam_client or create_iam_client()
+    if validate:
+        validate_aws_policy(approval_request[request_id]['llm_policy'], iam_client, rd)
+    document = approval_request[request_id]['llm_policy']
+    if expires_at is not None:
+        document = grants.with_expiry(document, expires_at)
+    try:
+        # a retried create that had already landed returns the existing policy
+        policy_arn = resilience.dependency('iam', rd).call(
+            grants.create_policy, iam_client, approval_request[request_id]['policy_name'], document, request_id,
+            approval_request[request_id].get('aws_account_id'))
+        print(f"✅ Policy created successfully: {policy_arn}")
+        return policy_arn
+    except Exception as e:
+        raise ApprovalError(f"Error creating policy: {e}") from e
+
+def schedule_policy_deletion(approval_request, request_id, policy_arn, http=requests, expires_at=None, rd=None):
+    """Schedule the grant's expiry, at `expires_at` or after the request's TTL.
+
+    The task runs the 'expire' action rather than deleting the policy outright, so a
+    grant extended in the meantime is re-armed instead of cut short. 429s, 5xx and
+    connection errors are retried; `rd` shares Kubiya's circuit breaker state.
+    """
+    if expires_at is None:
+        expires_at = grant_expiry(approval_request[request_id]['ttl_min'])
+    schedule_time_iso = expires_at.isoformat()
     sch_task = {
         'cron_string': "",
         'schedule_time': schedule_time_iso,
         'channel_id': APPROVAL_SLACK_CHANNEL,
-        'task_description': f"Delete IAM policy with ARN {policy_arn}",
+        'task_description': (f"Run the approve tool with request_id {request_id} and approval_action expire "
+                             f"(IAM policy ARN {policy_arn})"),
         'selected_agent': KUBI_UUID
     }
     print(f"Scheduling task: {sch_task}")
     try:
-        response = requests.post(
-            'https://api.kubiya.ai/api/v1/scheduled_tasks',
-            headers={
-                'Authorization': f'UserKey {JIT_API_KEY}',
-                'Content-Type': 'application/json'
-            },
-            json=sch_task
-        )
-        if response.status_code != 200:
-            print(f"❌ Error scheduling task: {response.status_code} - {response.text}")
-            sys.exit(1)
-        print("✅ Task scheduled successfully")
+        with tracing.span('kubiya.schedule_task', schedule_time=schedule_time_iso) as span:
+            response = resilience.dependency('kubiya', rd).request(
+                http, 'POST',
+                KUBIYA_API_URL.rstrip('/') + '/scheduled_tasks',
+                headers={
+                    'Authorization': f'UserKey {JIT_API_KEY}',
+                    'Content-Type': 'application/json',
+                    'traceparent': tracing.traceparent(),
+                },
+                json=sch_task
+            )
+            span.set_attribute('http.status_code', response.status_code)
     except Exception as e:
-        print(f"❌ Exception while scheduling task: {e}")
-        sys.exit(1)
+        raise ApprovalError(f"Exception while scheduling task: {e}") from e
+    if response.status_code != 200:
+        raise ApprovalError(f"Error scheduling task: {response.status_code} - {response.text}")
+    print("✅ Task scheduled successfully")
+    return schedule_time_iso
 
 
-def check_user_group_via_api(user_email, group_id):
-    """Check if the user is in the approver group via the Kubiya API."""
-    response = requests.get(
-        f"https://api.kubiya.ai/api/v1/manage/groups/{group_id}",
-        headers={'Authorization': f'UserKey {JIT_API_KEY}'}
-    )
-    return user_email in response.json()
+def check_user_group_via_api(user_email, group_id, rd=None):
+    """Check if the user is in the approver group, through the cached directory when `rd` is given."""
+    if rd is None:
+        return user_email.lower() in directory.fetch_group(group_id)
+    return directory.is_member(rd, group_id, user_email)
 
 
-def main():
-    """Main function to process the approval request."""
-    # Parse command-line arguments
-    request_id, approval_action = parse_arguments()
+def process_decision(rd, request_id, approval_action, approver_email=APPROVER_USER_EMAIL,
+                     iam_client=None, http=requests, traceparent=None, auto_approve=False):
+    """Apply one approval decision.
 
-    # Validate environment variables
-    validate_environment_variables()
+    Shared by the CLI and the queue workers, which pass warm clients in. The decision
+    is traced as part of the request's trace: `traceparent`, or the one stored by
+    request_access. An approval that failed after the request left pending (policy
+    created, state provisioned, expiry scheduled) is resumed at the failed stage when
+    the same approver retries it.
 
-    # Create Redis client and retrieve approval request
-    rd = create_redis_client()
-    approval_request = retrieve_approval_request(rd, request_id)
+    Args:
+        rd (redis.Redis): Redis client
+        request_id (str): the request ID
+        approval_action (str): 'approve'/'approved' or 'deny'/'denied'/'rejected'
+        approver_email (str): who made the decision
+        iam_client: IAM client, created from the configured credentials when None
+        http: requests module or a requests.Session
+        traceparent (str, optional): W3C traceparent to continue
+        auto_approve (bool): fast-lane approval by request_access; the stored policy must
+            score under risk.AUTO_APPROVE_THRESHOLD instead of approver_email being an approver
+
+    Returns:
+        dict: {'request_id', 'decision', 'policy_arn', 'duplicate'}, plus 'votes' and
+            'required' while a rule is still waiting for more approvers
+
+    Raises:
+        ApprovalError: if the decision is invalid or provisioning fails; `transient` when
+            a dependency outage was the cause and the decision can be retried
+    """
+    if traceparent is None:
+        traceparent = request_state.get_state(rd, request_id).get('traceparent')
+    tracing.start_trace(traceparent)
+    with tracing.span('approve.process_decision', request_id=request_id, approver=approver_email) as span:
+        result = _apply_decision(rd, request_id, approval_action, approver_email, iam_client, http, auto_approve)
+        span.set_attribute('decision', result['decision'])
+        span.set_attribute('duplicate', result['duplicate'])
+        return result
+
+def _apply_decision(rd, request_id, approval_action, approver_email, iam_client, http, auto_approve=False):
+    # Short-circuit redelivered decisions before any IAM or Slack work
+    decision = 'approve' if approval_action in ['approve', 'approved'] else 'deny'
+    delivery_id = f"decision:{decision}:{approver_email}"  # per approver, for rules needing several
+    with tracing.span('redis.claim'):
+        first, _ = idempotency.claim(rd, request_id, delivery_id)
+    if not first:
+        print(f"✅ Decision '{decision}' for request ID {request_id} was already processed.")
+        return {'request_id': request_id, 'decision': decision, 'policy_arn': None, 'duplicate': True}
+
+    try:
+        approval_request = retrieve_approval_request(rd, request_id)
+
+        # Validate inputs and permissions
+        ballot = validate_inputs_and_permissions(approval_action, approval_request, request_id, approver_email,
+                                                 auto_approve, rd)
+
+        # Rules such as "prod writes need 2 approvers" hold the request until enough distinct votes
+        request = approval_request[request_id]
+        if ballot.status is not None:
+            print(f"✅ Request ID {request_id} is already {ballot.status}; the approval was not recorded.")
+            return {'request_id': request_id, 'decision': decision, 'policy_arn': None, 'duplicate': True}
+        required = ballot.verdict.required_approvals
+        if ballot.votes is not None and ballot.votes < required:
+            print(f"✅ Approval {ballot.votes}/{required} recorded for request ID {request_id}.")
+            audit.record(rd, audit.VOTED, request_id, user=request['user_email'], actor=approver_email,
+                         votes=ballot.votes, required=required)
+            return {'request_id': request_id, 'decision': decision, 'policy_arn': None, 'duplicate': False,
+                    'votes': ballot.votes, 'required': required}
+
+        # Only the approver who wins pending -> approved/denied goes on to the side effects
+        hook = request_state.chain(
+            audit.transition_hook(request_id, user=request['user_email'], actor=approver_email,
+                                  account=request.get('aws_account_id')),
+            metrics.transition_hook(approval_wait_seconds=metrics.seconds_since(request.get('requested_at'))))
+        to_state = request_state.APPROVED if decision == 'approve' else request_state.DENIED
+        # The approval's resume point: which stages after pending -> approved are done
+        checkpoint = resilience.Checkpoint(rd, f"approve:{request_id}")
+        if decision == 'approve':
+            hook = request_state.chain(
+                hook, lambda pipe, from_state, to_state: checkpoint.mark('approved_by', approver_email, pipe=pipe))
+        moved = request_state.transition(rd, request_id, to_state, fields={'decided_by': approver_email},
+                                         pipeline_hook=hook)
+        stages = {}
+        if not moved.ok:
+            if moved.from_state in (request_state.APPROVED, request_state.PROVISIONED) and decision == 'approve':
+                stages = checkpoint.stages
+            if stages.get('approved_by') != approver_email:
+                print(f"✅ Request ID {request_id} is already {moved.from_state}; '{decision}' was not applied.")
+                return {'request_id': request_id, 'decision': decision, 'policy_arn': None, 'duplicate': True}
+            print(f"⏭️ Resuming the approval of request ID {request_id} after: {', '.join(stages)}")
+
+        # Process approval action
+        policy_arn = None
+        if decision == 'approve':
+            started = time.perf_counter()
+            if 'policy' in stages:
+                policy_arn, expires_at = stages['policy']['arn'], grants.parse_time(stages['policy']['expires_at'])
+            else:
+                expires_at = grant_expiry(request['ttl_min'])
+                try:
+                    iam_client = iam_client or create_iam_client()
+                    validate_aws_policy(request['llm_policy'], iam_client, rd)
+                    audit.record(rd, audit.VALIDATED, request_id, user=request['user_email'], actor=approver_email)
+                    policy_arn = create_iam_policy(approval_request, request_id, iam_client, validate=False,
+                                                   expires_at=expires_at, rd=rd)
+                except BaseException:
+                    # Nothing was provisioned; reopen the request so the decision can be retried
+                    request_state.transition(rd, request_id, request_state.PENDING,
+                                             pipeline_hook=request_state.chain(
+                                                 metrics.transition_hook(),
+                                                 lambda pipe, from_state, to_state: checkpoint.clear(pipe)))
+                    raise
+                checkpoint.mark('policy', {'arn': policy_arn, 'expires_at': expires_at.isoformat()})
+            if 'provisioned' not in stages:
+                hook = request_state.chain(
+                    audit.transition_hook(request_id, user=request['user_email'], actor=approver_email,
+                                          account=request.get('aws_account_id'), policy_arn=policy_arn),
+                    metrics.transition_hook(provisioning_seconds=time.perf_counter() - started,
+                                            time_to_access_seconds=metrics.seconds_since(request.get('requested_at'))),
+                    lambda pipe, from_state, to_state: checkpoint.mark('provisioned', pipe=pipe))
+                request_state.transition(rd, request_id, request_state.PROVISIONED,
+                                         fields={'policy_arn': policy_arn, 'policy_version': 'v1',
+                                                 'expires_at': expires_at.isoformat()},
+                                         pipeline_hook=hook)
+            schedule_policy_deletion(approval_request, request_id, policy_arn, http, expires_at, rd)
+            # Scheduled was the last stage to resume: the approval is complete
+            pipe = rd.pipeline()
+            audit.record(pipe, audit.SCHEDULED, request_id, user=request['user_email'], actor=approver_email,
+                         policy_arn=policy_arn, expires_at=expires_at.isoformat())
+            checkpoint.clear(pipe)
+            pipe.execute()
+    except BaseException:
+        # A failed attempt must not block a retry of the same decision
+        idempotency.release(rd, request_id, delivery_id)
+        raise
 
-    # Validate inputs and permissions
-    validate_inputs_and_permissions(approval_action, approval_request, request_id)
-    
-    # Process approval action
-    if approval_action in ['approve', 'approved']:
-        policy_arn = create_iam_policy(approval_request, request_id)
-        schedule_policy_deletion(approval_request, request_id, policy_arn)
-    
     # Send Slack notification
     slack_channel_id = approval_request[request_id]['slack_channel_id']
     user_email = approval_request[request_id]['user_email']
@@ -211,6 +384,181 @@ def main():
                 Here is the policy requested: \n \
                 {approval_request} \n\n\n"
     send_slack_message(slack_channel_id, message, SLACK_API_TOKEN)
+    return {'request_id': request_id, 'decision': decision, 'policy_arn': policy_arn, 'duplicate': False}
+
+def process_extension(rd, request_id, ttl_minutes, approver_email=APPROVER_USER_EMAIL, policy=None,
+                      iam_client=None):
+    """Extend a provisioned grant, and optionally change its permissions, in place.
+
+    The grant's policy gets a new default version with the later expiry (and the new
+    document): no new policy, no re-attachment and no new scheduled task, since the
+    pending expiry task re-arms itself when it finds the grant extended. The whole
+    grant, extension included, must be allowed to `approver_email` by a rule needing
+    a single approver; anything stricter needs a new request.
+
+    Args:
+        rd (redis.Redis): Redis client
+        request_id (str): the request ID
+        ttl_minutes (int): how much longer the grant lasts
+        approver_email (str): who extends it
+        policy (dict|str, optional): new policy document for the grant
+        iam_client: IAM client, created from the configured credentials when None
+
+    Returns:
+        dict: {'request_id', 'policy_arn', 'policy_version', 'expires_at'}
+
+    Raises:
+        ApprovalError: if the grant is not provisioned or the extension is not allowed
+    """
+    state = request_state.get_state(rd, request_id)
+    if state['status'] != request_state.PROVISIONED:
+        raise ApprovalError(f"Request ID {request_id} is {state['status']}; only provisioned grants can be extended.")
+    # One extension per state version: a concurrent one would build on the same expiry
+    delivery_id = f"extend:{state['version']}"
+    first, _ = idempotency.claim(rd, request_id, delivery_id)
+    if not first:
+        raise ApprovalError(f"Request ID {request_id} is already being extended; retry once it is done.")
+    try:
+        approval_request = retrieve_approval_request(rd, request_id)
+        request = approval_request[request_id]
+        now = datetime.now(timezone.utc)
+        started_at = grants.parse_time(state.get('approved_at')) or now
+        expires_at = max(grants.parse_time(state.get('expires_at')) or now, now) + timedelta(minutes=ttl_minutes)
+        total_minutes = int((expires_at - started_at).total_seconds() // 60)
+
+        document = request['llm_policy'] if policy is None else records.canonical_policy(policy).decode('utf-8')
+        verdict = rules.get_engine(default_approvers=APPROVING_USERS).evaluate(
+            request.get('aws_account_id'), document, total_minutes, request['user_email'], approver_email,
+            resolve=lambda email, group_id: check_user_group_via_api(email, group_id, rd))
+        if not verdict.allowed:
+            raise ApprovalError(f"User {approver_email} may not extend request ID {request_id}: {verdict.reason}.")
+        if verdict.required_approvals > 1:
+            raise ApprovalError(f"Extending request ID {request_id} needs {verdict.required_approvals} approvers; "
+                                f"submit a new request instead.")
+
+        iam_client = iam_client or create_iam_client()
+        if policy is not None:
+            validate_aws_policy(document, iam_client, rd)
+        try:
+            version = resilience.dependency('iam', rd).call(grants.put_version, iam_client, state['policy_arn'],
+                                                            grants.with_expiry(document, expires_at))
+        except (grants.GrantError, resilience.DependencyError) as e:
+            raise ApprovalError(f"Error extending request ID {request_id}: {e}") from e
+
+        stored = {k: v for k, v in request.items() if k != 'status'}
+        stored.update(llm_policy=document, ttl_min=total_minutes)
+
+        def hook(pipe, from_state, to_state):
+            # The stored request follows the grant, so later extensions are checked against it
+            pipe.delete(str(request_id))
+            records.store_request(pipe, request_id, stored)
+            audit.record(pipe, audit.EXTENDED, request_id, user=request['user_email'], actor=approver_email,
+                         account=request.get('aws_account_id'), policy_arn=state['policy_arn'],
+                         policy_version=version, expires_at=expires_at.isoformat(), changed=policy is not None)
+            metrics.incr(pipe, 'grants_extended_total')
+
+        moved = request_state.transition(rd, request_id, request_state.PROVISIONED,
+                                         fields={'expires_at': expires_at.isoformat(), 'policy_version': version},
+                                         from_states={request_state.PROVISIONED}, pipeline_hook=hook)
+        if not moved.ok:
+            raise ApprovalError(f"Request ID {request_id} became {moved.from_state} while it was being extended.")
+    except BaseException:
+        idempotency.release(rd, request_id, delivery_id)
+        raise
+
+    print(f"✅ Request ID {request_id} extended until {expires_at.isoformat()} ({version}).")
+    message = (f"<@{request['user_email']}>, your access for request {request_id} has been extended until "
+               f"{expires_at.isoformat()}" + (" with an updated policy." if policy is not None else "."))
+    send_slack_message(request['slack_channel_id'], message, SLACK_API_TOKEN)
+    return {'request_id': request_id, 'policy_arn': state['policy_arn'], 'policy_version': version,
+            'expires_at': expires_at.isoformat()}
+
+def process_expiry(rd, request_id, iam_client=None, http=requests):
+    """Run a grant's scheduled expiry.
+
+    A grant extended since the task was scheduled is re-armed for its new expiry;
+    otherwise its policy is detached and deleted and the request moves to expired.
+    A grant stored without an expiry ends at its provisioning time plus the TTL of
+    its record; one whose end cannot be told at all is left alone.
+
+    Returns:
+        dict: {'request_id', 'policy_arn', 'expired', 'expires_at'}
+
+    Raises:
+        ApprovalError: if the grant's end is unknown or its policy cannot be deleted
+    """
+    state = request_state.get_state(rd, request_id)
+    policy_arn = state.get('policy_arn')
+    if state['status'] != request_state.PROVISIONED:
+        print(f"✅ Request ID {request_id} is {state['status']}; nothing to expire.")
+        return {'request_id': request_id, 'policy_arn': policy_arn, 'expired': False, 'expires_at': None}
+    approval_request = retrieve_approval_request(rd, request_id)
+    request = approval_request[request_id]
+
+    expires_at = grants.grant_end(state, request.get('ttl_min'))
+    if expires_at is None:
+        raise ApprovalError(f"Request ID {request_id} has no expiry and no TTL; not deleting {policy_arn}.")
+    if expires_at > datetime.now(timezone.utc):
+        schedule_policy_deletion(approval_request, request_id, policy_arn, http, expires_at, rd)
+        audit.record(rd, audit.SCHEDULED, request_id, user=request['user_email'], policy_arn=policy_arn,
+                     expires_at=expires_at.isoformat(), rearmed=True)
+        print(f"✅ Request ID {request_id} was extended; expiry moved to {expires_at.isoformat()}.")
+        return {'request_id': request_id, 'policy_arn': policy_arn, 'expired': False,
+                'expires_at': expires_at.isoformat()}
+
+    iam_client = iam_client or create_iam_client()
+    try:
+        if not resilience.dependency('iam', rd).call(grants.delete_policy, iam_client, policy_arn):
+            print(f"⏭️ Policy {policy_arn} was already deleted.")
+    except Exception as e:
+        raise ApprovalError(f"Error deleting policy {policy_arn}: {e}") from e
+    hook = request_state.chain(
+        audit.transition_hook(request_id, user=request['user_email'], account=request.get('aws_account_id'),
+                              policy_arn=policy_arn),
+        metrics.transition_hook())
+    request_state.transition(rd, request_id, request_state.EXPIRED, pipeline_hook=hook)
+    print(f"✅ Request ID {request_id} expired; policy {policy_arn} deleted.")
+    send_slack_message(request['slack_channel_id'],
+                       f"<@{request['user_email']}>, your access for request {request_id} has expired.",
+                       SLACK_API_TOKEN)
+    return {'request_id': request_id, 'policy_arn': policy_arn, 'expired': True, 'expires_at': None}
+
+def main():
+    """Main function to process the approval request."""
+    # Parse command-line arguments
+    args = parse_arguments()
+    request_id, approval_action, traceparent = args.request_id, args.approval_action.lower(), args.traceparent
+
+    # Validate environment variables
+    validate_environment_variables()
+
+    # Create Redis client
+    rd = create_redis_client()
+
+    # Grant lifecycle actions on an already provisioned request
+    if approval_action in ('extend', 'expire'):
+        try:
+            if approval_action == 'extend':
+                process_extension(rd, request_id, rules.parse_ttl(args.ttl), policy=args.policy)
+            else:
+                process_expiry(rd, request_id)
+        except (ApprovalError, directory.DirectoryError, records.RecordError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        return
+
+    # Hand the decision to the approval workers and return immediately
+    if args.enqueue:
+        message_id = approval_worker.enqueue_decision(rd, request_id, approval_action, APPROVER_USER_EMAIL,
+                                                      traceparent)
+        print(f"✅ Decision for request ID {request_id} queued as {message_id}.")
+        return
+
+    try:
+        process_decision(rd, request_id, approval_action, traceparent=traceparent)
+    except (ApprovalError, directory.DirectoryError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
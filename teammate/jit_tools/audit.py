@@ -0,0 +1,251 @@
+"""Append-only audit trail for the JIT lifecycle.
+
+Every stage appends one compact event to a Redis Stream; the stream is trimmed by
+age on write. `compact` moves a finished UTC day into a columnar archive file
+(parquet when pyarrow is installed, column-major gzipped JSON otherwise) and
+`query` answers "who had what access when" from the archive instead of logs:
+
+    python audit.py compact --day 2024-11-02 --archive_dir /var/lib/jit-audit
+    python audit.py query --user jane@example.com --since 2024-11-01 --until 2024-11-07
+"""
+import os
+import json
+import gzip
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+# pyarrow is only needed for parquet archives
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL')
+BACKEND_PORT = os.getenv('BACKEND_PORT')
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+AUDIT_STREAM = os.getenv('JIT_AUDIT_STREAM', 'jit:audit')
+AUDIT_RETENTION_DAYS = int(os.getenv('JIT_AUDIT_RETENTION_DAYS', '30'))  # days kept in the stream
+AUDIT_ARCHIVE_DIR = os.getenv('JIT_AUDIT_ARCHIVE_DIR', './jit-audit')
+COMPACTED_KEY = 'jit:audit:compacted'  # last archived day, YYYY-MM-DD
+PAGE_SIZE = 1000
+
+# Lifecycle stages
+CREATED = 'created'
+POLICY_GENERATED = 'policy_generated'
+VALIDATED = 'validated'
+VOTED = 'voted'  # one of several required approvals
+APPROVED = 'approved'
+DENIED = 'denied'
+POLICY_CREATED = 'policy_created'
+SCHEDULED = 'scheduled'
+EXTENDED = 'extended'  # new expiry and/or policy version on a provisioned grant
+EXPIRED = 'expired'
+REVOKED = 'revoked'
+REAPED = 'reaped'  # orphaned policy deleted by the reaper
+
+# request_state target state -> audit stage
+STATE_STAGES = {
+    'approved': APPROVED,
+    'denied': DENIED,
+    'provisioned': POLICY_CREATED,
+    'expired': EXPIRED,
+    'revoked': REVOKED,
+}
+
+AUDIT_COLUMNS = ['ts', 'stage', 'request_id', 'user', 'actor', 'account', 'policy_arn', 'detail']
+
+
+def create_redis_client():
+    return redis.Redis(host=BACKEND_URL, port=BACKEND_PORT, password=BACKEND_PASS)
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def record(rd, stage, request_id, user=None, actor=None, account=None, policy_arn=None, **detail):
+    """Append one audit event.
+
+    `rd` may be a client or a pipeline, so the event can be written in the same
+    transaction as the change it describes. Events older than AUDIT_RETENTION_DAYS
+    are trimmed (approximately) on every write.
+
+    Args:
+        rd (redis.Redis): Redis client or pipeline
+        stage (str): lifecycle stage, e.g. audit.APPROVED
+        request_id (str): the request ID
+        user (str): whose access this is about
+        actor (str): who caused the event, e.g. the approver
+        account (str): AWS account ID
+        policy_arn (str): IAM policy ARN once it exists
+        **detail: small extra values, stored as one compact JSON field
+    """
+    fields = {'stage': stage, 'request_id': request_id, 'user': user, 'actor': actor,
+              'account': account, 'policy_arn': policy_arn}
+    fields = {k: v for k, v in fields.items() if v}
+    detail = {k: v for k, v in detail.items() if v is not None}
+    if detail:
+        fields['detail'] = json.dumps(detail, separators=(',', ':'), default=str)
+    oldest = datetime.now(timezone.utc) - timedelta(days=AUDIT_RETENTION_DAYS)
+    return rd.xadd(AUDIT_STREAM, fields, minid=int(oldest.timestamp() * 1000), approximate=True)
+
+
+def transition_hook(request_id, user=None, actor=None, **detail):
+    """request_state pipeline hook that records the transition in the same MULTI/EXEC."""
+    def hook(pipe, from_state, to_state):
+        if to_state in STATE_STAGES:
+            record(pipe, STATE_STAGES[to_state], request_id, user=user, actor=actor,
+                   from_state=from_state, **detail)
+    return hook
+
+
+def _day_bounds(day):
+    start = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    start_ms = int(start.timestamp() * 1000)
+    return start_ms, start_ms + 24 * 60 * 60 * 1000 - 1
+
+
+def iter_stream(rd, start_ms, end_ms):
+    """Yield decoded events between two millisecond timestamps, a page at a time."""
+    low = f"{start_ms}-0"
+    while True:
+        page = rd.xrange(AUDIT_STREAM, min=low, max=f"{end_ms}-18446744073709551615", count=PAGE_SIZE)
+        for message_id, fields in page:
+            event = {_decode(k): _decode(v) for k, v in fields.items()}
+            event['ts'] = int(_decode(message_id).split('-')[0])
+            yield event
+        if len(page) < PAGE_SIZE:
+            return
+        low = '(' + _decode(page[-1][0])
+
+
+def archive_path(archive_dir, day):
+    ext = 'parquet' if pq is not None else 'json.gz'
+    return os.path.join(archive_dir, f"audit-{day}.{ext}")
+
+
+def compact(rd, day, archive_dir=AUDIT_ARCHIVE_DIR):
+    """Write all events of one UTC day to a columnar archive file.
+
+    Returns:
+        tuple: (archive path, number of events)
+    """
+    columns = {column: [] for column in AUDIT_COLUMNS}
+    for event in iter_stream(rd, *_day_bounds(day)):
+        for column in AUDIT_COLUMNS:
+            columns[column].append(event.get(column))
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(archive_dir, day)
+    tmp_path = path + '.tmp'
+    if pq is not None:
+        schema = pa.schema([(c, pa.int64() if c == 'ts' else pa.string()) for c in AUDIT_COLUMNS])
+        pq.write_table(pa.table(columns, schema=schema), tmp_path, compression='zstd')
+    else:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({'columns': AUDIT_COLUMNS, 'data': columns}, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    rd.set(COMPACTED_KEY, max(day, _decode(rd.get(COMPACTED_KEY)) or ''))
+    return path, len(columns['ts'])
+
+
+def compact_pending(rd, archive_dir=AUDIT_ARCHIVE_DIR, today=None):
+    """Archive every finished day after the last compacted one."""
+    today = today or datetime.now(timezone.utc).date()
+    last = _decode(rd.get(COMPACTED_KEY))
+    if last:
+        day = datetime.strptime(last, '%Y-%m-%d').date() + timedelta(days=1)
+    else:
+        day = today - timedelta(days=AUDIT_RETENTION_DAYS)
+    results = []
+    while day < today:
+        results.append(compact(rd, day.isoformat(), archive_dir))
+        day += timedelta(days=1)
+    return results
+
+
+def _read_archive(path, columns, filters):
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ImportError("pyarrow is required to read parquet archives")
+        table = pq.read_table(path, columns=columns, filters=filters or None)
+        return table.to_pylist()
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)['data']
+    rows = [dict(zip(columns, values)) for values in zip(*(data[c] for c in columns))]
+    return [row for row in rows if all(row[c] == v for c, _, v in filters)]
+
+
+def query(since, until, archive_dir=AUDIT_ARCHIVE_DIR, user=None, request_id=None, stage=None,
+          columns=AUDIT_COLUMNS):
+    """Scan the archive files for days in [since, until] and return matching events.
+
+    Args:
+        since (str): first day, YYYY-MM-DD
+        until (str): last day, YYYY-MM-DD
+        user, request_id, stage (str, optional): equality filters
+        columns (list): columns to read; parquet only reads these from disk
+
+    Returns:
+        list: events ordered by time
+    """
+    filters = [(c, '==', v) for c, v in (('user', user), ('request_id', request_id), ('stage', stage)) if v]
+    columns = list(dict.fromkeys(list(columns) + [c for c, _, _ in filters] + ['ts']))
+    day, last = datetime.strptime(since, '%Y-%m-%d').date(), datetime.strptime(until, '%Y-%m-%d').date()
+    events = []
+    while day <= last:
+        for ext in ('parquet', 'json.gz'):
+            path = os.path.join(archive_dir, f"audit-{day.isoformat()}.{ext}")
+            if os.path.exists(path):
+                events.extend(_read_archive(path, columns, filters))
+        day += timedelta(days=1)
+    return sorted(events, key=lambda e: e['ts'])
+
+
+def access_windows(events):
+    """Fold events into grants: one {request_id, user, account, policy_arn, granted_at, revoked_at} per policy."""
+    grants = {}
+    for event in events:
+        if event['stage'] == POLICY_CREATED:
+            grants[event['request_id']] = {'request_id': event['request_id'], 'user': event.get('user'),
+                                           'account': event.get('account'), 'policy_arn': event.get('policy_arn'),
+                                           'granted_at': event['ts'], 'revoked_at': None}
+        elif event['stage'] in (EXPIRED, REVOKED) and event['request_id'] in grants:
+            grants[event['request_id']]['revoked_at'] = event['ts']
+    return list(grants.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and query the JIT audit trail.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compact_parser = subparsers.add_parser('compact', help="Archive finished days from the audit stream.")
+    compact_parser.add_argument("--day", help="Archive only this UTC day (YYYY-MM-DD).")
+    compact_parser.add_argument("--archive_dir", default=AUDIT_ARCHIVE_DIR)
+    query_parser = subparsers.add_parser('query', help="Query the archive.")
+    query_parser.add_argument("--since", required=True, help="First day (YYYY-MM-DD).")
+    query_parser.add_argument("--until", default=datetime.now(timezone.utc).date().isoformat(), help="Last day.")
+    query_parser.add_argument("--user")
+    query_parser.add_argument("--request_id")
+    query_parser.add_argument("--stage")
+    query_parser.add_argument("--grants", action='store_true', help="Summarize events as access windows.")
+    query_parser.add_argument("--archive_dir", default=AUDIT_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        rd = create_redis_client()
+        results = [compact(rd, args.day, args.archive_dir)] if args.day else compact_pending(rd, args.archive_dir)
+        for path, count in results:
+            print(f"✅ Archived {count} events to {path}")
+        return
+
+    stage = None if args.grants else args.stage
+    events = query(args.since, args.until, args.archive_dir, args.user, args.request_id, stage)
+    for row in access_windows(events) if args.grants else events:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Approver directory: Kubiya group memberships cached in Redis.
+
+Each group is kept as a Redis set of lower-cased member emails, so a membership
+check is one SISMEMBER instead of a call to the Kubiya groups API. Entries are
+refreshed after JIT_GROUP_REFRESH seconds; a stale entry is still answered from
+the cache while it is refreshed in the background, and keeps answering through
+API outages until it is JIT_GROUP_MAX_STALE seconds old. Only one process
+refreshes a group at a time. Stale entries are refreshed in a background thread
+only in long-running processes (those that called start_refresher); a one-shot
+CLI run refreshes inline, as its daemon threads die with it.
+
+    python directory.py --refresh <group id> [<group id> ...]
+    python directory.py --check user@example.com <group id>
+"""
+import os
+import re
+import sys
+import time
+import secrets
+import argparse
+import threading
+
+import redis
+import requests
+
+try:
+    from shared import resilience
+except ImportError:  # shipped flat next to this script
+    import resilience
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL')
+BACKEND_PORT = os.getenv('BACKEND_PORT')
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+JIT_API_KEY = os.getenv('JIT_API_KEY')
+KUBIYA_API_URL = os.getenv('KUBIYA_API_URL', 'https://api.kubiya.ai/api/v1/')
+GROUP_REFRESH = int(os.getenv('JIT_GROUP_REFRESH', '300'))  # seconds before a cached group is refreshed
+GROUP_MAX_STALE = int(os.getenv('JIT_GROUP_MAX_STALE', str(6 * 60 * 60)))  # seconds a cached group may be served
+GROUP_PREFIX = 'jit:groups:'
+FETCHED_KEY = GROUP_PREFIX + 'fetched'  # hash: group id -> epoch seconds of the last successful fetch
+LOCK_SECONDS = 30
+EMAIL_KEYS = ('email', 'emailaddress', 'user_email', 'mail')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class DirectoryError(Exception):
+    """Raised when a group is neither cached within the staleness bound nor fetchable."""
+
+
+def create_redis_client():
+    return redis.Redis(host=BACKEND_URL, port=BACKEND_PORT, password=BACKEND_PASS)
+
+
+def members_key(group_id):
+    return f"{GROUP_PREFIX}{group_id}"
+
+
+def _lock_key(group_id):
+    return f"{GROUP_PREFIX}{group_id}:refreshing"
+
+
+def extract_emails(document):
+    """Member emails from a groups API response, whatever its nesting.
+
+    Accepts a plain list of emails as well as objects with member/user lists; only
+    values that are emails are collected, not every string that contains one.
+    """
+    found = set()
+
+    def walk(node, key=None):
+        if isinstance(node, dict):
+            for k, v in node.items():
+                walk(v, k.lower() if isinstance(k, str) else None)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, key)
+        elif isinstance(node, str) and EMAIL_PATTERN.match(node.strip()):
+            if key is None or key in EMAIL_KEYS or key in ('members', 'users', 'emails'):
+                found.add(node.strip().lower())
+    walk(document)
+    return found
+
+
+def fetch_group(group_id, http=requests, rd=None):
+    """Members of a Kubiya group straight from the API, retried and behind the Kubiya breaker.
+
+    Raises:
+        resilience.DependencyError: if the API is still failing after retries, or its breaker is open
+        requests.HTTPError: for any other error response
+    """
+    response = resilience.dependency('kubiya', rd).request(
+        http, 'GET', f"{KUBIYA_API_URL.rstrip('/')}/manage/groups/{group_id}",
+        headers={'Authorization': f'UserKey {JIT_API_KEY}'})
+    response.raise_for_status()
+    return extract_emails(response.json())
+
+
+def store_group(rd, group_id, members, fetched_at=None):
+    """Replace the cached members atomically; the entry expires once past the staleness bound."""
+    key = members_key(group_id)
+    pipe = rd.pipeline()
+    pipe.delete(key)
+    if members:
+        pipe.sadd(key, *members)
+        pipe.expire(key, GROUP_MAX_STALE)
+    pipe.hset(FETCHED_KEY, group_id, fetched_at or time.time())
+    pipe.execute()
+
+
+# Set once start_refresher runs: this process lives long enough to finish background refreshes
+_long_running = False
+
+
+def _acquire(rd, group_id):
+    """Take the refresh lock of a group; returns the owner token, or None if another process holds it."""
+    token = secrets.token_hex(8)
+    return token if rd.set(_lock_key(group_id), token, nx=True, ex=LOCK_SECONDS) else None
+
+
+def _release(rd, group_id, token):
+    """Delete the refresh lock only if it is still ours, not one taken after ours expired."""
+    key = _lock_key(group_id)
+    with rd.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            owner = pipe.get(key)
+            if (owner.decode() if isinstance(owner, bytes) else owner) != token:
+                return False
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+
+
+def refresh(rd, group_id, http=requests):
+    """Fetch and cache one group; returns its members."""
+    members = fetch_group(group_id, http, rd)
+    store_group(rd, group_id, members)
+    return members
+
+
+def _refresh_stale(rd, group_id, http, background):
+    """Refresh a stale group; returns the fresh members when refreshed inline, else None."""
+    # One process refreshes a group at a time; the others keep serving the cached entry
+    token = _acquire(rd, group_id)
+    if token is None:
+        return None
+
+    def run():
+        try:
+            return refresh(rd, group_id, http)
+        except Exception as e:
+            print(f"❌ Refresh of group {group_id} failed: {e}")
+        finally:
+            _release(rd, group_id, token)
+    if background:
+        threading.Thread(target=run, name=f"group-refresh-{group_id}", daemon=True).start()
+        return None
+    return run()
+
+
+def is_member(rd, group_id, email, http=requests, background=None):
+    """O(1) membership check against the cache, refreshing it as needed.
+
+    A stale entry is refreshed in a background thread when `background` is true
+    (default: only in long-running processes) and inline otherwise.
+
+    Raises:
+        DirectoryError: if the group is not cached within GROUP_MAX_STALE and the API fails
+    """
+    email = (email or '').strip().lower()
+    pipe = rd.pipeline(transaction=False)
+    pipe.hget(FETCHED_KEY, group_id)
+    pipe.sismember(members_key(group_id), email)
+    fetched_at, member = pipe.execute()
+    age = time.time() - float(fetched_at) if fetched_at else None
+    if age is not None and age < GROUP_REFRESH:
+        return bool(member)
+    if age is not None and age < GROUP_MAX_STALE:
+        members = _refresh_stale(rd, group_id, http, _long_running if background is None else background)
+        return email in members if members is not None else bool(member)
+    try:
+        return email in refresh(rd, group_id, http)
+    except Exception as e:
+        raise DirectoryError(f"group {group_id} is not cached and could not be fetched: {e}")
+
+
+def prefetch(rd, group_ids, http=requests):
+    """Refresh every group that is missing or due; returns {group id: member count or error}."""
+    fetched = rd.hgetall(FETCHED_KEY)
+    now, result = time.time(), {}
+    for group_id in group_ids:
+        at = fetched.get(group_id.encode()) or fetched.get(group_id)
+        if at and now - float(at) < GROUP_REFRESH:
+            continue
+        try:
+            result[group_id] = len(refresh(rd, group_id, http))
+        except Exception as e:
+            result[group_id] = f"error: {e}"
+    return result
+
+
+def start_refresher(rd, group_ids, http=requests, interval=None):
+    """Keep `group_ids` warm from a daemon thread, e.g. in the approval workers."""
+    global _long_running
+    _long_running = True
+    interval = interval or max(GROUP_REFRESH // 2, 1)
+    group_ids = list(group_ids)
+
+    def run():
+        while True:
+            try:
+                for group_id in group_ids:
+                    token = _acquire(rd, group_id)
+                    if token:
+                        try:
+                            prefetch(rd, [group_id], http)
+                        finally:
+                            _release(rd, group_id, token)
+            except Exception as e:
+                print(f"❌ Group refresh failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name='group-refresher', daemon=True)
+    if group_ids:
+        thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the cached approver directory.")
+    parser.add_argument("--refresh", nargs='+', metavar='GROUP_ID', help="Fetch and cache these groups now.")
+    parser.add_argument("--check", nargs=2, metavar=('EMAIL', 'GROUP_ID'), help="Check a membership.")
+    args = parser.parse_args()
+    rd = create_redis_client()
+    if args.refresh:
+        for group_id in args.refresh:
+            members = refresh(rd, group_id)
+            print(f"✅ Group {group_id}: {len(members)} members cached")
+    if args.check:
+        try:
+            member = is_member(rd, args.check[1], args.check[0])
+        except DirectoryError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"{'✅' if member else '❌'} {args.check[0]} {'is' if member else 'is not'} in group {args.check[1]}")
+
+
+if __name__ == "__main__":
+    main()
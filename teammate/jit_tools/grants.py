@@ -0,0 +1,180 @@
+"""Managed policy lifecycle of a grant: versions instead of create/delete churn.
+
+A grant is one customer managed policy for its whole life. Its expiry is part of
+the document, as an aws:CurrentTime condition on every Allow statement, so
+extending a grant or changing its permissions is a single CreatePolicyVersion
+(set as default) on the same policy: no new IAM entity, no re-attachment and no
+new scheduled task, and access ends on time even if the scheduled expiry runs
+late. IAM keeps at most five versions of a policy; the oldest non-default version
+is pruned when that limit is hit.
+
+Expiry deletes the policy once its last version has expired, after detaching it
+and deleting its non-default versions, which IAM requires.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+try:
+    from shared import tracing
+except ImportError:  # shipped flat next to this script
+    import tracing
+
+# Constants and configuration
+MAX_VERSIONS = 5  # IAM limit per managed policy
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+REQUEST_TAG = 'kubiya-jit-request-id'  # tag naming the request a grant's policy was created for
+
+
+class GrantError(Exception):
+    """Raised when a grant's managed policy cannot be created, updated or removed."""
+
+
+def parse_time(value):
+    """Aware datetime from an ISO timestamp (naive ones are UTC), or None."""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00')) if isinstance(value, str) else value
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def grant_end(state, ttl_minutes=None):
+    """End of a provisioned grant: its stored expiry, else provisioning (or approval) time plus the TTL.
+
+    Returns None when neither is known.
+    """
+    expires_at = parse_time(state.get('expires_at'))
+    if expires_at is not None:
+        return expires_at
+    started = parse_time(state.get('provisioned_at') or state.get('approved_at'))
+    if started is None or ttl_minutes in (None, ''):
+        return None
+    return started + timedelta(minutes=int(ttl_minutes))
+
+
+def with_expiry(policy, expires_at):
+    """Copy of `policy` whose Allow statements only apply before `expires_at`.
+
+    Args:
+        policy (dict|str): the policy document
+        expires_at (datetime): end of the grant
+
+    Returns:
+        str: the policy document as JSON
+    """
+    document = json.loads(policy) if isinstance(policy, str) else json.loads(json.dumps(policy))
+    statements = document.get('Statement')
+    for statement in statements if isinstance(statements, list) else [statements]:
+        if not isinstance(statement, dict) or statement.get('Effect') != 'Allow':
+            continue
+        conditions = statement.setdefault('Condition', {})
+        conditions.setdefault('DateLessThan', {})['aws:CurrentTime'] = expires_at.astimezone(timezone.utc).strftime(TIME_FORMAT)
+    return json.dumps(document, sort_keys=True, separators=(',', ':'))
+
+
+def create_policy(iam_client, policy_name, document, request_id, account_id=None):
+    """Create a grant's policy, tagged with its request, and return its ARN.
+
+    CreatePolicy is not idempotent: a call that timed out after IAM applied it is
+    retried into EntityAlreadyExists. The existing policy is then taken over only
+    if its REQUEST_TAG names `request_id`, i.e. the earlier attempt created it; a
+    policy of the same name that belongs to anything else is never adopted, since
+    expiring the grant would detach and delete it. The ARN is built from
+    `account_id`, or from the calling user's account when not given.
+
+    Raises:
+        GrantError: if a policy called `policy_name` exists and was not created for `request_id`
+    """
+    try:
+        with tracing.span('iam.create_policy', policy_name=policy_name):
+            return iam_client.create_policy(PolicyName=policy_name, PolicyDocument=document,
+                                            Tags=[{'Key': REQUEST_TAG, 'Value': request_id}])['Policy']['Arn']
+    except iam_client.exceptions.EntityAlreadyExistsException:
+        partition = 'aws'
+        if not account_id:
+            _, partition, _, _, account_id, _ = iam_client.get_user()['User']['Arn'].split(':', 5)
+        with tracing.span('iam.get_policy', policy_name=policy_name):
+            policy = iam_client.get_policy(PolicyArn=f"arn:{partition}:iam::{account_id}:policy/{policy_name}")['Policy']
+        if {t['Key']: t['Value'] for t in policy.get('Tags', [])}.get(REQUEST_TAG) != request_id:
+            raise GrantError(f"Policy {policy_name} already exists and was not created for request {request_id}.")
+        return policy['Arn']
+
+
+def _prune(iam_client, policy_arn):
+    """Delete the oldest non-default version to make room for a new one."""
+    with tracing.span('iam.list_policy_versions', policy_arn=policy_arn):
+        versions = iam_client.list_policy_versions(PolicyArn=policy_arn)['Versions']
+    old = sorted((v for v in versions if not v['IsDefaultVersion']),
+                 key=lambda v: (v['CreateDate'], int(v['VersionId'].lstrip('v') or 0)))
+    if not old:
+        raise GrantError(f"{policy_arn} has {len(versions)} versions and none can be pruned")
+    with tracing.span('iam.delete_policy_version', policy_arn=policy_arn, version=old[0]['VersionId']):
+        iam_client.delete_policy_version(PolicyArn=policy_arn, VersionId=old[0]['VersionId'])
+    return old[0]['VersionId']
+
+
+def put_version(iam_client, policy_arn, document):
+    """Make `document` the policy's default version; one IAM call unless five versions exist.
+
+    Returns:
+        str: the new version ID
+    """
+    for _ in range(MAX_VERSIONS):
+        try:
+            with tracing.span('iam.create_policy_version', policy_arn=policy_arn) as span:
+                version = iam_client.create_policy_version(PolicyArn=policy_arn, PolicyDocument=document,
+                                                           SetAsDefault=True)['PolicyVersion']['VersionId']
+                span.set_attribute('version', version)
+            return version
+        except iam_client.exceptions.LimitExceededException:
+            _prune(iam_client, policy_arn)
+        except iam_client.exceptions.NoSuchEntityException:
+            raise GrantError(f"policy {policy_arn} no longer exists")
+    raise GrantError(f"could not make room for a new version of {policy_arn}")
+
+
+def _detach(iam_client, policy_arn):
+    # every page: a policy attached to more than one page of entities cannot be deleted otherwise
+    paginator = iam_client.get_paginator('list_entities_for_policy')
+    with tracing.span('iam.list_entities_for_policy', policy_arn=policy_arn):
+        pages = list(paginator.paginate(PolicyArn=policy_arn))
+    for entities in pages:
+        for group in entities.get('PolicyGroups', []):
+            iam_client.detach_group_policy(GroupName=group['GroupName'], PolicyArn=policy_arn)
+        for user in entities.get('PolicyUsers', []):
+            iam_client.detach_user_policy(UserName=user['UserName'], PolicyArn=policy_arn)
+        for role in entities.get('PolicyRoles', []):
+            iam_client.detach_role_policy(RoleName=role['RoleName'], PolicyArn=policy_arn)
+
+
+def delete_policy(iam_client, policy_arn, bare=False):
+    """Detach the policy, delete its non-default versions and then the policy.
+
+    With `bare` (ListPolicies showed no attachments and a default version of v1) the
+    policy is deleted in one call, falling back to the full cleanup on a conflict.
+
+    Returns:
+        bool: False when the policy was already gone
+    """
+    if bare:
+        try:
+            with tracing.span('iam.delete_policy', policy_arn=policy_arn):
+                iam_client.delete_policy(PolicyArn=policy_arn)
+            return True
+        except iam_client.exceptions.NoSuchEntityException:
+            return False
+        except iam_client.exceptions.DeleteConflictException:
+            pass  # attached or versioned since it was listed
+    try:
+        _detach(iam_client, policy_arn)
+        with tracing.span('iam.list_policy_versions', policy_arn=policy_arn):
+            versions = iam_client.list_policy_versions(PolicyArn=policy_arn)['Versions']
+        for version in versions:
+            if not version['IsDefaultVersion']:
+                iam_client.delete_policy_version(PolicyArn=policy_arn, VersionId=version['VersionId'])
+        with tracing.span('iam.delete_policy', policy_arn=policy_arn):
+            iam_client.delete_policy(PolicyArn=policy_arn)
+    except iam_client.exceptions.NoSuchEntityException:
+        return False
+    return True
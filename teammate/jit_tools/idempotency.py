@@ -0,0 +1,63 @@
+import os
+import json
+import hashlib
+
+# Constants and configuration
+IDEMPOTENCY_TTL = int(os.getenv('JIT_IDEMPOTENCY_TTL', str(24 * 60 * 60)))  # seconds a delivery is remembered
+IDEMPOTENCY_PREFIX = 'jit:idem:'
+
+
+def delivery_key(request_id, delivery_id):
+    """Redis key remembering one delivery of one request."""
+    return f"{IDEMPOTENCY_PREFIX}{request_id}:{delivery_id}"
+
+
+def payload_digest(payload):
+    """Stable short digest of a JSON-able payload, used when no delivery ID is supplied."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def claim(rd, request_id, delivery_id, value='1', ttl=IDEMPOTENCY_TTL):
+    """Atomically claim a delivery with SET NX EX.
+
+    Only the first caller within the TTL window gets `True`; duplicates get `False`
+    together with the value stored by the first caller, so they can point at the
+    original result without redoing any LLM, IAM or Slack work.
+
+    Args:
+        rd (redis.Redis): Redis client
+        request_id (str): logical request ID
+        delivery_id (str): delivery ID (webhook delivery, action, payload digest)
+        value (str): value to remember for duplicates, e.g. the generated request ID
+        ttl (int): dedup window in seconds
+
+    Returns:
+        tuple: (first delivery?, stored value)
+    """
+    key = delivery_key(request_id, delivery_id)
+    if rd.set(key, value, nx=True, ex=ttl):
+        return True, value
+    return False, _decode(rd.get(key))
+
+
+async def aclaim(rd, request_id, delivery_id, value='1', ttl=IDEMPOTENCY_TTL):
+    """claim() for redis.asyncio clients."""
+    key = delivery_key(request_id, delivery_id)
+    if await rd.set(key, value, nx=True, ex=ttl):
+        return True, value
+    return False, _decode(await rd.get(key))
+
+
+def release(rd, request_id, delivery_id):
+    """Forget a claimed delivery so a retry can run after the first attempt failed."""
+    rd.delete(delivery_key(request_id, delivery_id))
+
+
+async def arelease(rd, request_id, delivery_id):
+    """release() for redis.asyncio clients."""
+    await rd.delete(delivery_key(request_id, delivery_id))
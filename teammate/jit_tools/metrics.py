@@ -0,0 +1,193 @@
+"""Incrementally maintained JIT metrics.
+
+Counters and fixed-bucket histograms live in a handful of Redis hashes and are
+updated with HINCRBY/HINCRBYFLOAT in the same pipeline as the state transition
+they describe, so reading them never touches the request keyspace. Quantiles are
+estimated from the buckets, the same way Prometheus' histogram_quantile does.
+
+    python metrics.py               # Prometheus text exposition
+    python metrics.py --format json # counters plus p50/p95/p99 per histogram
+"""
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+
+import redis
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL')
+BACKEND_PORT = os.getenv('BACKEND_PORT')
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+METRICS_PREFIX = 'jit:metrics:'
+COUNTERS_KEY = METRICS_PREFIX + 'counters'
+STATUS_KEY = METRICS_PREFIX + 'status'  # requests currently in each state
+
+# Upper bounds in seconds; wide enough for both LLM calls and approvers answering the next day
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800,
+           3600, 7200, 14400, 43200, 86400)
+
+HISTOGRAMS = {
+    'llm_seconds': "Time spent generating a policy with the LLM.",
+    'queue_wait_seconds': "Time a decision waited in the approval queue.",
+    'approval_wait_seconds': "Time from request to approve/deny decision.",
+    'provisioning_seconds': "Time spent validating and creating the IAM policy.",
+    'time_to_access_seconds': "Time from request to a usable policy.",
+}
+
+
+def create_redis_client():
+    return redis.Redis(host=BACKEND_URL, port=BACKEND_PORT, password=BACKEND_PASS)
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def histogram_key(name):
+    return f"{METRICS_PREFIX}hist:{name}"
+
+
+def seconds_since(iso_timestamp):
+    """Seconds elapsed since an ISO timestamp; naive timestamps are UTC. None if unparsable."""
+    try:
+        then = datetime.fromisoformat(iso_timestamp)
+    except (TypeError, ValueError):
+        return None
+    if then.tzinfo is None:
+        then = then.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - then).total_seconds()
+
+
+def incr(rd, name, amount=1):
+    """Increment a counter. `rd` may be a client or a pipeline."""
+    rd.hincrby(COUNTERS_KEY, name, amount)
+
+
+def observe(rd, name, seconds):
+    """Add one observation to a histogram. `rd` may be a client or a pipeline."""
+    if seconds is None or name not in HISTOGRAMS:
+        return
+    bucket = next((str(b) for b in BUCKETS if seconds <= b), '+Inf')
+    key = histogram_key(name)
+    rd.hincrby(key, bucket, 1)
+    rd.hincrby(key, 'count', 1)
+    rd.hincrbyfloat(key, 'sum', max(seconds, 0.0))
+
+
+def request_created(rd):
+    """Count a new pending request."""
+    incr(rd, 'requests_total')
+    rd.hincrby(STATUS_KEY, 'pending', 1)
+
+
+def transition_hook(**observations):
+    """request_state pipeline hook: moves the status gauges and records `observations`.
+
+    Example:
+        >>> transition(rd, request_id, APPROVED, pipeline_hook=transition_hook(approval_wait_seconds=42.0))
+    """
+    def hook(pipe, from_state, to_state):
+        incr(pipe, f"transitions_{to_state}_total")
+        if from_state != to_state:
+            pipe.hincrby(STATUS_KEY, from_state, -1)
+            pipe.hincrby(STATUS_KEY, to_state, 1)
+        for name, seconds in observations.items():
+            observe(pipe, name, seconds)
+    return hook
+
+
+def _snapshot(counters, status, histograms):
+    result = {'counters': {_decode(k): int(v) for k, v in counters.items()},
+              'status': {_decode(k): int(v) for k, v in status.items()},
+              'histograms': {}}
+    for name, raw in zip(HISTOGRAMS, histograms):
+        raw = {_decode(k): float(v) for k, v in raw.items()}
+        cumulative, running = [], 0
+        for bound in [str(b) for b in BUCKETS] + ['+Inf']:
+            running += int(raw.get(bound, 0))
+            cumulative.append((float(bound), running))
+        result['histograms'][name] = {'buckets': cumulative, 'count': int(raw.get('count', 0)),
+                                      'sum': raw.get('sum', 0.0)}
+    return result
+
+
+def collect(rd):
+    """Read all metrics in one round trip."""
+    pipe = rd.pipeline(transaction=False)
+    pipe.hgetall(COUNTERS_KEY)
+    pipe.hgetall(STATUS_KEY)
+    for name in HISTOGRAMS:
+        pipe.hgetall(histogram_key(name))
+    counters, status, *histograms = pipe.execute()
+    return _snapshot(counters, status, histograms)
+
+
+async def acollect(rd):
+    """collect() for redis.asyncio clients."""
+    async with rd.pipeline(transaction=False) as pipe:
+        pipe.hgetall(COUNTERS_KEY)
+        pipe.hgetall(STATUS_KEY)
+        for name in HISTOGRAMS:
+            pipe.hgetall(histogram_key(name))
+        counters, status, *histograms = await pipe.execute()
+    return _snapshot(counters, status, histograms)
+
+
+def quantile(histogram, q):
+    """Estimate the q-quantile (0..1) by linear interpolation inside the matching bucket."""
+    count = histogram['count']
+    if not count:
+        return None
+    rank, lower, below = q * count, 0.0, 0
+    for bound, cumulative in histogram['buckets']:
+        if cumulative >= rank:
+            if bound == float('inf'):
+                return lower
+            in_bucket = cumulative - below
+            return lower + (bound - lower) * ((rank - below) / in_bucket if in_bucket else 0)
+        lower, below = bound, cumulative
+    return lower
+
+
+def summary(snapshot):
+    """Counters, status gauges and p50/p95/p99 per histogram as plain JSON."""
+    return {'counters': snapshot['counters'],
+            'status': snapshot['status'],
+            'latency_seconds': {name: {'count': h['count'],
+                                       'mean': round(h['sum'] / h['count'], 3) if h['count'] else None,
+                                       **{f"p{int(q * 100)}": (round(quantile(h, q), 3) if h['count'] else None)
+                                          for q in (0.5, 0.95, 0.99)}}
+                                for name, h in snapshot['histograms'].items()}}
+
+
+def render_prometheus(snapshot):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, value in sorted(snapshot['counters'].items()):
+        lines += [f"# TYPE jit_{name} counter", f"jit_{name} {value}"]
+    lines.append("# TYPE jit_requests_in_state gauge")
+    for status, value in sorted(snapshot['status'].items()):
+        lines.append(f'jit_requests_in_state{{status="{status}"}} {value}')
+    for name, h in snapshot['histograms'].items():
+        lines += [f"# HELP jit_{name} {HISTOGRAMS[name]}", f"# TYPE jit_{name} histogram"]
+        for bound, cumulative in h['buckets']:
+            le = '+Inf' if bound == float('inf') else f"{bound:g}"
+            lines.append(f'jit_{name}_bucket{{le="{le}"}} {cumulative}')
+        lines += [f"jit_{name}_sum {h['sum']}", f"jit_{name}_count {h['count']}"]
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show JIT metrics.")
+    parser.add_argument("--format", choices=['prometheus', 'json'], default='prometheus')
+    args = parser.parse_args()
+    snapshot = collect(create_redis_client())
+    if args.format == 'json':
+        print(json.dumps(summary(snapshot), indent=2))
+    else:
+        print(render_prometheus(snapshot), end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,689 @@
+"""Pluggable policy generator backends with hedging, circuit breakers and routing.
+
+Backends are configured with JIT_LLM_BACKENDS, a JSON list tried in order of
+recent health:
+
+    [{"name": "gpt-4o", "type": "litellm", "model": "gpt-4o"},
+     {"name": "ollama", "type": "ollama", "model": "llama3.1", "base_url": "http://ollama:11434"},
+     {"name": "local", "type": "openai", "model": "qwen2.5", "base_url": "http://vllm:8000/v1"},
+     {"name": "rules", "type": "rules"}]
+
+The default is the single gpt-4o litellm backend used before. For every request
+the available backends are ranked by recent latency weighted by error rate; the
+best one is called and, if it has not answered by its own p90 latency, the next
+one is fired as a hedge and the first valid policy wins. A backend that fails
+JIT_LLM_BREAKER_FAILURES times in a row is skipped for JIT_LLM_BREAKER_RESET
+seconds. The rule-based backend answers from keyword tables and is only used when
+every model backend has failed.
+
+Latency samples and breaker state are kept in Redis, so the short-lived tool
+invocations share what earlier ones learned.
+
+Completions are streamed (JIT_LLM_STREAM=0 turns this off) and parsed as they
+arrive by policy_stream.py: a completion that leaves the policy schema is
+abandoned at once and retried up to JIT_LLM_STREAM_RETRIES times, and the
+stream is closed as soon as the document is complete.
+
+Bulk generation (onboarding a team, migrating from Jira) packs up to
+JIT_LLM_BULK_BATCH_SIZE descriptions into one structured prompt, or runs one
+completion per description, with JIT_LLM_BULK_CONCURRENCY completions in flight;
+only the items that fail to parse are re-run:
+
+    python policy_gen.py descriptions.txt --mode packed --output policies.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from shared import tracing, lazy, resilience
+except ImportError:  # shipped flat next to this script
+    import tracing
+    import lazy
+    import resilience
+try:
+    from . import policy_stream
+except ImportError:  # shipped flat next to this script
+    import policy_stream
+
+litellm = lazy.module('litellm')
+requests = lazy.module('requests')
+
+# Constants and configuration
+LLM_BACKENDS = os.getenv('JIT_LLM_BACKENDS')
+GPT_API_KEY = os.getenv('GPT_API_KEY')
+GPT_ENDPOINT = os.getenv('GPT_ENDPOINT')
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+STREAM = os.getenv('JIT_LLM_STREAM', '1') == '1'  # parse completions while they stream
+STREAM_RETRIES = int(os.getenv('JIT_LLM_STREAM_RETRIES', '1'))  # immediate retries after a schema violation
+LLM_TIMEOUT = float(os.getenv('JIT_LLM_TIMEOUT', '60'))  # seconds per backend call
+HEDGE_AFTER = float(os.getenv('JIT_LLM_HEDGE_AFTER', '8'))  # seconds, until a backend has latency samples
+HEDGE_MIN = 0.25
+HEDGE_QUANTILE = 0.9
+BREAKER_FAILURES = int(os.getenv('JIT_LLM_BREAKER_FAILURES', '3'))
+BREAKER_RESET = float(os.getenv('JIT_LLM_BREAKER_RESET', '60'))
+LATENCY_SAMPLES = 50
+ERROR_DECAY = 0.2  # weight of the newest outcome in the error rate
+STATS_PREFIX = 'jit:llm:'
+BULK_MODE = os.getenv('JIT_LLM_BULK_MODE', 'packed')  # 'packed' prompts or one 'concurrent' completion per item
+BULK_BATCH_SIZE = int(os.getenv('JIT_LLM_BULK_BATCH_SIZE', '10'))  # descriptions per packed prompt
+BULK_CONCURRENCY = int(os.getenv('JIT_LLM_BULK_CONCURRENCY', '4'))  # completions in flight
+BULK_RETRIES = 2
+
+PROMPT = "Generate a least privileged policy JSON for the following description: {description} - return the JSON object."
+BATCH_PROMPT = ("Generate a least privileged AWS IAM policy for each of the {count} numbered descriptions below. "
+                "Return only one JSON object whose keys are the description numbers as strings and whose values are "
+                "the policy documents, e.g. {{\"1\": {{\"Version\": \"2012-10-17\", \"Statement\": [...]}}}}.\n\n"
+                "{descriptions}")
+
+
+BulkResult = namedtuple('BulkResult', ['policies', 'errors', 'stats'])
+
+
+class PolicyGenerationError(Exception):
+    """Raised when no backend produced a valid policy."""
+
+
+def extract_policy(content):
+    """The validated, minimized policy document in a complete completion."""
+    return policy_stream.parse(content)
+
+
+def extract_batch(content, count):
+    """{index: policy or exception} from a packed completion keyed "1".."count"."""
+    try:
+        start, end = content.find('{'), content.rfind('}')
+        document = json.loads(content[start:end + 1] if start != -1 and end != -1 else content)
+        if not isinstance(document, dict):
+            raise ValueError("completion is not a JSON object")
+    except ValueError as e:
+        return {i: e for i in range(count)}
+    results = {}
+    for i in range(count):
+        policy = document.get(str(i + 1))
+        try:
+            if not isinstance(policy, dict):
+                raise ValueError(f"no policy for description {i + 1}")
+            results[i] = extract_policy(json.dumps(policy))
+        except ValueError as e:
+            results[i] = e
+    return results
+
+
+# --- backends --- #
+
+class Backend:
+    """One way of turning descriptions into policy documents.
+
+    Model backends implement complete(prompt, timeout), the text of the completion
+    for one user message, and may stream it; others override generate and
+    generate_batch instead.
+    """
+    fallback = False  # only used when every other backend failed
+
+    def __init__(self, name, model=None, base_url=None, api_key=None):
+        self.name = name
+        self.model = model
+        self.base_url = (base_url or '').rstrip('/')
+        self.api_key = api_key
+        self.usage = Counter()  # tokens used through this backend
+        self.lock = threading.Lock()
+
+    def count(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.usage.update(calls=1, prompt_tokens=prompt_tokens or 0, completion_tokens=completion_tokens or 0,
+                              total_tokens=(prompt_tokens or 0) + (completion_tokens or 0))
+
+    def stream(self, prompt, timeout):
+        """Text of the completion as it arrives; closing the generator abandons the completion."""
+        yield self.complete(prompt, timeout)
+
+    def chunks(self, prompt, timeout):
+        if STREAM:
+            yield from self.stream(prompt, timeout)
+        else:
+            yield self.complete(prompt, timeout)
+
+    def generate(self, description, timeout):
+        """Policy parsed while it streams; a completion that leaves the schema is abandoned and retried."""
+        prompt = PROMPT.format(description=description)
+        for attempt in range(STREAM_RETRIES + 1):
+            parser = policy_stream.StreamingPolicyParser()
+            chunks = self.chunks(prompt, timeout)
+            try:
+                for chunk in chunks:
+                    if parser.feed(chunk):
+                        break  # the document is complete; skip whatever the model says after it
+                return parser.result()
+            except policy_stream.SchemaViolation as e:
+                error = e
+                print(f"📝 {self.name}: {e} after {parser.consumed} characters"
+                      f"{', retrying' if attempt < STREAM_RETRIES else ''}")
+            finally:
+                chunks.close()
+        raise error
+
+    def generate_batch(self, descriptions, timeout):
+        """Policies for many descriptions from one structured prompt: {index: policy or exception}."""
+        numbered = '\n'.join(f"{i}. {d}" for i, d in enumerate(descriptions, 1))
+        return extract_batch(self.complete(BATCH_PROMPT.format(count=len(descriptions), descriptions=numbered),
+                                           timeout), len(descriptions))
+
+
+def _close(response):
+    close = getattr(response, 'close', None) or getattr(getattr(response, 'completion_stream', None), 'close', None)
+    if close:
+        close()
+
+
+def _tokens(usage, key):
+    if usage is None:
+        return 0
+    return getattr(usage, key, None) or (usage.get(key) if isinstance(usage, dict) else 0) or 0
+
+
+class LiteLLMBackend(Backend):
+    """Any provider litellm supports."""
+
+    def complete(self, prompt, timeout):
+        response = litellm.completion(model=self.model, messages=[{"content": prompt, "role": "user"}],
+                                      api_key=self.api_key, base_url=self.base_url or None, timeout=timeout)
+        usage = response.get('usage')
+        self.count(_tokens(usage, 'prompt_tokens'), _tokens(usage, 'completion_tokens'))
+        if not response['choices']:
+            raise ValueError("no choices in the completion")
+        return response['choices'][0]['message']['content']
+
+    def stream(self, prompt, timeout):
+        response = litellm.completion(model=self.model, messages=[{"content": prompt, "role": "user"}],
+                                      api_key=self.api_key, base_url=self.base_url or None, timeout=timeout,
+                                      stream=True, stream_options={'include_usage': True})
+        usage, received = None, 0
+        try:
+            for chunk in response:
+                usage = getattr(chunk, 'usage', None) or usage
+                for choice in chunk.choices or ():
+                    if choice.delta and choice.delta.content:
+                        received += len(choice.delta.content)
+                        yield choice.delta.content
+        finally:
+            _close(response)
+            self.count(_tokens(usage, 'prompt_tokens') or len(prompt) // 4,
+                       _tokens(usage, 'completion_tokens') or received // 4)
+
+
+class OpenAIBackend(Backend):
+    """OpenAI-compatible /chat/completions servers (vLLM, llama.cpp, LM Studio, Ollama's /v1)."""
+
+    def complete(self, prompt, timeout):
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        response = requests.post(f"{self.base_url}/chat/completions", headers=headers, timeout=timeout,
+                                 json={'model': self.model, 'messages': [{"content": prompt, "role": "user"}]})
+        response.raise_for_status()
+        body = response.json()
+        usage = body.get('usage')
+        self.count(_tokens(usage, 'prompt_tokens'), _tokens(usage, 'completion_tokens'))
+        return body['choices'][0]['message']['content']
+
+    def stream(self, prompt, timeout):
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        usage, received = None, 0
+        with requests.post(f"{self.base_url}/chat/completions", headers=headers, timeout=timeout, stream=True,
+                           json={'model': self.model, 'messages': [{"content": prompt, "role": "user"}],
+                                 'stream': True, 'stream_options': {'include_usage': True}}) as response:
+            response.raise_for_status()
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    event = json.loads(data)
+                    usage = event.get('usage') or usage
+                    for choice in event.get('choices') or ():
+                        content = (choice.get('delta') or {}).get('content')
+                        if content:
+                            received += len(content)
+                            yield content
+            finally:
+                self.count(_tokens(usage, 'prompt_tokens') or len(prompt) // 4,
+                           _tokens(usage, 'completion_tokens') or received // 4)
+
+
+class OllamaBackend(Backend):
+    """Ollama's native /api/chat, asking for JSON output."""
+
+    def complete(self, prompt, timeout):
+        response = requests.post(f"{self.base_url or OLLAMA_URL}/api/chat", timeout=timeout,
+                                 json={'model': self.model, 'messages': [{"content": prompt, "role": "user"}],
+                                       'stream': False, 'format': 'json'})
+        response.raise_for_status()
+        body = response.json()
+        self.count(body.get('prompt_eval_count'), body.get('eval_count'))
+        return body['message']['content']
+
+    def stream(self, prompt, timeout):
+        final, received = {}, 0
+        with requests.post(f"{self.base_url or OLLAMA_URL}/api/chat", timeout=timeout, stream=True,
+                           json={'model': self.model, 'messages': [{"content": prompt, "role": "user"}],
+                                 'stream': True, 'format': 'json'}) as response:
+            response.raise_for_status()
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    content = (event.get('message') or {}).get('content')
+                    if content:
+                        received += len(content)
+                        yield content
+                    if event.get('done'):
+                        final = event
+                        break
+            finally:
+                self.count(final.get('prompt_eval_count') or len(prompt) // 4,
+                           final.get('eval_count') or received // 4)
+
+
+class RuleBasedBackend(Backend):
+    """Read-only or read/write statements for the services a description names."""
+    fallback = True
+
+    SERVICES = {
+        's3': (('s3', 'bucket'), ['s3:GetObject', 's3:ListBucket'], ['s3:PutObject']),
+        'ec2': (('ec2', 'instance'), ['ec2:DescribeInstances', 'ec2:DescribeTags'],
+                ['ec2:StartInstances', 'ec2:StopInstances', 'ec2:RebootInstances']),
+        'dynamodb': (('dynamodb', 'dynamo'), ['dynamodb:GetItem', 'dynamodb:Query', 'dynamodb:DescribeTable'],
+                     ['dynamodb:PutItem', 'dynamodb:UpdateItem']),
+        'logs': (('cloudwatch logs', 'log group', 'logs'), ['logs:GetLogEvents', 'logs:FilterLogEvents',
+                                                             'logs:DescribeLogStreams'], ['logs:PutLogEvents']),
+        'cloudwatch': (('cloudwatch', 'metric', 'alarm'), ['cloudwatch:GetMetricData', 'cloudwatch:DescribeAlarms'],
+                       ['cloudwatch:PutMetricAlarm']),
+        'lambda': (('lambda', 'function'), ['lambda:GetFunction', 'lambda:ListFunctions'],
+                   ['lambda:InvokeFunction', 'lambda:UpdateFunctionCode']),
+        'sqs': (('sqs', 'queue'), ['sqs:GetQueueAttributes', 'sqs:ReceiveMessage'], ['sqs:SendMessage']),
+        'sns': (('sns', 'topic'), ['sns:GetTopicAttributes', 'sns:ListTopics'], ['sns:Publish']),
+        'rds': (('rds', 'database', 'postgres', 'mysql'), ['rds:DescribeDBInstances', 'rds:DescribeDBClusters'],
+                ['rds:RebootDBInstance']),
+        'ecr': (('ecr', 'container registry', 'image'), ['ecr:BatchGetImage', 'ecr:GetDownloadUrlForLayer',
+                                                         'ecr:DescribeRepositories'], ['ecr:PutImage']),
+        'eks': (('eks', 'kubernetes'), ['eks:DescribeCluster', 'eks:ListClusters'], []),
+    }
+    WRITE_WORDS = ('write', 'put', 'upload', 'update', 'modify', 'publish', 'send', 'invoke', 'restart', 'reboot',
+                   'start', 'stop', 'deploy', 'push')
+    ARN = re.compile(r'arn:aws[\w-]*:[^\s,;"\']+')
+
+    def generate(self, description, timeout):
+        lowered = description.lower()
+        write = any(re.search(rf"\b{w}", lowered) for w in self.WRITE_WORDS)
+        resources = self.ARN.findall(description) or ['*']
+        statements = []
+        for service, (keywords, read_actions, write_actions) in self.SERVICES.items():
+            if not any(re.search(rf"\b{re.escape(k)}\b", lowered) for k in keywords):
+                continue
+            scoped = [r for r in resources if r.split(':')[2] == service] if resources != ['*'] else ['*']
+            actions = read_actions + (write_actions if write else [])
+            statements.append({'Effect': 'Allow', 'Action': actions, 'Resource': scoped or ['*']})
+        if not statements:
+            raise ValueError("no known service in the description")
+        return {'Version': '2012-10-17', 'Statement': statements}
+
+    def generate_batch(self, descriptions, timeout):
+        results = {}
+        for i, description in enumerate(descriptions):
+            try:
+                results[i] = self.generate(description, timeout)
+            except ValueError as e:
+                results[i] = e
+        return results
+
+
+BACKEND_TYPES = {'litellm': LiteLLMBackend, 'openai': OpenAIBackend, 'ollama': OllamaBackend,
+                 'rules': RuleBasedBackend}
+
+
+def build_backends(config=None):
+    """Backends from JIT_LLM_BACKENDS (or `config`); defaults to gpt-4o through litellm."""
+    config = config if config is not None else json.loads(LLM_BACKENDS) if LLM_BACKENDS else [
+        {'name': 'gpt-4o', 'type': 'litellm', 'model': 'gpt-4o'}]
+    backends = []
+    for entry in config:
+        kind = entry.get('type', 'litellm')
+        if kind not in BACKEND_TYPES:
+            raise ValueError(f"unknown backend type {kind!r}")
+        api_key = os.getenv(entry['api_key_env']) if entry.get('api_key_env') else entry.get('api_key', GPT_API_KEY)
+        base_url = entry.get('base_url', GPT_ENDPOINT if kind in ('litellm', 'openai') else None)
+        backends.append(BACKEND_TYPES[kind](entry.get('name') or entry.get('model') or kind, entry.get('model'),
+                                            base_url, api_key))
+    return backends
+
+
+# --- health: latency, error rate and circuit breaker per backend --- #
+
+def _breaker(failures=0, opened_at=0.0):
+    return resilience.CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET, failures, opened_at)
+
+
+class Health:
+    """Recent behaviour of one backend."""
+
+    def __init__(self, latencies=(), error_rate=0.0, breaker=None):
+        self.latencies = list(latencies)[:LATENCY_SAMPLES]  # newest first
+        self.error_rate = error_rate
+        self.breaker = breaker or _breaker()
+
+    def quantile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self):
+        p90 = self.quantile(HEDGE_QUANTILE)
+        return HEDGE_AFTER if p90 is None else max(p90, HEDGE_MIN)
+
+    def cost(self):
+        """Routing score: expected latency, inflated by the error rate. Unmeasured backends go first."""
+        median = self.quantile(0.5)
+        return 0.0 if median is None else median * (1 + 4 * self.error_rate)
+
+    def record(self, ok, seconds=None, outage=True):
+        """One outcome; unusable output (outage=False) counts against the error rate but not the breaker.
+
+        Returns the change in the error rate, which save_outcome applies as an increment.
+        """
+        delta = ERROR_DECAY * ((0.0 if ok else 1.0) - self.error_rate)
+        self.error_rate += delta
+        if ok or not outage:
+            if seconds is not None:
+                self.latencies.insert(0, seconds)
+                del self.latencies[LATENCY_SAMPLES:]
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+        return delta
+
+
+def _health_key(name):
+    return f"{STATS_PREFIX}health:{name}"
+
+
+def _latency_key(name):
+    return f"{STATS_PREFIX}latency:{name}"
+
+
+def load_health(rd, names):
+    """Health of each backend from Redis; fresh Health objects without a Redis client."""
+    if rd is None:
+        return {name: Health() for name in names}
+    pipe = rd.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(_health_key(name))
+        pipe.lrange(_latency_key(name), 0, LATENCY_SAMPLES - 1)
+    raw = pipe.execute()
+    health = {}
+    for i, name in enumerate(names):
+        fields = {k.decode() if isinstance(k, bytes) else k: float(v) for k, v in raw[2 * i].items()}
+        breaker = _breaker()
+        breaker.restore(fields)
+        health[name] = Health([float(v) for v in raw[2 * i + 1]], _clamp(fields.get('error_rate', 0.0)), breaker)
+    return health
+
+
+def _clamp(rate):
+    # increments computed from slightly stale rates by concurrent processes can overshoot [0, 1]
+    return min(max(rate, 0.0), 1.0)
+
+
+def save_outcome(rd, name, health, error_delta, failed, seconds=None):
+    """Persist one outcome; latency samples are a capped list, the rest a small hash.
+
+    Concurrent tool invocations update the same hash, so it is only changed by
+    increments: the error rate by `error_delta` and, through the breaker's own
+    store(), the failure count when the backend `failed`. Returns the stored
+    (error rate, failures), or None without a Redis client.
+    """
+    if rd is None:
+        return None
+    key = _health_key(name)
+    pipe = rd.pipeline()
+    pipe.hincrbyfloat(key, 'error_rate', error_delta)
+    health.breaker.store(pipe, key, not failed)
+    if seconds is not None:
+        pipe.lpush(_latency_key(name), seconds)
+        pipe.ltrim(_latency_key(name), 0, LATENCY_SAMPLES - 1)
+    results = pipe.execute()
+    return _clamp(float(results[0])), int(results[1]) if failed else 0
+
+
+# --- routing --- #
+
+class Router:
+    """Ranks backends by health, hedges slow calls and falls back on failures."""
+
+    def __init__(self, backends, rd=None, hedge=True, timeout=LLM_TIMEOUT):
+        self.backends = backends
+        self.rd = rd
+        self.hedge = hedge
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.health = load_health(rd, [b.name for b in backends])
+
+    def ranked(self):
+        """Model backends that may be called, best first; rule-based fallbacks last."""
+        order = {b.name: i for i, b in enumerate(self.backends)}
+        available = [b for b in self.backends if not b.fallback and self.health[b.name].breaker.allow()]
+        available.sort(key=lambda b: (self.health[b.name].cost(), order[b.name]))
+        return available
+
+    def _call(self, backend, task, results, context, hedged, sample):
+        began = time.perf_counter()
+        with tracing.use_context(context):
+            try:
+                with tracing.span('llm.completion', backend=backend.name, model=backend.model, hedged=hedged):
+                    result = task(backend, self.timeout)
+                error = None
+            except Exception as e:
+                result, error = None, e
+        seconds = time.perf_counter() - began
+        with self.lock:
+            health = self.health[backend.name]
+            # ValueError/KeyError: the backend answered, but not with a usable policy
+            outage = not isinstance(error, (ValueError, KeyError))
+            error_delta = health.record(error is None, seconds if sample else None, outage)
+        try:
+            stored = save_outcome(self.rd, backend.name, health, error_delta, error is not None and outage,
+                                  seconds if error is None and sample else None)
+        except Exception as e:
+            stored = None
+            print(f"❌ Could not save LLM backend stats: {e}")
+        if stored is not None:
+            with self.lock:
+                # what every process has seen, not only this one
+                health.error_rate, failures = stored
+                health.breaker.adopt(failures)
+        results.put((backend, result, error))
+
+    def _launch(self, backend, task, results, hedged=False, sample=True):
+        threading.Thread(target=self._call, name=f"llm-{backend.name}", daemon=True,
+                         args=(backend, task, results, tracing.current_context(), hedged, sample)).start()
+
+    def run(self, task, hedge=None, sample=True):
+        """Return (task result, backend name) from the first backend whose task(backend, timeout) succeeds.
+
+        Tasks much slower than a single generation (packed prompts) pass hedge=False and
+        sample=False, so they neither hedge on nor skew the single-generation latencies.
+
+        Raises:
+            PolicyGenerationError: if every backend failed or is behind an open breaker
+        """
+        candidates, errors = self.ranked(), []
+        results = queue.Queue()
+        if candidates:
+            deadline = time.monotonic() + self.timeout
+            primary = candidates.pop(0)
+            self._launch(primary, task, results, sample=sample)
+            pending = 1
+            hedge_at = time.monotonic() + self.health[primary.name].hedge_delay()
+            while pending:
+                hedge_pending = (self.hedge if hedge is None else hedge) and candidates and hedge_at is not None
+                wait = (hedge_at if hedge_pending else deadline) - time.monotonic()
+                try:
+                    backend, result, error = results.get(timeout=max(wait, 0))
+                except queue.Empty:
+                    if not hedge_pending:
+                        break  # the per-call timeouts should have fired first
+                    backup = candidates.pop(0)
+                    print(f"📝 {primary.name} is slower than its p90, hedging with {backup.name}")
+                    self._launch(backup, task, results, hedged=True, sample=sample)
+                    pending += 1
+                    hedge_at = None
+                    continue
+                pending -= 1
+                if error is None:
+                    return result, backend.name
+                errors.append(f"{backend.name}: {error}")
+                if not pending and candidates:
+                    # a failure is not slow: go straight to the next backend, which may be hedged in turn
+                    primary = candidates.pop(0)
+                    self._launch(primary, task, results, sample=sample)
+                    pending = 1
+                    hedge_at = time.monotonic() + self.health[primary.name].hedge_delay()
+        for backend in (b for b in self.backends if b.fallback):
+            try:
+                with tracing.span('llm.completion', backend=backend.name, fallback=True):
+                    return task(backend, self.timeout), backend.name
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        skipped = [b.name for b in self.backends if not b.fallback and not self.health[b.name].breaker.allow()]
+        if skipped:
+            errors.append(f"circuit open: {', '.join(skipped)}")
+        raise PolicyGenerationError('; '.join(errors) or "no backends configured")
+
+    def generate(self, description):
+        """Return (policy, backend name) from the first backend to answer with a valid policy."""
+        return self.run(lambda backend, timeout: backend.generate(description, timeout))
+
+    def generate_batch(self, descriptions):
+        """Return ({index: policy or exception}, backend name) for one packed prompt."""
+        return self.run(lambda backend, timeout: backend.generate_batch(descriptions, timeout), hedge=False,
+                        sample=False)
+
+    def usage(self):
+        """Tokens and calls used through all backends so far."""
+        total = Counter()
+        for backend in self.backends:
+            with backend.lock:
+                total.update(backend.usage)
+        return total
+
+
+def get_router(rd=None, hedge=True):
+    return Router(build_backends(), rd, hedge)
+
+
+# --- bulk generation --- #
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def generate_bulk(router, descriptions, mode=BULK_MODE, batch_size=BULK_BATCH_SIZE, concurrency=BULK_CONCURRENCY,
+                  retries=BULK_RETRIES):
+    """Policies for many descriptions at once.
+
+    In 'packed' mode up to `batch_size` descriptions share one structured prompt; in
+    'concurrent' mode every description is its own completion. Either way at most
+    `concurrency` completions run at a time, and only the items that failed are
+    re-run, one completion each, up to `retries` times.
+
+    Returns:
+        BulkResult: (policies in input order, None where generation failed; {index: error}; stats)
+    """
+    began = time.perf_counter()
+    usage_before = router.usage()
+    policies, errors = [None] * len(descriptions), {}
+
+    def single(i):
+        try:
+            policies[i], _ = router.generate(descriptions[i])
+            errors.pop(i, None)
+        except PolicyGenerationError as e:
+            errors[i] = str(e)
+
+    def packed(indexes):
+        try:
+            results, _ = router.generate_batch([descriptions[i] for i in indexes])
+        except PolicyGenerationError as e:
+            results = {n: e for n in range(len(indexes))}
+        for n, i in enumerate(indexes):
+            if isinstance(results.get(n), dict):
+                policies[i] = results[n]
+            else:
+                errors[i] = str(results.get(n))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        if mode == 'packed':
+            list(pool.map(packed, _chunks(list(range(len(descriptions))), max(1, batch_size))))
+        else:
+            list(pool.map(single, range(len(descriptions))))
+        first_failures = len(errors)
+        retried = 0
+        for _ in range(retries):
+            if not errors:
+                break
+            failed = sorted(errors)
+            retried += len(failed)
+            list(pool.map(single, failed))
+
+    usage = router.usage() - usage_before
+    stats = {'items': len(descriptions),
+             'mode': mode,
+             'failed': len(errors),
+             'failure_rate': round(len(errors) / len(descriptions), 3) if descriptions else 0.0,
+             'first_attempt_failure_rate': round(first_failures / len(descriptions), 3) if descriptions else 0.0,
+             'retried': retried,
+             'calls': usage['calls'],
+             'prompt_tokens': usage['prompt_tokens'],
+             'completion_tokens': usage['completion_tokens'],
+             'total_tokens': usage['total_tokens'],
+             'wall_s': round(time.perf_counter() - began, 3)}
+    return BulkResult(policies, errors, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate policies for many descriptions at once.")
+    parser.add_argument("descriptions", help="File with one description per line ('-' for stdin).")
+    parser.add_argument("--mode", choices=('packed', 'concurrent'), default=BULK_MODE)
+    parser.add_argument("--batch_size", type=int, default=BULK_BATCH_SIZE, help="Descriptions per packed prompt.")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY, help="Completions in flight.")
+    parser.add_argument("--retries", type=int, default=BULK_RETRIES, help="Rounds re-running failed items.")
+    parser.add_argument("--output", help="Write {description, policy, error} JSON lines here.")
+    args = parser.parse_args()
+
+    with (sys.stdin if args.descriptions == '-' else open(args.descriptions)) as f:
+        descriptions = [line.strip() for line in f if line.strip()]
+    result = generate_bulk(get_router(), descriptions, args.mode, args.batch_size, args.concurrency, args.retries)
+    if args.output:
+        with open(args.output, 'w') as f:
+            for i, description in enumerate(descriptions):
+                f.write(json.dumps({'description': description, 'policy': result.policies[i],
+                                    'error': result.errors.get(i)}) + '\n')
+    for i, error in sorted(result.errors.items()):
+        print(f"❌ {descriptions[i]}: {error}")
+    print(f"📝 {json.dumps(result.stats)}")
+    if result.errors:
+        sys.exit(1)
+    print(f"✅ Generated {len(descriptions)} policies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Incremental extraction of a policy document from a streamed completion.
+
+Completions are fed to StreamingPolicyParser chunk by chunk as they arrive. The
+parser skips any prose before the document, which starts at the first '{' of a
+fenced code block or the first '{"Version"', '{"Statement"' or '{"Id"' (braces in
+the prose itself are not mistaken for it), follows the JSON structure
+character by character and checks every key and value against the policy schema
+as soon as it is complete, so a response that goes wrong ("Statemnt", "Effect":
+"Permit", an action without a service prefix) is rejected after a few tokens
+instead of after the whole generation. Every statement is parsed, validated and
+minimized the moment its closing brace arrives, and the document is ready as
+soon as its last brace does: the stream can be closed then, without waiting for
+whatever the model writes after the JSON.
+
+    >>> parser = StreamingPolicyParser()
+    >>> for chunk in chunks:
+    ...     if parser.feed(chunk):
+    ...         break
+    >>> policy = parser.result()
+"""
+import re
+import json
+
+# Constants and configuration
+PREAMBLE_LIMIT = 2000  # characters of prose allowed before the document starts
+TOP_KEYS = frozenset(('Version', 'Id', 'Statement'))
+STATEMENT_KEYS = frozenset(('Sid', 'Effect', 'Action', 'NotAction', 'Resource', 'NotResource', 'Condition',
+                            'Principal', 'NotPrincipal'))
+VERSION = '2012-10-17'
+EFFECTS = frozenset(('Allow', 'Deny'))
+ACTION_PATTERN = re.compile(r'^(\*|[a-zA-Z0-9-]+:[a-zA-Z0-9*?]+)$')
+ITEM = '[]'  # path element of an array item
+# where the document starts: the first brace of a fenced block, or a brace opening a policy key
+DOCUMENT_START = re.compile(r'```[\w-]*[ \t]*\r?\n\s*(\{)|(\{)\s*"(?:Version|Statement|Id)"')
+START_LOOKBEHIND = 32  # characters of prose kept across chunks, so a split start marker still matches
+
+# path prefixes of a statement object: "Statement": {...} or "Statement": [{...}, ...]
+STATEMENT_PATHS = (('Statement',), ('Statement', ITEM))
+
+
+class SchemaViolation(ValueError):
+    """The completion is not, or is no longer becoming, a valid policy document."""
+
+
+def _is_statement(path):
+    return path in STATEMENT_PATHS
+
+
+def _check_key(path, key):
+    if path == ():
+        if key not in TOP_KEYS:
+            raise SchemaViolation(f"unexpected top-level key {key!r}")
+    elif _is_statement(path):
+        if key not in STATEMENT_KEYS:
+            raise SchemaViolation(f"unexpected statement key {key!r}")
+
+
+def _check_value(path, value):
+    """Checks a complete string value at `path`."""
+    if _is_statement(path):
+        raise SchemaViolation("statements must be objects")
+    if path == ('Version',):
+        if value != VERSION:
+            raise SchemaViolation(f"unsupported policy version {value!r}")
+    elif len(path) >= 2 and _is_statement(path[:-1]) and path[-1] == 'Effect':
+        if value not in EFFECTS:
+            raise SchemaViolation(f"invalid Effect {value!r}")
+    elif (len(path) >= 2 and path[-1] in ('Action', 'NotAction') and _is_statement(path[:-1])) or \
+            (len(path) >= 3 and path[-1] == ITEM and path[-2] in ('Action', 'NotAction') and _is_statement(path[:-2])):
+        if not ACTION_PATTERN.match(value):
+            raise SchemaViolation(f"invalid action {value!r}")
+
+
+def _check_container(path, kind):
+    """Checks an object ('{') or array ('[') opening at `path`."""
+    if path == ('Statement', ITEM) and kind != '{':
+        raise SchemaViolation("statements must be objects")
+    if path in (('Version',), ('Id',)) or (len(path) >= 2 and _is_statement(path[:-1])
+                                           and path[-1] in ('Effect', 'Sid')):
+        raise SchemaViolation(f"{path[-1]} must be a string")
+
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise SchemaViolation(f"invalid JSON: {e}")
+
+
+def _dedupe(values):
+    seen, unique = set(), []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            unique.append(value)
+    return unique
+
+
+def _covered(action, wildcards):
+    lowered = action.lower()
+    return any(w != lowered and re.fullmatch(re.escape(w).replace(r'\*', '.*').replace(r'\?', '.'), lowered)
+               for w in wildcards)
+
+
+def minimize_statement(statement):
+    """Checks a complete statement and drops duplicate or wildcard-covered actions and resources."""
+    if not isinstance(statement, dict):
+        raise SchemaViolation("statements must be objects")
+    if 'Effect' not in statement:
+        raise SchemaViolation("statement without Effect")
+    if not isinstance(statement['Effect'], str) or statement['Effect'] not in EFFECTS:
+        raise SchemaViolation(f"invalid Effect {statement['Effect']!r}")
+    if 'Action' not in statement and 'NotAction' not in statement:
+        raise SchemaViolation("statement without Action")
+    if 'Resource' not in statement and 'NotResource' not in statement and 'Principal' not in statement:
+        raise SchemaViolation("statement without Resource")
+    for key in ('Action', 'NotAction'):
+        if isinstance(statement.get(key), list):
+            actions = _dedupe(statement[key])
+            wildcards = {a.lower() for a in actions if '*' in a or '?' in a}
+            statement[key] = [a for a in actions if not _covered(a, wildcards)]
+    for key in ('Resource', 'NotResource'):
+        if isinstance(statement.get(key), list):
+            statement[key] = ['*'] if '*' in statement[key] else _dedupe(statement[key])
+    return statement
+
+
+class StreamingPolicyParser:
+    """Feed completion text chunk by chunk; feed() returns True once the document is complete.
+
+    Raises SchemaViolation from feed() as soon as the text cannot become a valid policy.
+    """
+
+    def __init__(self, preamble_limit=PREAMBLE_LIMIT):
+        self.preamble_limit = preamble_limit
+        self.text = ''       # document text so far
+        self.prose = ''      # tail of the prose, until the document starts
+        self.skipped = 0     # characters of prose before the document
+        self.stack = []      # open containers: [kind, path, expecting key, current key, start offset]
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.done = False
+        self.statements = []
+        self.document = None
+
+    @property
+    def consumed(self):
+        """Characters read so far, prose included."""
+        return self.skipped + len(self.text)
+
+    def _value_path(self):
+        """Path of the value that starts at the current position."""
+        kind, path, _, key, _ = self.stack[-1]
+        return path + ((key,) if kind == '{' else (ITEM,))
+
+    def feed(self, chunk):
+        if self.done or not chunk:
+            return self.done
+        if not self.stack:
+            chunk = self._skip_prose(chunk)
+            if chunk is None:
+                return False
+        base = len(self.text)
+        self.text += chunk
+        for i, char in enumerate(chunk):
+            position = base + i
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self._string(_loads(self.text[self.string_start:position + 1]))
+                continue
+            if char == '"':
+                self.in_string, self.string_start = True, position
+            elif char in '{[':
+                path = self._value_path() if self.stack else ()
+                _check_container(path, char)
+                self.stack.append([char, path, char == '{', None, position])
+            elif char in '}]':
+                if not self.stack or (char == '}') != (self.stack[-1][0] == '{'):
+                    raise SchemaViolation(f"unbalanced {char!r}")
+                if self._close(position + 1):
+                    self.text = self.text[:position + 1]
+                    self.done = True
+                    return True
+            elif char == ':':
+                if not self.stack or self.stack[-1][0] != '{' or self.stack[-1][3] is None:
+                    raise SchemaViolation("':' outside of an object")
+            elif char == ',':
+                if self.stack and self.stack[-1][0] == '{':
+                    self.stack[-1][2] = True
+            elif not self.stack:
+                pass
+            elif char.isspace():
+                pass
+            elif self.stack[-1][0] == '{' and self.stack[-1][2]:
+                raise SchemaViolation(f"expected a key, got {char!r}")
+        return False
+
+    def _skip_prose(self, chunk):
+        """The chunk from the start of the document on, or None while still in prose."""
+        prose = self.prose + chunk
+        match = DOCUMENT_START.search(prose)
+        if match is None:
+            keep = prose[-START_LOOKBEHIND:]
+            self.skipped += len(prose) - len(keep)
+            self.prose = keep
+            if self.skipped + len(keep) > self.preamble_limit:
+                raise SchemaViolation(f"no JSON object in the first {self.skipped + len(keep)} characters")
+            return None
+        start = match.start(1) if match.group(1) else match.start(2)
+        self.skipped += start
+        self.prose = ''
+        return prose[start:]
+
+    def _string(self, value):
+        frame = self.stack[-1]
+        if frame[0] == '{' and frame[2]:
+            _check_key(frame[1], value)
+            frame[2], frame[3] = False, value
+        else:
+            _check_value(self._value_path(), value)
+
+    def _close(self, end):
+        """Pops the innermost container ending at `end`; returns True when it was the whole document."""
+        kind, path, _, _, start = self.stack.pop()
+        if not self.stack:
+            self.document = _loads(self.text[start:end])
+            return True
+        if kind == '{' and _is_statement(path):
+            # validate and minimize while the rest of the document is still streaming
+            self.statements.append(minimize_statement(_loads(self.text[start:end])))
+        return False
+
+    def result(self):
+        """The validated, minimized document; raises SchemaViolation if it is incomplete or invalid."""
+        if not self.done:
+            raise SchemaViolation("the completion ended before the policy document did"
+                                  if self.stack else "no JSON object in the completion")
+        document = self.document
+        if document.get('Version') != VERSION:
+            raise SchemaViolation(f"policy Version must be {VERSION!r}")
+        if 'Statement' not in document:
+            raise SchemaViolation("policy without Statement")
+        if not self.statements:
+            raise SchemaViolation("policy without statements")
+        document['Statement'] = self.statements if isinstance(document['Statement'], list) else self.statements[0]
+        return document
+
+
+def parse(content):
+    """Validated, minimized policy document from a complete completion."""
+    parser = StreamingPolicyParser()
+    parser.feed(content)
+    return parser.result()
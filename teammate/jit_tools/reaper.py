@@ -0,0 +1,323 @@
+"""Orphan policy reaper: deletes kubiya-jit-* policies whose grant is over.
+
+A grant's policy is normally removed by its scheduled expiry, but a task that
+fails or is misread by the agent leaves the policy behind. The reaper pages
+through the account's customer managed policies with the JIT prefix and joins
+them, a page at a time in one Redis pipeline, against the request states (the
+policy name is the request ID). A policy is reaped when:
+
+    - no request state or record exists for it (unknown),
+    - its request is expired, revoked, denied or pending (never or no longer granted),
+    - its request is stuck in approved (provisioning died after creating it): the
+      request is reopened as pending, as a failed provisioning does, and its approval
+      resume point cleared, so the decision can be made again,
+    - its grant's expiry, extensions included, has passed, or
+    - it has a record but no request state (stored before request states existed)
+      and its creation time plus the record's TTL has passed.
+
+Policies younger than JIT_REAPER_GRACE_MINUTES, and grants that ended less than
+that long ago, are left to the regular expiry. Deletion detaches the policy from
+all entities and deletes its non-default versions first (skipped when the listing
+shows neither, which is one IAM call for most orphans). Up to
+JIT_REAPER_CONCURRENCY deletions run in flight; every IAM throttle halves that
+limit and successes grow it back, while the throttled call itself is retried with
+jittered backoff.
+
+    python reaper.py --dry_run --output report.json
+    python reaper.py --concurrency 16
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+try:
+    from shared import tracing, lazy, resilience
+except ImportError:  # shipped flat next to this script
+    import tracing
+    import lazy
+    import resilience
+try:
+    from . import idempotency, request_state, audit, metrics, records, grants
+except ImportError:
+    import idempotency
+    import request_state
+    import audit
+    import metrics
+    import records
+    import grants
+
+boto3 = lazy.module('boto3')
+botocore_config = lazy.module('botocore.config')
+
+# Constants and configuration
+BACKEND_URL = os.getenv('BACKEND_URL')
+BACKEND_PORT = os.getenv('BACKEND_PORT')
+BACKEND_PASS = os.getenv('BACKEND_PASS')
+AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+IAM_ENDPOINT_URL = os.getenv('IAM_ENDPOINT_URL')  # None = the AWS default endpoint
+REAPER_PREFIX = os.getenv('JIT_REAPER_PREFIX', 'kubiya-jit-')
+REAPER_CONCURRENCY = int(os.getenv('JIT_REAPER_CONCURRENCY', '8'))  # deletions in flight
+REAPER_GRACE_MINUTES = int(os.getenv('JIT_REAPER_GRACE_MINUTES', '15'))  # left to the scheduled expiry
+IAM_MAX_ATTEMPTS = 10
+THROTTLE_CODES = frozenset(('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'))
+PAGE_SIZE = 1000  # ListPolicies maximum
+ACTOR = 'reaper'
+UNSETTLED = ('unknown', 'never provisioned', 'provisioning died')  # kinds a request in flight also has
+
+Finding = namedtuple('Finding', ['policy_name', 'policy_arn', 'request_id', 'status', 'reap', 'kind', 'reason', 'bare'])
+
+
+def create_redis_client():
+    return redis.Redis(host=BACKEND_URL, port=BACKEND_PORT, password=BACKEND_PASS)
+
+
+def create_iam_client(concurrency=REAPER_CONCURRENCY):
+    """IAM client shared by all deletion threads, retrying throttled calls with jittered backoff."""
+    session = boto3.Session(aws_access_key_id=AWS_ACCESS_KEY_ID, aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+    config = botocore_config.Config(retries={'mode': 'standard', 'max_attempts': IAM_MAX_ATTEMPTS},
+                                    max_pool_connections=max(10, concurrency))
+    return session.client('iam', endpoint_url=IAM_ENDPOINT_URL, config=config)
+
+
+class ThrottleLimit:
+    """AIMD limit on deletions in flight: halved by every IAM throttle, grown back by one per `limit` successes."""
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.active = 0
+        self.throttles = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.active -= 1
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def throttled(self):
+        with self.condition:
+            self.throttles += 1
+            self.limit = max(1.0, self.limit / 2)
+
+    def watch(self, iam_client):
+        """Count the client's throttled attempts, including the ones botocore retries by itself."""
+        def on_attempt(response=None, **kwargs):
+            if response is not None and response[1].get('Error', {}).get('Code') in THROTTLE_CODES:
+                self.throttled()
+        iam_client.meta.events.unregister('needs-retry.iam', unique_id='jit-reaper-throttle')
+        iam_client.meta.events.register('needs-retry.iam', on_attempt, unique_id='jit-reaper-throttle')
+
+
+def iter_policy_pages(iam_client, prefix=REAPER_PREFIX):
+    """Customer managed policies named `prefix`*, a ListPolicies page at a time."""
+    paginator = iam_client.get_paginator('list_policies')
+    for page in paginator.paginate(Scope='Local', PaginationConfig={'PageSize': PAGE_SIZE}):
+        matched = [p for p in page['Policies'] if p['PolicyName'].startswith(prefix)]
+        if matched:
+            yield matched
+
+
+def _expiry(rd, request_id, state):
+    """End of a provisioned grant: stored since grants carry their expiry, else provisioning time plus TTL."""
+    if state.get('expires_at'):
+        return grants.grant_end(state)
+    stored = records.load_request(rd, request_id)
+    return grants.grant_end(state, stored[request_id].get('ttl_min') if stored else None)
+
+
+def _judge(rd, request_id, state, has_record, created, now, grace):
+    """(orphaned?, kind, reason) for a policy created at `created` whose request is `state`."""
+    status = state.get('status')
+    if not state and not has_record:
+        return True, 'unknown', 'no request for this policy'
+    if not state:
+        # a record from before request states: its grant ends at creation plus its TTL
+        stored = records.load_request(rd, request_id)
+        ttl_min = stored[request_id].get('ttl_min') if stored else None
+        if ttl_min in (None, ''):
+            return False, 'no expiry', 'request has no state and its record no TTL'
+        expires_at = created + timedelta(minutes=int(ttl_min))
+        if expires_at + grace < now:
+            return True, 'grant expired', f"stateless grant expired at {expires_at.isoformat()}"
+        return False, 'active', f"stateless grant active until {expires_at.isoformat()}"
+    if status in (request_state.EXPIRED, request_state.REVOKED):
+        return True, status, f"request is {status}"
+    if status in (request_state.DENIED, request_state.PENDING):
+        return True, 'never provisioned', f"request is {status}"
+    if status == request_state.APPROVED:
+        return True, 'provisioning died', 'request is approved but was never provisioned'
+    if status != request_state.PROVISIONED:
+        return False, status, f"request is {status}"
+    expires_at = _expiry(rd, request_id, state)
+    if expires_at is None:
+        return False, 'no expiry', 'grant has no known expiry'
+    if expires_at + grace < now:
+        return True, 'grant expired', f"grant expired at {expires_at.isoformat()}"
+    return False, 'active', f"grant active until {expires_at.isoformat()}"
+
+
+def classify(rd, page, now, grace=REAPER_GRACE_MINUTES):
+    """Findings for one page of policies, joined against Redis in a single round trip."""
+    pipe = rd.pipeline(transaction=False)
+    for policy in page:
+        pipe.hgetall(request_state.state_key(policy['PolicyName']))
+        pipe.exists(policy['PolicyName'])
+    replies = pipe.execute()
+    grace = timedelta(minutes=grace)
+    findings = []
+    for policy, raw, has_record in zip(page, replies[::2], replies[1::2]):
+        request_id = policy['PolicyName']
+        state = {request_state._decode(k): request_state._decode(v) for k, v in raw.items()}
+        created = grants.parse_time(policy['CreateDate'])
+        orphaned, kind, reason = _judge(rd, request_id, state, has_record, created, now, grace)
+        if kind in UNSETTLED and now - created < grace:
+            # may be a grant being provisioned right now
+            orphaned, kind, reason = False, 'new', f"{reason}, but the policy is only minutes old"
+        bare = policy.get('AttachmentCount') == 0 and policy.get('DefaultVersionId') == 'v1'
+        findings.append(Finding(request_id, policy['Arn'], request_id, state.get('status'), orphaned, kind, reason,
+                                bare))
+    return findings
+
+
+def reopen(rd, request_id, hook=None):
+    """Move a request whose provisioning died back to pending, with nothing left to resume.
+
+    In the same transaction the approval's resume point, which names the deleted
+    policy, is cleared and the approver's decision claim released, so the request
+    can be approved again instead of resuming onto a policy that no longer exists.
+    """
+    decided_by = request_state.get_state(rd, request_id).get('decided_by')
+
+    def reset(pipe, from_state, to_state):
+        resilience.Checkpoint(rd, f"approve:{request_id}").clear(pipe)
+        resilience.Checkpoint(rd, f"webhook:{request_id}").clear(pipe)
+        if decided_by:
+            idempotency.release(pipe, request_id, f"decision:approve:{decided_by}")
+    return request_state.transition(rd, request_id, request_state.PENDING, from_states={request_state.APPROVED},
+                                    pipeline_hook=request_state.chain(hook, reset) if hook else reset)
+
+
+def reap(rd, iam_client, finding, limit=None):
+    """Delete one orphaned policy and close out its request; returns (finding, error or None)."""
+    try:
+        with limit or ThrottleLimit(1), tracing.span('reaper.reap', policy_arn=finding.policy_arn, status=finding.status):
+            deleted = grants.delete_policy(iam_client, finding.policy_arn, bare=finding.bare)
+    except Exception as e:
+        return finding, str(e)
+    hook = request_state.chain(
+        audit.transition_hook(finding.request_id, actor=ACTOR, policy_arn=finding.policy_arn, reason=finding.reason),
+        metrics.transition_hook())
+    if finding.status == request_state.PROVISIONED:
+        request_state.transition(rd, finding.request_id, request_state.EXPIRED,
+                                 from_states={request_state.PROVISIONED}, pipeline_hook=hook)
+    elif finding.status == request_state.APPROVED:
+        reopen(rd, finding.request_id, hook)
+    pipe = rd.pipeline()
+    audit.record(pipe, audit.REAPED, finding.request_id, actor=ACTOR, policy_arn=finding.policy_arn,
+                 reason=finding.reason, already_deleted=not deleted)
+    metrics.incr(pipe, 'policies_reaped_total')
+    pipe.execute()
+    return finding, None
+
+
+def sweep(rd, iam_client, prefix=REAPER_PREFIX, dry_run=True, concurrency=REAPER_CONCURRENCY,
+          grace=REAPER_GRACE_MINUTES, now=None):
+    """Find, and unless `dry_run` delete, the orphaned `prefix`* policies.
+
+    Pages are classified as they are listed and their orphans handed straight to the
+    deletion pool, so listing and deleting overlap. `concurrency` is the most
+    deletions in flight; IAM throttling lowers it for a while (see ThrottleLimit).
+
+    Args:
+        rd (redis.Redis): Redis client
+        iam_client: IAM client, ideally from create_iam_client()
+        prefix (str): policy name prefix of JIT grants
+        dry_run (bool): only report what would be deleted
+        concurrency (int): deletions in flight
+        grace (int): minutes a new policy or an ended grant is left to the regular expiry
+        now (datetime, optional): the time to judge expiry against
+
+    Returns:
+        dict: the report: counts per action and per kind, and one entry per matched policy
+    """
+    now = now or datetime.now(timezone.utc)
+    findings, futures = [], []
+    limit = ThrottleLimit(concurrency)
+    limit.watch(iam_client)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reaper') as pool:
+        for page in iter_policy_pages(iam_client, prefix):
+            for finding in classify(rd, page, now, grace):
+                findings.append(finding)
+                if finding.reap and not dry_run:
+                    futures.append(pool.submit(reap, rd, iam_client, finding, limit))
+        errors = {f.policy_arn: error for f, error in (future.result() for future in futures) if error}
+
+    entries, counts, kinds = [], Counter(), Counter()
+    for finding in findings:
+        if not finding.reap:
+            action = 'kept'
+        elif dry_run:
+            action = 'would_delete'
+        else:
+            action = 'failed' if finding.policy_arn in errors else 'deleted'
+        counts[action] += 1
+        kinds[finding.kind] += 1
+        entry = dict(finding._asdict(), action=action)
+        if finding.policy_arn in errors:
+            entry['error'] = errors[finding.policy_arn]
+        entries.append(entry)
+    return {'prefix': prefix, 'dry_run': dry_run, 'checked_at': now.isoformat(), 'matched': len(findings),
+            'counts': dict(counts), 'kinds': dict(kinds), 'throttles': limit.throttles, 'policies': entries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete kubiya-jit-* policies whose grant is over.")
+    parser.add_argument("--dry_run", action='store_true', help="Only report what would be deleted.")
+    parser.add_argument("--prefix", default=REAPER_PREFIX, help="Policy name prefix of JIT grants.")
+    parser.add_argument("--concurrency", type=int, default=REAPER_CONCURRENCY, help="Deletions in flight.")
+    parser.add_argument("--grace_minutes", type=int, default=REAPER_GRACE_MINUTES,
+                        help="Leave policies this new, and grants ended this recently, to the scheduled expiry.")
+    parser.add_argument("--output", help="Write the full report as JSON.")
+    parser.add_argument("--verbose", action='store_true', help="Print every policy to be deleted.")
+    args = parser.parse_args()
+
+    report = sweep(create_redis_client(), create_iam_client(args.concurrency), args.prefix, args.dry_run,
+                   args.concurrency, args.grace_minutes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    for entry in report['policies']:
+        if entry['action'] == 'failed':
+            print(f"❌ {entry['policy_name']}: {entry['error']}")
+        elif args.verbose and entry['action'] != 'kept':
+            print(f"{'📝' if args.dry_run else '✅'} {entry['policy_name']}: {entry['reason']}")
+    counts = report['counts']
+    verb = 'would delete' if args.dry_run else 'deleted'
+    print(f"{'📝' if args.dry_run else '✅'} {report['matched']} {args.prefix}* policies: "
+          f"{counts.get('would_delete' if args.dry_run else 'deleted', 0)} {verb}, {counts.get('kept', 0)} kept"
+          + (f", {counts['failed']} failed" if counts.get('failed') else '')
+          + (f" ({report['throttles']} IAM throttles)" if report['throttles'] else ''))
+    for kind, count in sorted(report['kinds'].items(), key=lambda item: -item[1]):
+        print(f"   {count:>6}  {kind}")
+    if counts.get('failed'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Canonical, versioned encoding of the stored approval request records.
+
+A record is one member of the Redis set named after its request ID (the layout
+the tools have always used), now as bytes instead of JSON text:
+
+    b'JR' | version (1 byte) | flags (1 byte) | policy length (4 bytes, big endian) | policy | fields
+
+The policy is canonical JSON (sorted keys, no whitespace, UTF-8), so it is valid
+JSON that can go straight to IAM and identical policies encode identically.
+Policies of JIT_RECORD_COMPRESS_MIN bytes or more are zstd-compressed when
+zstandard is installed. The other fields are a msgpack array [request_id, {...}]
+(JSON when msgpack is not installed, marked by a flag).
+
+RecordView reads a record without copying it: the header is unpacked in place,
+the fields are unpacked from a memoryview and the policy is only decoded when
+asked for. Records written before this codec (JSON text whose llm_policy may be
+a Python repr) are still decoded, and come back with a canonical policy.
+"""
+import os
+import json
+import struct
+import threading
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from . import risk
+except ImportError:  # shipped flat next to this script
+    import risk
+
+# Constants and configuration
+COMPRESS_MIN = int(os.getenv('JIT_RECORD_COMPRESS_MIN', '512'))  # policy bytes from which zstd is tried
+ZSTD_LEVEL = 3
+MAGIC = b'JR'
+VERSION = 1
+HEADER = struct.Struct('>2sBBI')
+POLICY_ZSTD = 0x01  # the policy section is zstd-compressed
+FIELDS_JSON = 0x02  # the fields section is JSON instead of msgpack
+
+_local = threading.local()  # zstd contexts are not thread safe
+
+
+class RecordError(Exception):
+    """Raised for records that cannot be decoded."""
+
+
+def _compressor():
+    if not hasattr(_local, 'compressor'):
+        _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _local.compressor
+
+
+def _decompressor():
+    if not hasattr(_local, 'decompressor'):
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.decompressor
+
+
+def canonical_policy(policy):
+    """Canonical JSON bytes of a policy given as a dict, JSON or the legacy str(dict); b'' for no policy."""
+    if policy in (None, '', b''):
+        return b''
+    if isinstance(policy, (bytes, bytearray, memoryview)):
+        policy = bytes(policy).decode('utf-8')
+    try:
+        document = risk.load_policy(policy)
+    except (ValueError, SyntaxError) as e:
+        raise RecordError(f"policy is neither JSON nor a policy literal: {e}")
+    return json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode(request_id, record, compress_min=COMPRESS_MIN):
+    """Bytes for one record; its llm_policy may be a dict, JSON or the legacy str(dict)."""
+    fields = dict(record)
+    policy = canonical_policy(fields.pop('llm_policy', None))
+    flags = 0
+    if zstandard is not None and len(policy) >= compress_min:
+        compressed = _compressor().compress(policy)
+        if len(compressed) < len(policy):
+            policy, flags = compressed, flags | POLICY_ZSTD
+    if msgpack is not None:
+        packed = msgpack.packb([request_id, fields], use_bin_type=True)
+    else:
+        packed, flags = json.dumps([request_id, fields], separators=(',', ':')).encode('utf-8'), flags | FIELDS_JSON
+    return HEADER.pack(MAGIC, VERSION, flags, len(policy)) + policy + packed
+
+
+class RecordView:
+    """Zero-copy access to an encoded record; sections are decoded only when used."""
+
+    def __init__(self, blob):
+        self.buffer = memoryview(blob)
+        if len(self.buffer) < HEADER.size:
+            raise RecordError("record is shorter than its header")
+        magic, self.version, self.flags, length = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise RecordError("not an encoded record")
+        if self.version != VERSION:
+            raise RecordError(f"unsupported record version {self.version}")
+        self._policy = self.buffer[HEADER.size:HEADER.size + length]
+        self._fields = self.buffer[HEADER.size + length:]
+        self._unpacked = None
+
+    def _unpack(self):
+        if self._unpacked is None:
+            if self.flags & FIELDS_JSON:
+                self._unpacked = json.loads(bytes(self._fields))
+            elif msgpack is None:
+                raise RecordError("record fields are msgpack, which is not installed")
+            else:
+                self._unpacked = msgpack.unpackb(self._fields, raw=False)
+        return self._unpacked
+
+    @property
+    def request_id(self):
+        return self._unpack()[0]
+
+    @property
+    def fields(self):
+        """Every field but the policy."""
+        return self._unpack()[1]
+
+    @property
+    def policy_bytes(self):
+        """Canonical policy JSON: a view into the record unless it has to be decompressed."""
+        if not self.flags & POLICY_ZSTD:
+            return self._policy
+        if zstandard is None:
+            raise RecordError("record policy is zstd-compressed, but zstandard is not installed")
+        return memoryview(_decompressor().decompress(self._policy))
+
+    @property
+    def policy(self):
+        """Canonical policy JSON as text, as IAM expects it."""
+        return str(self.policy_bytes, 'utf-8')
+
+    @property
+    def policy_document(self):
+        return json.loads(self.policy) if len(self._policy) else None
+
+
+def _decode_legacy(blob):
+    text = bytes(blob).decode('utf-8')
+    try:
+        stored = json.loads(text)
+    except ValueError:
+        stored = json.loads(text.replace("'", '"'))  # what the readers used to do
+    if not isinstance(stored, dict) or len(stored) != 1:
+        raise RecordError("legacy record is not {request_id: record}")
+    request_id, record = next(iter(stored.items()))
+    record = dict(record)
+    try:
+        record['llm_policy'] = canonical_policy(record.get('llm_policy')).decode('utf-8')
+    except RecordError:
+        pass  # left as stored; IAM validation reports it
+    return request_id, record
+
+
+def decode(blob):
+    """(request_id, record) from an encoded or legacy record; llm_policy is canonical JSON text."""
+    if bytes(blob[:len(MAGIC)]) != MAGIC:
+        try:
+            return _decode_legacy(blob)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise RecordError(f"unreadable record: {e}")
+    view = RecordView(blob)
+    record = dict(view.fields)
+    record['llm_policy'] = view.policy
+    return view.request_id, record
+
+
+def store_request(rd, request_id, record):
+    """Store a record under its request ID; `rd` may be a pipeline."""
+    rd.sadd(str(request_id), encode(str(request_id), record))
+
+
+def load_request(rd, request_id):
+    """The stored {request_id: record}, or None when there is no record."""
+    members = rd.smembers(str(request_id))
+    if not members:
+        return None
+    _, record = decode(next(iter(members)))
+    return {request_id: record}
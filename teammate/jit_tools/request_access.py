@@ -1,16 +1,33 @@
 import os
 import sys
 from datetime import datetime, timedelta
-import requests
 import uuid
 import json
 
 import argparse
 import redis
 from redis.exceptions import ResponseError, ConnectionError
-from litellm import completion
-import boto3
-import asyncio
+
+try:
+  from shared import tracing, lazy, resilience
+except ImportError:  # shipped flat next to this script
+  import tracing
+  import lazy
+  import resilience
+try:
+  from . import idempotency, request_state, audit, metrics, risk, policy_gen, records
+except ImportError:  # shipped flat next to this script
+  import idempotency
+  import request_state
+  import audit
+  import metrics
+  import risk
+  import policy_gen
+  import records
+
+# Only needed on a cache miss / when notifying
+boto3 = lazy.module('boto3')
+requests = lazy.module('requests')
 
 USER_EMAIL = os.getenv('KUBIYA_USER_EMAIL')
 SLACK_CHANNEL_ID = os.getenv('SLACK_CHANNEL_ID')
@@ -29,6 +46,13 @@ GPT_API_KEY=os.getenv('GPT_API_KEY')
 GPT_ENDPOINT=os.getenv('GPT_ENDPOINT')
 AWS_ACCESS_KEY_ID=os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY=os.getenv('AWS_SECRET_ACCESS_KEY')
+IAM_ENDPOINT_URL=os.getenv('IAM_ENDPOINT_URL')  # None = the AWS default endpoint
+REQUEST_DEDUP_TTL=int(os.getenv('JIT_REQUEST_DEDUP_TTL', '600'))  # seconds a resubmission counts as a duplicate
+BULK_FIELDS=('purpose', 'ttl', 'permission_set_name', 'policy_description', 'aws_account_id', 'region')
+
+
+class RequestAccessError(Exception):
+  """Raised when a request cannot be sent for approval."""
 
 
 class StripArgument(argparse.Action):
@@ -47,40 +71,30 @@ class StripArgument(argparse.Action):
     setattr(namespace, self.dest, values.strip())
 
 
-def generate_policy(description: str, demo: bool = False) -> dict:
+def generate_policy(description: str, demo: bool = False, rd: redis.Redis = None) -> dict:
   """Generates a least privileged AWS IAM policy based on the provided description.
   
+  The policy comes from the backends configured in JIT_LLM_BACKENDS (see policy_gen.py),
+  routed by their recent latency and error rate.
+  
   Args:
     description (str): Natural language description of the required permissions
     demo (bool, optional): If True, returns a demo EC2 policy instead of generating one. Defaults to False
+    rd (redis.Redis, optional): Redis client holding the backends' latency and breaker state
   
   Returns:
     dict: Generated AWS IAM policy document
     
   Raises:
-    SystemExit: If policy generation fails or OpenAI API returns no response
+    SystemExit: If every policy generator backend fails
   """
   print("✨ Generating least privileged policy JSON...")
   if not demo:
-    messages = [{"content": f"Generate a least privileged policy JSON for the following description: {description} - return the JSON object.", "role": "user"}]
     try:
-      response = completion(model="gpt-4o", 
-                          messages=messages,
-                          api_key=GPT_API_KEY,
-                          base_url=GPT_ENDPOINT
-                          ) 
-      if not response['choices']:
-        print("❌ Error: No response from OpenAI API. Could not generate policy.")
-        sys.exit(1)
-      content = response['choices'][0]['message']['content']
-      start = content.find('{')
-      end = content.rfind('}')
-      policy = content[start:end+1] if start != -1 and end != -1 else content
-      jp = json.loads(policy)
-      print(f"✅ Generated least privileged policy ")
-
-      return jp
-    except Exception as e:
+      policy, backend = policy_gen.get_router(rd).generate(description)
+      print(f"✅ Generated least privileged policy with {backend}")
+      return policy
+    except (policy_gen.PolicyGenerationError, ValueError) as e:
       print(f"❌ Policy generation failed: {e}")
       sys.exit(1)
   else:
@@ -114,15 +128,19 @@ def validate_aws_policy(policy_document: dict) -> None:
     Exception: If policy structure is invalid
   """
   iam_client = boto3.client('iam',
+                      endpoint_url=IAM_ENDPOINT_URL,
                       aws_access_key_id=AWS_ACCESS_KEY_ID,
-                      aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+                      aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                      config=resilience.boto_config('iam'))
   policy_document_json = json.dumps(policy_document)
   try:
   # Attempt simulation with an empty list of actions, which won't simulate but will validate structure
-    response = iam_client.simulate_custom_policy(
-      PolicyInputList=[policy_document_json],
-      ActionNames=[],
-    )
+    with tracing.span('iam.simulate_custom_policy'):
+      response = resilience.dependency('iam').call(
+        iam_client.simulate_custom_policy,
+        PolicyInputList=[policy_document_json],
+        ActionNames=[],
+      )
     print(f"✅ Policy structure is valid.")
 
   except Exception as e:
@@ -172,72 +190,144 @@ def time_format(ttl: str) -> int:
     ttl_minutes = 30 * 24 * 60
   return ttl_minutes
 
-if __name__ == "__main__":
-  """Main execution block for handling JIT access requests.
-  
-  Command-line Arguments:
-    --purpose (list[str]): Purpose of the JIT permissions request
-    --ttl (str): Time-to-live for the permissions in format {number}{unit}
-    --permission_set_name (list[str]): Name of the permissions set
-    --policy_description (list[str]): Description for policy generation
-    
-  Environment Variables Required:
-    USER_EMAIL: Kubiya user email
-    SLACK_CHANNEL_ID: Slack channel ID
-    SLACK_THREAD_TS: Slack thread timestamp
-    KUBIYA_USER_ORG: Kubiya organization
-    KUBIYA_JIT_WEBHOOK: JIT webhook URL
-    JIT_API_KEY: JIT API key
-    APPROVAL_SLACK_CHANNEL: Approval channel
-    BACKEND_URL: Redis backend URL
-    BACKEND_PORT: Redis backend port
-    BACKEND_DB: Redis database
-    BACKEND_PASS: Redis password
-    GPT_API_KEY: OpenAI API key
-    GPT_ENDPOINT: OpenAI API endpoint
-    AWS_ACCESS_KEY_ID: AWS access key
-    AWS_SECRET_ACCESS_KEY: AWS secret key
-  
-  Flow:
-    1. Parses command line arguments
-    2. Generates least privileged policy
-    3. Creates approval request
-    4. Stores request in Redis
-    5. Sends webhook for approval
+def parse_arguments() -> argparse.Namespace:
+  """Parses the command-line arguments passed by Kubiya.
+
+  Returns:
+    argparse.Namespace: The parsed arguments
   """
-  ### ----- Parse command-line arguments ----- ###
-  # Get args from Kubiya
   parser = argparse.ArgumentParser(description="Trigger a request for just in time permissions that require approval from another user.")
   parser.add_argument("--purpose", 
                     nargs='+', # action=StripArgument ,
-                    required=True, 
                     help="Purpose of the request for just in time permissions.")
-  parser.add_argument("--ttl", required=True, help="The time to live (ttl) for the permissions request.")
+  parser.add_argument("--ttl", help="The time to live (ttl) for the permissions request.")
   parser.add_argument("--permission_set_name", 
-                    required=True, 
                     nargs='+', # action=StripArgument ,
                     help="The permissions set name for permissions request.")
   parser.add_argument("--policy_description", 
-                    required=True,
                     nargs='+', # action=StripArgument ,
                     help="The policy description for the just in time request.")
   parser.add_argument("--region", required=False, help="The region of the resource in AWS for the JIT request.")
-  parser.add_argument("--aws_account_id", required=True, help="The AWS account ID for the JIT request.")
+  parser.add_argument("--aws_account_id", help="The AWS account ID for the JIT request.")
+  parser.add_argument("--bulk", help="JSON lines file of requests with the fields above, submitted together "
+                                     "with their policies generated in bulk.")
   args = parser.parse_args()
+  if not args.bulk:
+    missing = [f"--{name}" for name in BULK_FIELDS if name != 'region' and not getattr(args, name)]
+    if missing:
+      parser.error(f"the following arguments are required: {', '.join(missing)}")
+  return args
+
 
+def create_redis_client() -> redis.Redis:
+  """Creates the Redis client used to persist requests, with timeouts and retries.
+
+  Returns:
+    redis.Redis: The Redis client
+  """
+  return redis.Redis(host=BACKEND_URL, 
+                     port=BACKEND_PORT, 
+                     password=BACKEND_PASS,
+                     **resilience.redis_options())
+
+
+def request_fingerprint(args: argparse.Namespace) -> str:
+  """Digest of everything that makes two submissions the same logical request.
+
+  Args:
+    args (argparse.Namespace): The parsed arguments
+
+  Returns:
+    str: A digest identifying the request of this user with these inputs
+  """
+  return idempotency.payload_digest({
+    'user_email': USER_EMAIL,
+    'purpose': args.purpose,
+    'ttl': args.ttl,
+    'permission_set_name': args.permission_set_name,
+    'policy_description': args.policy_description,
+    'region': args.region,
+    'aws_account_id': args.aws_account_id,
+  })
+
+
+def describe_policy(args: argparse.Namespace) -> str:
+  """Builds the policy generation prompt input for one request.
+
+  Args:
+    args (argparse.Namespace): The parsed arguments
+
+  Returns:
+    str: The description, with the region and account appended
+  """
+  return ' '.join(args.policy_description) + f" - region: {args.region} - account ID: {args.aws_account_id}"
+
+
+def resume_point(rd: redis.Redis, fingerprint: str) -> resilience.Checkpoint:
+  """The resume point of a request: its stages completed by earlier, failed submissions.
+
+  Args:
+    rd (redis.Redis): The Redis client
+    fingerprint (str): The request fingerprint, see request_fingerprint
+
+  Returns:
+    resilience.Checkpoint: Holds the request ID and generated policy once generation succeeded
+  """
+  return resilience.Checkpoint(rd, f"request:{fingerprint}")
+
+
+def resumed_request_id(checkpoint: resilience.Checkpoint) -> str:
+  """The request ID of an unfinished earlier submission, or a new one."""
+  resumed = checkpoint.get('policy')
+  return resumed['request_id'] if resumed else create_request_id()
+
+
+def submit_request(rd: redis.Redis, args: argparse.Namespace, request_id: str,
+                   llm_policy: dict = None, llm_ms: int = 0, checkpoint: resilience.Checkpoint = None) -> str:
+  """Generates the policy, stores the approval request and sends it for approval.
+
+  Each stage (policy generated, request stored, approvers notified) is recorded in
+  `checkpoint`, so a submission that failed part way resumes at the failed stage
+  instead of generating the policy again.
+
+  Args:
+    rd (redis.Redis): The Redis client
+    args (argparse.Namespace): The parsed arguments
+    request_id (str): The request ID, also used as the policy name
+    llm_policy (dict, optional): A policy already generated for this request, e.g. in bulk
+    llm_ms (int, optional): Milliseconds spent generating `llm_policy`
+    checkpoint (resilience.Checkpoint, optional): Resume point of the request, see resume_point.
+      Defaults to one for this request ID alone
+
+  Returns:
+    str: The request ID
+
+  Raises:
+    RequestAccessError: If the approval webhook rejects the request
+    resilience.DependencyError: If Kubiya is still failing after retries
+  """
   # Parameters
   purpose = args.purpose
   ttl = args.ttl
-  region = args.region
   aws_account_id = args.aws_account_id
   permission_set_name = args.permission_set_name
-  policy_description = ' '.join(args.policy_description) + f" - region: {region} - account ID: {aws_account_id}"
-  policy_name = create_request_id()
-  request_id = policy_name
-  llm_policy = generate_policy(policy_description)
+  policy_name = request_id
+  checkpoint = checkpoint or resilience.Checkpoint(rd, f"request:{request_id}")
+  resumed = checkpoint.get('policy')
+  if resumed:
+    print(f"⏭️ Resuming request {request_id} with its already generated policy")
+    llm_policy, llm_ms = resumed['llm_policy'], resumed['llm_ms']
+  else:
+    if llm_policy is None:
+      started = datetime.utcnow()
+      llm_policy = generate_policy(describe_policy(args), rd=rd)
+      llm_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
+    checkpoint.mark('policy', {'request_id': request_id, 'llm_policy': llm_policy, 'llm_ms': llm_ms})
   print(llm_policy)
   # validate_aws_policy(str(llm_policy))
   ttl_minutes = time_format(ttl)
+  report = risk.score_policy(llm_policy, ttl_minutes, aws_account_id)
+  print(f"📝 Risk score {report.score} ({report.level}): {', '.join(report.reasons)}")
   
   approval_request = {
     'user_email': USER_EMAIL,
@@ -261,26 +351,41 @@ if __name__ == "__main__":
                         'ttl_min': approval_request['ttl_minutes'],
                         'policy_name': approval_request['policy_name'],
                         'permission_set_name': approval_request['permission_set_name'],
-                        'llm_policy': str(approval_request['llm_policy']),
+                        'llm_policy': approval_request['llm_policy'],
                         'requested_at': approval_request['requested_at'],
                         'expires_at': approval_request['expires_at'],
                         'user_email': approval_request['user_email'],
                         'slack_channel_id': approval_request['slack_channel_id'],
                         'slack_thread_ts': approval_request['slack_thread_ts'],
                         'purpose': approval_request['purpose'],
+                        'aws_account_id': aws_account_id,
+                        'risk_score': report.score,
                         }
                       }
    
   print(f"✅ For Request ID:\n\n{request_id}")
-  print(BACKEND_DB, BACKEND_PORT, BACKEND_URL, BACKEND_PASS)
   print(f"📝 Post to Redis for approval request")
 
-  ### ----- Redis Client ----- ###
-  rd = redis.Redis(host=BACKEND_URL, 
-                  port=BACKEND_PORT, 
-                  password=BACKEND_PASS,)
-  # --- Store request in Redis --- #  
-  ressadd = rd.sadd(request_id, json.dumps(ap_request_json))
+  # --- Store request in Redis, registered as pending --- #
+  if not checkpoint.done('stored'):
+    pipe = rd.pipeline()
+    records.store_request(pipe, request_id, ap_request_json[request_id])
+    request_state.create_state(pipe, request_id, user_email=approval_request['user_email'],
+                               traceparent=tracing.traceparent())
+    audit.record(pipe, audit.CREATED, request_id, user=USER_EMAIL, actor=USER_EMAIL, account=aws_account_id,
+                 ttl_min=ttl_minutes, purpose=purpose)
+    audit.record(pipe, audit.POLICY_GENERATED, request_id, user=USER_EMAIL, account=aws_account_id, llm_ms=llm_ms,
+                 risk_score=report.score)
+    metrics.request_created(pipe)
+    metrics.observe(pipe, 'llm_seconds', llm_ms / 1000)
+    checkpoint.mark('stored', pipe=pipe)
+    with tracing.span('redis.store_request'):
+      pipe.execute()
+
+  ### ----- Fast lane: low-risk requests are approved here ----- ###
+  if risk.auto_approvable(report, ttl_minutes) and auto_approve(rd, request_id):
+    checkpoint.clear()
+    return request_id
 
   ### ----- LLM Setup ----- ### 
   # --- Prompt sent to new Kubiya agent thread TODO -- Add correct API endpoint or remove prompt and use webhook.
@@ -329,6 +434,7 @@ if __name__ == "__main__":
     'request_id': request_id, 
     'llm_policy': llm_policy,
     'ttl': ttl,
+    'traceparent': tracing.traceparent(),
     "source": "Triggered by an access request (Agent)",
     "updated_at": datetime.utcnow().isoformat() + "Z"
   }
@@ -337,16 +443,230 @@ if __name__ == "__main__":
   # response = requests.post("https://api.kubiya.ai/api/v1/event",headers={'Content-Type': 'application/json','Authorization': f'UserKey {JIT_API_KEY}'},json=payload)
   
   ### ----- Send to Webhook ----- ###
-  response = requests.post(
-    KUBIYA_JIT_WEBHOOK,
-    headers={
-      'Content-Type': 'application/json',
-    },
-    json=webhook_payload
-  )
+  # Timeouts, retries of 429/5xx and the breaker come from the 'kubiya' dependency
+  with tracing.span('kubiya.webhook') as span:
+    response = resilience.dependency('kubiya', rd).request(
+      requests, 'POST',
+      KUBIYA_JIT_WEBHOOK,
+      headers={
+        'Content-Type': 'application/json',
+        'traceparent': webhook_payload['traceparent'],
+      },
+      json=webhook_payload
+    )
+    span.set_attribute('http.status_code', response.status_code)
 
-  if response.status_code < 300:
-    print(f"✅ WAITING: Request submitted successfully and has been sent to an approver. Waiting for approval.")
-  else:
-    print(f"❌ Error sending webhook event: {response.status_code} - {response.text}")
-    sys.exit(1)
+  if response.status_code >= 300:
+    raise RequestAccessError(f"Error sending webhook event: {response.status_code} - {response.text}")
+  checkpoint.clear()
+  print(f"✅ WAITING: Request submitted successfully and has been sent to an approver. Waiting for approval.")
+
+  return request_id
+
+
+def auto_approve(rd: redis.Redis, request_id: str) -> bool:
+  """Approves and provisions a low-risk request in this invocation.
+
+  Args:
+    rd (redis.Redis): The Redis client
+    request_id (str): The stored request ID
+
+  Returns:
+    bool: True if the policy was provisioned, False if the request should go to a human approver
+  """
+  try:
+    from . import approve
+  except ImportError:  # shipped flat next to this script
+    import approve
+  try:
+    with tracing.span('request_access.auto_approve'):
+      result = approve.process_decision(rd, request_id, 'approve', risk.AUTO_APPROVER,
+                                        traceparent=tracing.traceparent(), auto_approve=True)
+  except approve.ApprovalError as e:
+    print(f"❌ Auto-approval failed, sending for approval instead: {e}")
+    return False
+  if not result['policy_arn']:
+    return False
+  metrics.incr(rd, 'auto_approved_total')
+  print(f"✅ APPROVED: Low-risk request approved automatically. Policy ARN: {result['policy_arn']}")
+  return True
+
+
+def load_bulk_requests(path: str) -> list:
+  """Reads bulk requests, one JSON object per line, into argument namespaces.
+
+  Args:
+    path (str): JSON lines file with purpose, ttl, permission_set_name, policy_description,
+      aws_account_id and optionally region
+
+  Returns:
+    list[argparse.Namespace]: One namespace per request, shaped like parse_arguments() output
+
+  Raises:
+    SystemExit: If a line is not JSON or misses a required field
+  """
+  requests_args = []
+  with open(path) as f:
+    for number, line in enumerate(f, 1):
+      if not line.strip():
+        continue
+      try:
+        entry = json.loads(line)
+      except ValueError as e:
+        print(f"❌ Line {number} of {path} is not JSON: {e}")
+        sys.exit(1)
+      missing = [name for name in BULK_FIELDS if name != 'region' and not entry.get(name)]
+      if missing:
+        print(f"❌ Line {number} of {path} misses {', '.join(missing)}")
+        sys.exit(1)
+      # multi-word fields are lists, as with nargs='+'
+      values = {name: entry.get(name) for name in BULK_FIELDS}
+      for name in ('purpose', 'permission_set_name', 'policy_description'):
+        if isinstance(values[name], str):
+          values[name] = values[name].split()
+      requests_args.append(argparse.Namespace(**values))
+  return requests_args
+
+
+def submit_bulk(rd: redis.Redis, path: str) -> list:
+  """Submits many requests from one invocation, generating their policies in bulk.
+
+  Duplicates of recently submitted requests are skipped as in a single submission.
+  Policies are generated by policy_gen.generate_bulk, except for requests resuming
+  an earlier failed submission; requests whose policy could not be generated are
+  reported and left for a retry.
+
+  Args:
+    rd (redis.Redis): The Redis client
+    path (str): JSON lines file of requests, see load_bulk_requests
+
+  Returns:
+    list[str]: The submitted request IDs
+  """
+  claimed, fresh = [], []
+  for args in load_bulk_requests(path):
+    fingerprint = request_fingerprint(args)
+    checkpoint = resume_point(rd, fingerprint)
+    request_id = resumed_request_id(checkpoint)
+    first, original_request_id = idempotency.claim(rd, 'request', fingerprint, value=request_id, ttl=REQUEST_DEDUP_TTL)
+    if not first:
+      print(f"✅ Duplicate submission, request already created:\n\n{original_request_id}")
+      continue
+    claimed.append((args, request_id, fingerprint, checkpoint))
+    if not checkpoint.done('policy'):
+      fresh.append(len(claimed) - 1)
+  if not claimed:
+    return []
+
+  policies, errors, llm_ms = {}, {}, 0
+  if fresh:
+    print(f"✨ Generating {len(fresh)} least privileged policies in bulk...")
+    with tracing.span('llm.bulk', requests=len(fresh)) as span:
+      result = policy_gen.generate_bulk(policy_gen.get_router(rd), [describe_policy(claimed[i][0]) for i in fresh])
+      for key, value in result.stats.items():
+        span.set_attribute(key, value)
+    print(f"📝 Bulk generation: {json.dumps(result.stats)}")
+    llm_ms = int(result.stats['wall_s'] * 1000 / len(fresh))
+    policies = dict(zip(fresh, result.policies))
+    errors = dict(zip(fresh, result.errors))
+
+  submitted = []
+  for i, (args, request_id, fingerprint, checkpoint) in enumerate(claimed):
+    if i in policies and policies[i] is None:
+      print(f"❌ Policy generation failed for {' '.join(args.permission_set_name)}: {errors[i]}")
+      idempotency.release(rd, 'request', fingerprint)
+      continue
+    try:
+      submitted.append(submit_request(rd, args, request_id, llm_policy=policies.get(i), llm_ms=llm_ms,
+                                      checkpoint=checkpoint))
+    except Exception as e:
+      print(f"❌ Submitting {' '.join(args.permission_set_name)} failed: {e}")
+      idempotency.release(rd, 'request', fingerprint)
+  print(f"✅ Submitted {len(submitted)} of {len(claimed)} requests")
+  return submitted
+
+
+def main() -> None:
+  """Main execution block for handling JIT access requests.
+  
+  Command-line Arguments:
+    --purpose (list[str]): Purpose of the JIT permissions request
+    --ttl (str): Time-to-live for the permissions in format {number}{unit}
+    --permission_set_name (list[str]): Name of the permissions set
+    --policy_description (list[str]): Description for policy generation
+    --bulk (str): JSON lines file of requests to submit together instead
+    
+  Environment Variables Required:
+    USER_EMAIL: Kubiya user email
+    SLACK_CHANNEL_ID: Slack channel ID
+    SLACK_THREAD_TS: Slack thread timestamp
+    KUBIYA_USER_ORG: Kubiya organization
+    KUBIYA_JIT_WEBHOOK: JIT webhook URL
+    JIT_API_KEY: JIT API key
+    APPROVAL_SLACK_CHANNEL: Approval channel
+    BACKEND_URL: Redis backend URL
+    BACKEND_PORT: Redis backend port
+    BACKEND_DB: Redis database
+    BACKEND_PASS: Redis password
+    GPT_API_KEY: OpenAI API key
+    GPT_ENDPOINT: OpenAI API endpoint
+    AWS_ACCESS_KEY_ID: AWS access key
+    AWS_SECRET_ACCESS_KEY: AWS secret key
+  
+  Flow:
+    1. Parses command line arguments
+    2. Short-circuits duplicate submissions of the same request
+    3. Generates least privileged policy
+    4. Creates approval request
+    5. Stores request in Redis
+    6. Approves low-risk requests automatically, otherwise sends webhook for approval
+
+  A rerun of a submission that failed after step 3 resumes at the failed step.
+  """
+  ### ----- Parse command-line arguments ----- ###
+  # Get args from Kubiya
+  args = parse_arguments()
+
+  ### ----- Redis Client ----- ###
+  rd = create_redis_client()
+
+  if args.bulk:
+    trace_id = tracing.start_trace()
+    with tracing.span('request_access.bulk', user=USER_EMAIL):
+      submitted = submit_bulk(rd, args.bulk)
+    print(f"📝 Trace ID: {trace_id}")
+    if not submitted:
+      sys.exit(1)
+    return
+
+  ### ----- Deduplicate retried submissions ----- ###
+  # A retry of the same request within the window gets the original request ID back
+  # before any LLM, Redis or webhook work is done; a rerun of a failed one resumes it.
+  fingerprint = request_fingerprint(args)
+  checkpoint = resume_point(rd, fingerprint)
+  request_id = resumed_request_id(checkpoint)
+  trace_id = tracing.start_trace()
+  with tracing.span('request_access', request_id=request_id, user=USER_EMAIL):
+    with tracing.span('redis.claim'):
+      first, original_request_id = idempotency.claim(rd, 'request', fingerprint,
+                                                     value=request_id, ttl=REQUEST_DEDUP_TTL)
+    if not first:
+      print(f"✅ Duplicate submission, request already created:\n\n{original_request_id}")
+      return
+
+    try:
+      submit_request(rd, args, request_id, checkpoint=checkpoint)
+    except (RequestAccessError, resilience.DependencyError) as e:
+      idempotency.release(rd, 'request', fingerprint)
+      print(f"❌ {e}")
+      print(f"📝 Progress is kept: submit the same request again to resume {request_id}")
+      sys.exit(1)
+    except BaseException:
+      # Let a retry of this request run again instead of being treated as a duplicate
+      idempotency.release(rd, 'request', fingerprint)
+      raise
+  print(f"📝 Trace ID: {trace_id}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,133 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from redis.exceptions import WatchError
+
+try:
+    from shared import tracing
+except ImportError:  # shipped flat next to this script
+    import tracing
+
+# Constants and configuration
+STATE_PREFIX = 'jit:state:'
+TRANSITION_RETRIES = int(os.getenv('JIT_TRANSITION_RETRIES', '10'))
+
+PENDING = 'pending'
+APPROVED = 'approved'
+DENIED = 'denied'
+PROVISIONED = 'provisioned'
+EXPIRED = 'expired'
+REVOKED = 'revoked'
+
+# target state -> states it may be entered from
+#   pending -> approved/denied -> provisioned -> expired/revoked
+# approved -> pending is the compensating edge used when provisioning fails, so the
+# decision can be retried instead of the request being stuck in approved.
+TRANSITIONS = {
+    APPROVED: {PENDING},
+    DENIED: {PENDING},
+    PENDING: {APPROVED},
+    PROVISIONED: {APPROVED, PROVISIONED},  # PROVISIONED -> PROVISIONED extends or changes a grant
+    EXPIRED: {PROVISIONED},
+    REVOKED: {PROVISIONED, APPROVED},
+}
+
+Transition = namedtuple('Transition', ['ok', 'from_state', 'to_state', 'version'])
+
+
+def state_key(request_id):
+    return f"{STATE_PREFIX}{request_id}"
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_state(rd, request_id, **fields):
+    """Register a new request as pending. A no-op for a request that already has a state.
+
+    `rd` may be a client or a pipeline, so the state can be written together with the record.
+    """
+    key = state_key(request_id)
+    rd.hsetnx(key, 'status', PENDING)
+    rd.hsetnx(key, 'version', 0)
+    rd.hsetnx(key, 'created_at', now_iso())
+    for name, value in fields.items():
+        if value is not None:
+            rd.hsetnx(key, name, value)
+
+
+def get_state(rd, request_id):
+    """Return the state hash of a request as a dict of str (status defaults to pending)."""
+    state = {_decode(k): _decode(v) for k, v in rd.hgetall(state_key(request_id)).items()}
+    state.setdefault('status', PENDING)
+    state['version'] = int(state.get('version', 0))
+    return state
+
+
+def chain(*hooks):
+    """Combine several pipeline hooks into one; None entries are skipped."""
+    def hook(pipe, from_state, to_state):
+        for h in hooks:
+            if h:
+                h(pipe, from_state, to_state)
+    return hook
+
+
+def transition(rd, request_id, to_state, fields=None, from_states=None, pipeline_hook=None):
+    """Atomically move a request to `to_state` if its current state allows it.
+
+    Uses WATCH/MULTI on the state hash: concurrent approvers race on the same key and
+    exactly one of them wins; the others see `ok=False` and the state that beat them.
+    Side effects (IAM, scheduling, Slack) must only run when `ok` is True.
+
+    Args:
+        rd (redis.Redis): Redis client
+        request_id (str): the request ID
+        to_state (str): target state
+        fields (dict, optional): extra fields stored with the transition, e.g. policy_arn
+        from_states (set, optional): allowed source states, defaults to TRANSITIONS[to_state]
+        pipeline_hook (callable, optional): hook(pipe, from_state, to_state) queuing extra
+            commands inside the same MULTI/EXEC, e.g. audit events or metrics
+
+    Returns:
+        Transition: (ok, from_state, to_state, version)
+    """
+    with tracing.span('redis.transition', to_state=to_state) as span:
+        result = _transition(rd, request_id, to_state, fields, from_states, pipeline_hook)
+        span.set_attribute('from_state', result.from_state)
+        span.set_attribute('applied', result.ok)
+        return result
+
+
+def _transition(rd, request_id, to_state, fields, from_states, pipeline_hook):
+    key = state_key(request_id)
+    allowed = TRANSITIONS[to_state] if from_states is None else set(from_states)
+    with rd.pipeline() as pipe:
+        for _ in range(TRANSITION_RETRIES):
+            try:
+                pipe.watch(key)
+                current = _decode(pipe.hget(key, 'status')) or PENDING
+                version = int(pipe.hget(key, 'version') or 0)
+                if current not in allowed:
+                    pipe.unwatch()
+                    return Transition(False, current, to_state, version)
+                mapping = {'status': to_state, 'version': version + 1,
+                           'updated_at': now_iso(), f"{to_state}_at": now_iso()}
+                mapping.update({k: v for k, v in (fields or {}).items() if v is not None})
+                pipe.multi()
+                pipe.hset(key, mapping=mapping)
+                if pipeline_hook:
+                    pipeline_hook(pipe, current, to_state)
+                pipe.execute()
+                return Transition(True, current, to_state, version + 1)
+            except WatchError:
+                # someone else changed the state between WATCH and EXEC; re-read and retry
+                continue
+    current = get_state(rd, request_id)
+    return Transition(False, current['status'], to_state, current['version'])
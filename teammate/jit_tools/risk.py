@@ -0,0 +1,215 @@
+"""Static risk scoring of generated IAM policies.
+
+A policy is scored 0-100 from lookup tables alone (no AWS calls): the access
+level and service of every allowed action, wildcards in actions and resources,
+permissions-management actions such as iam:PassRole, ARNs in other accounts and
+the length of the grant. Requests scoring below JIT_AUTO_APPROVE_THRESHOLD are
+approved in the same invocation instead of waiting for a human.
+
+    >>> report = score_policy(policy, ttl_minutes=60, account_id='123456789012')
+    >>> report.score, report.reasons
+    (7, ['ec2:DescribeInstances: list', 'Resource "*"', 'ttl 60m'])
+"""
+import os
+import ast
+import json
+import math
+from fnmatch import fnmatchcase
+from collections import namedtuple
+from functools import lru_cache
+
+# Constants and configuration
+AUTO_APPROVE_THRESHOLD = float(os.getenv('JIT_AUTO_APPROVE_THRESHOLD', '0'))  # 0 disables the fast lane
+AUTO_APPROVE_MAX_TTL = int(os.getenv('JIT_AUTO_APPROVE_MAX_TTL', str(8 * 60)))  # minutes
+AUTO_APPROVER = 'jit-auto-approve'
+MAX_SCORE = 100
+
+LIST, READ, TAGGING, WRITE, DESTRUCTIVE, PERMISSIONS = 'list', 'read', 'tagging', 'write', 'destructive', 'permissions'
+LEVEL_POINTS = {LIST: 1, READ: 2, TAGGING: 5, WRITE: 10, DESTRUCTIVE: 20, PERMISSIONS: 40}
+_LEVEL_RANK = {level: rank for rank, level in enumerate(LEVEL_POINTS)}
+
+# action verb prefix -> access level; longest prefix wins, anything unmatched is a write
+VERB_LEVELS = {
+    'List': LIST, 'Describe': LIST, 'Lookup': LIST, 'Search': LIST, 'Head': READ,
+    'Get': READ, 'BatchGet': READ, 'Query': READ, 'Scan': READ, 'Select': READ, 'View': READ,
+    'Filter': READ, 'Download': READ, 'Export': READ, 'Retrieve': READ,
+    'Tag': TAGGING, 'Untag': TAGGING,
+    'Delete': DESTRUCTIVE, 'BatchDelete': DESTRUCTIVE, 'Terminate': DESTRUCTIVE, 'Remove': DESTRUCTIVE,
+    'Purge': DESTRUCTIVE, 'Disable': DESTRUCTIVE, 'Deregister': DESTRUCTIVE, 'Revoke': DESTRUCTIVE,
+    'Stop': DESTRUCTIVE, 'Detach': DESTRUCTIVE, 'Cancel': DESTRUCTIVE, 'Reset': DESTRUCTIVE,
+}
+_VERBS = sorted(VERB_LEVELS, key=len, reverse=True)
+
+# actions that change who can do what, whatever their verb says
+PERMISSIONS_ACTIONS = frozenset(a.lower() for a in (
+    'iam:AttachUserPolicy', 'iam:AttachRolePolicy', 'iam:AttachGroupPolicy',
+    'iam:PutUserPolicy', 'iam:PutRolePolicy', 'iam:PutGroupPolicy',
+    'iam:CreatePolicy', 'iam:CreatePolicyVersion', 'iam:SetDefaultPolicyVersion',
+    'iam:UpdateAssumeRolePolicy', 'iam:CreateAccessKey', 'iam:CreateLoginProfile',
+    'iam:UpdateLoginProfile', 'iam:AddUserToGroup', 'iam:CreateRole', 'iam:CreateUser',
+    'iam:PutUserPermissionsBoundary', 'iam:PutRolePermissionsBoundary',
+    'iam:DeleteUserPermissionsBoundary', 'iam:DeleteRolePermissionsBoundary',
+    'sts:AssumeRole', 'sts:AssumeRoleWithSAML', 'sts:AssumeRoleWithWebIdentity', 'sts:GetFederationToken',
+    's3:PutBucketPolicy', 's3:DeleteBucketPolicy', 's3:PutBucketAcl', 's3:PutObjectAcl',
+    's3:PutAccountPublicAccessBlock', 's3:PutBucketPublicAccessBlock',
+    'kms:PutKeyPolicy', 'kms:CreateGrant', 'lambda:AddPermission', 'lambda:CreateFunctionUrlConfig',
+    'sns:AddPermission', 'sqs:AddPermission', 'secretsmanager:PutResourcePolicy',
+    'ecr:SetRepositoryPolicy', 'glue:PutResourcePolicy', 'ssm:StartSession', 'ec2:CreateKeyPair',
+))
+PASS_ROLE = 'iam:passrole'
+PASS_ROLE_POINTS = 35
+
+# extra points for any action in a service that holds credentials or controls access
+SERVICE_POINTS = {
+    'iam': 15, 'organizations': 20, 'sts': 10, 'kms': 10, 'secretsmanager': 10, 'ssm': 5,
+    'account': 20, 'sso': 15, 'identitystore': 10, 'cloudtrail': 10, 'config': 5, 'guardduty': 10,
+}
+
+FULL_WILDCARD_POINTS = MAX_SCORE      # "Action": "*"
+SERVICE_WILDCARD_POINTS = 40          # "Action": "s3:*"
+NOT_ACTION_POINTS = 40                # NotAction/NotResource allow everything else
+WILDCARD_RESOURCE_POINTS = {LIST: 1, READ: 3, TAGGING: 5, WRITE: 15, DESTRUCTIVE: 20, PERMISSIONS: 25}
+CROSS_ACCOUNT_POINTS = 25
+TTL_POINTS_PER_DOUBLING = 5           # 1h = 5, 4h ~ 12, 1d ~ 23
+TTL_MAX_POINTS = 30
+
+RiskReport = namedtuple('RiskReport', ['score', 'level', 'reasons'])
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def load_policy(policy):
+    """Policy document from a dict, a JSON string or the str(dict) form of records stored before records.py."""
+    if isinstance(policy, dict):
+        return policy
+    try:
+        return json.loads(policy)
+    except (TypeError, ValueError):
+        return ast.literal_eval(policy)
+
+
+@lru_cache(maxsize=4096)
+def classify_action(action):
+    """(access level, points) of one action pattern such as 's3:GetObject' or 'ec2:Describe*'."""
+    lowered = action.lower()
+    if lowered == '*':
+        return PERMISSIONS, FULL_WILDCARD_POINTS
+    service, _, name = action.partition(':')
+    service_points = SERVICE_POINTS.get(service.lower(), 0)
+    if name == '*':
+        return PERMISSIONS, SERVICE_WILDCARD_POINTS + service_points
+    if lowered == PASS_ROLE:
+        return PERMISSIONS, PASS_ROLE_POINTS
+    if lowered in PERMISSIONS_ACTIONS:
+        return PERMISSIONS, LEVEL_POINTS[PERMISSIONS] + service_points
+    level = next((VERB_LEVELS[verb] for verb in _VERBS if name.startswith(verb)), WRITE)
+    if '*' in lowered or '?' in lowered:
+        # a partial wildcard anywhere, as in iam:*Policy or iam:Put*Policy, may match permissions-management actions
+        if any(fnmatchcase(a, lowered) for a in PERMISSIONS_ACTIONS) or fnmatchcase(PASS_ROLE, lowered):
+            return PERMISSIONS, LEVEL_POINTS[PERMISSIONS] + service_points
+        return level, LEVEL_POINTS[level] + service_points + 2
+    return level, LEVEL_POINTS[level] + service_points
+
+
+def _ttl_points(ttl_minutes):
+    if not ttl_minutes:
+        return 0
+    return min(TTL_MAX_POINTS, TTL_POINTS_PER_DOUBLING * math.log2(1 + ttl_minutes / 60))
+
+
+def _arn_account(resource):
+    parts = resource.split(':', 5)
+    return parts[4] if len(parts) == 6 and parts[0] == 'arn' else ''
+
+
+def wildcard_resource(resource):
+    """Whether a Resource covers every resource of its kind: "*" or an ARN like arn:aws:s3:::* or role/*."""
+    if resource == '*':
+        return True
+    parts = resource.split(':', 5) if isinstance(resource, str) else ()
+    if len(parts) != 6 or parts[0] != 'arn':
+        return False
+    if parts[2] == 's3':
+        name = parts[5].split('/', 1)[0]  # the bucket; objects of a named bucket are scoped by it
+    else:
+        name = parts[5].replace(':', '/', 1).split('/', 1)[-1]  # the name after any resource type
+    return name == '*'
+
+
+def score_statement(statement, account_id=None):
+    """(points, reasons) for one Allow statement."""
+    reasons, points, worst_level = [], 0, LIST
+    if 'NotAction' in statement or 'NotResource' in statement:
+        points += NOT_ACTION_POINTS
+        reasons.append('NotAction/NotResource')
+        worst_level = PERMISSIONS
+    actions = _as_list(statement.get('Action'))
+    action_points = []
+    for action in actions:
+        level, action_score = classify_action(action)
+        action_points.append(action_score)
+        if _LEVEL_RANK[level] > _LEVEL_RANK[worst_level]:
+            worst_level = level
+        if action_score >= LEVEL_POINTS[WRITE]:
+            reasons.append(f"{action}: {level}")
+    if action_points:
+        # the riskiest action dominates; the rest add a little each
+        action_points.sort(reverse=True)
+        points += action_points[0] + 0.1 * sum(action_points[1:])
+        if action_points[0] < LEVEL_POINTS[WRITE]:
+            reasons.append(f"{actions[0]}: {classify_action(actions[0])[0]}" if len(actions) == 1
+                           else f"{len(actions)} read/list actions")
+    resources = _as_list(statement.get('Resource'))
+    wildcard = next((r for r in resources if wildcard_resource(r)), None)
+    if wildcard is not None:
+        points += WILDCARD_RESOURCE_POINTS[worst_level]
+        reasons.append(f'Resource "{wildcard}"')
+    if account_id:
+        foreign = sorted({a for a in map(_arn_account, resources) if a and a != '*' and a != str(account_id)})
+        if foreign:
+            points += CROSS_ACCOUNT_POINTS
+            reasons.append(f"cross-account: {', '.join(foreign)}")
+    return points, reasons
+
+
+def score_policy(policy, ttl_minutes=None, account_id=None):
+    """Score a policy document for the fast lane.
+
+    Args:
+        policy (dict|str): the policy document
+        ttl_minutes (int, optional): length of the grant
+        account_id (str, optional): the requested account; ARNs in other accounts add risk
+
+    Returns:
+        RiskReport: (score 0-100, 'low'|'medium'|'high', reasons)
+    """
+    try:
+        document = load_policy(policy)
+        statements = _as_list(document.get('Statement'))
+    except (ValueError, SyntaxError, AttributeError):
+        return RiskReport(MAX_SCORE, 'high', ['unparsable policy'])
+    score, reasons = 0.0, []
+    for statement in statements:
+        if not isinstance(statement, dict) or statement.get('Effect') != 'Allow':
+            continue
+        points, statement_reasons = score_statement(statement, account_id)
+        score += points
+        reasons += statement_reasons
+    if ttl_minutes:
+        score += _ttl_points(ttl_minutes)
+        reasons.append(f"ttl {ttl_minutes}m")
+    score = min(MAX_SCORE, int(round(score)))
+    level = 'low' if score < 25 else 'medium' if score < 50 else 'high'
+    return RiskReport(score, level, reasons)
+
+
+def auto_approvable(report, ttl_minutes=None, threshold=None):
+    """True when the fast lane is enabled and the request is under its threshold and TTL cap."""
+    threshold = AUTO_APPROVE_THRESHOLD if threshold is None else threshold
+    if threshold <= 0 or (ttl_minutes and ttl_minutes > AUTO_APPROVE_MAX_TTL):
+        return False
+    return report.score < threshold
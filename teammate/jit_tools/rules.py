@@ -0,0 +1,300 @@
+"""Declarative approval rules, compiled into an index by (account, service, level).
+
+The rules file (JSON, or YAML when PyYAML is installed) lists rules in priority
+order; for every service/access level a policy touches, the first matching rule
+decides who may approve and how many approvals are needed:
+
+    {
+      "groups": {"ops": ["adsaunde1@gmail.com"], "data": ["ana@example.com", "li@example.com"]},
+      "rules": [
+        {"name": "data-s3-read", "accounts": ["111111111111"], "services": ["s3"], "levels": ["list", "read"],
+         "requesters": ["group:data"], "max_ttl": "4h", "self_approve": true, "approvers": ["group:ops"]},
+        {"name": "prod-writes", "accounts": ["222222222222"], "levels": ["tagging", "write", "destructive", "permissions"],
+         "approvers": ["group:ops"], "min_approvers": 2},
+        {"name": "default", "approvers": ["group:ops", "kubiya:<group id>"]}
+      ]
+    }
+
+Omitted accounts/services/levels match anything. `requesters` and `max_ttl` are
+conditions: a request outside them falls through to the next rule. Approvers are
+emails, `group:<name>` from "groups", or `kubiya:<group id>` resolved through the
+Kubiya groups API. Levels are the access levels of risk.py.
+
+Rules are compiled once per file version: each rule is placed in the bucket of
+every (account, service, level) key it names, with '*' for omitted fields, so a
+lookup reads at most eight buckets instead of scanning the rule list.
+"""
+import os
+import json
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    from . import risk, request_state
+except ImportError:  # shipped flat next to this script
+    import risk
+    import request_state
+
+# Constants and configuration
+RULES_FILE = os.getenv('JIT_RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'approval_rules.json'))
+VOTES_PREFIX = 'jit:votes:'
+VOTES_TTL = int(os.getenv('JIT_VOTES_TTL', str(7 * 24 * 60 * 60)))  # seconds votes on a request are kept
+ANY = '*'
+LEVELS = tuple(risk.LEVEL_POINTS)
+TTL_UNITS = {'m': 1, 'h': 60, 'd': 60 * 24}
+DECISIONS = {'approve': 'approve', 'approved': 'approve', 'deny': 'deny', 'denied': 'deny', 'rejected': 'deny'}
+
+Rule = namedtuple('Rule', ['index', 'name', 'requesters', 'max_ttl', 'approvers', 'self_approve', 'min_approvers'])
+Verdict = namedtuple('Verdict', ['allowed', 'required_approvals', 'rules', 'reason'])
+# votes: distinct approvals so far, None when none was recorded; status: set when the request is no longer pending
+Ballot = namedtuple('Ballot', ['decision', 'verdict', 'votes', 'status'])
+
+
+class RulesError(Exception):
+    """Raised when the rules file is invalid, or a decision is invalid or not allowed."""
+
+
+def parse_ttl(value):
+    """'4h' -> 240 minutes; plain numbers are minutes."""
+    if value is None or isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value[-1:] in TTL_UNITS:
+        return int(value[:-1]) * TTL_UNITS[value[-1]]
+    return int(value)
+
+
+def policy_scopes(policy):
+    """Set of (service, level) pairs a policy's Allow statements grant."""
+    document = risk.load_policy(policy)
+    scopes = set()
+    for statement in risk._as_list(document.get('Statement')):
+        if not isinstance(statement, dict) or statement.get('Effect') != 'Allow':
+            continue
+        if 'NotAction' in statement:
+            scopes.add((ANY, risk.PERMISSIONS))
+        for action in risk._as_list(statement.get('Action')):
+            level, _ = risk.classify_action(action)
+            service = action.partition(':')[0].lower() if action != '*' else ANY
+            scopes.add((service, level))
+    return scopes
+
+
+class RulesEngine:
+    """Compiled rule set; evaluate() decides whether an approver may decide a request."""
+
+    def __init__(self, config, default_approvers=()):
+        groups = {name: {m.lower() for m in members} for name, members in (config.get('groups') or {}).items()}
+        # who may deny a request no rule can judge (its policy cannot be parsed or no rule covers it)
+        self.default_approvers = self._principals(default_approvers, groups, 'default')
+        self.rules, self.index = [], {}
+        for i, raw in enumerate(config.get('rules') or []):
+            levels = [level.lower() for level in raw.get('levels') or [ANY]]
+            unknown = set(levels) - set(LEVELS) - {ANY}
+            if unknown:
+                raise RulesError(f"rule {raw.get('name', i)}: unknown levels {sorted(unknown)}")
+            rule = Rule(index=i,
+                        name=raw.get('name') or f"rule-{i}",
+                        requesters=self._principals(raw.get('requesters'), groups, i) if raw.get('requesters') else None,
+                        max_ttl=parse_ttl(raw.get('max_ttl')),
+                        approvers=self._principals(raw.get('approvers') or [], groups, i),
+                        self_approve=bool(raw.get('self_approve')),
+                        min_approvers=int(raw.get('min_approvers', 1)))
+            self.rules.append(rule)
+            for account in raw.get('accounts') or [ANY]:
+                for service in raw.get('services') or [ANY]:
+                    for level in levels:
+                        self.index.setdefault((str(account), service.lower(), level), []).append(rule)
+        self.candidates = lru_cache(maxsize=4096)(self._candidates)
+        # Kubiya groups the rules refer to, for keeping the approver directory warm
+        self.kubiya_groups = sorted({g for rule in self.rules for principals in (rule.approvers, rule.requesters)
+                                     if principals for g in principals[1]})
+
+    @staticmethod
+    def _principals(specs, groups, i):
+        """Expand group:<name>; keeps emails (lower-cased) and kubiya:<id> references."""
+        emails, kubiya_groups = set(), []
+        for spec in specs:
+            if spec.startswith('group:'):
+                if spec[6:] not in groups:
+                    raise RulesError(f"rule {i}: unknown group {spec[6:]!r}")
+                emails |= groups[spec[6:]]
+            elif spec.startswith('kubiya:'):
+                kubiya_groups.append(spec[7:])
+            else:
+                emails.add(spec.lower())
+        return frozenset(emails), tuple(kubiya_groups)
+
+    def _candidates(self, account, service, level):
+        """Rules whose (account, service, level) cover the key, in priority order."""
+        found = {}
+        for a in (account, ANY):
+            for s in (service, ANY):
+                for l in (level, ANY):
+                    for rule in self.index.get((a, s, l), ()):
+                        found[rule.index] = rule
+        return [found[i] for i in sorted(found)]
+
+    @staticmethod
+    def _member(email, principals, resolve):
+        emails, kubiya_groups = principals
+        if email in emails:
+            return True
+        return bool(resolve) and any(resolve(email, group) for group in kubiya_groups)
+
+    def match(self, account, service, level, requester, ttl_minutes, resolve=None):
+        """First rule covering this scope whose requester and TTL conditions hold, or None."""
+        for rule in self.candidates(str(account or ANY), service, level):
+            if rule.max_ttl is not None and (ttl_minutes or 0) > rule.max_ttl:
+                continue
+            if rule.requesters is not None and not self._member(requester, rule.requesters, resolve):
+                continue
+            return rule
+        return None
+
+    def evaluate(self, account, policy, ttl_minutes, requester, approver, resolve=None, decision='approve'):
+        """Decide whether `approver` may approve/deny the request.
+
+        A denial needs an approver under the same rules as an approval, but a single
+        one. Requests no rule can judge (the policy cannot be parsed, grants nothing
+        or is not covered) can still be denied by the default approvers, and
+        requesters may always withdraw their own requests.
+
+        Args:
+            account (str): AWS account of the request
+            policy (dict|str): the requested policy document
+            ttl_minutes (int): length of the grant
+            requester (str): email of the requesting user
+            approver (str): email of the deciding user
+            resolve (callable, optional): resolve(email, kubiya_group_id) -> bool
+            decision (str): 'approve' or 'deny'
+
+        Returns:
+            Verdict: (allowed, approvals required, names of the deciding rules, reason)
+        """
+        requester, approver = (requester or '').lower(), (approver or '').lower()
+        deny = decision == 'deny'
+        if deny and approver and approver == requester:
+            return Verdict(True, 1, (), "requesters may withdraw their own requests")
+        try:
+            scopes = policy_scopes(policy)
+        except (ValueError, SyntaxError, AttributeError):
+            return self._unjudged(deny, approver, resolve, "the policy cannot be parsed")
+        if not scopes:
+            return self._unjudged(deny, approver, resolve, "the policy grants nothing")
+        required, names = 1, []
+        for service, level in sorted(scopes):
+            rule = self.match(account, service, level, requester, ttl_minutes, resolve)
+            if rule is None:
+                return self._unjudged(deny, approver, resolve,
+                                      f"no approval rule covers {service}/{level} in account {account}", names)
+            if approver == requester:
+                if not rule.self_approve:
+                    return Verdict(False, 0, tuple(names + [rule.name]),
+                                   f"rule {rule.name} does not allow self-approval of {service}/{level}")
+            elif not self._member(approver, rule.approvers, resolve):
+                return Verdict(False, 0, tuple(names + [rule.name]),
+                               f"{approver} is not an approver under rule {rule.name} for {service}/{level}")
+            required = max(required, 1 if approver == requester or deny else rule.min_approvers)
+            if rule.name not in names:
+                names.append(rule.name)
+        return Verdict(True, required, tuple(names), f"allowed by {', '.join(names)}")
+
+    def _unjudged(self, deny, approver, resolve, reason, names=()):
+        """Verdict on a request no rule can judge: only the default approvers may deny it."""
+        if deny and self._member(approver, self.default_approvers, resolve):
+            return Verdict(True, 1, tuple(names), f"{reason}; denied by a default approver")
+        return Verdict(False, 0, tuple(names), reason)
+
+
+def load_config(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def get_engine(path=RULES_FILE, default_approvers=()):
+    """Compiled engine for `path`, recompiled only when the file changes.
+
+    Without a rules file every request needs one of `default_approvers`, the
+    behaviour before rules existed.
+    """
+    try:
+        version = (os.stat(path).st_mtime_ns, tuple(default_approvers))
+    except OSError:
+        path, version = None, tuple(default_approvers)
+    with _lock:
+        cached = _engines.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        if path is None:
+            config = {'rules': [{'name': 'default', 'approvers': list(default_approvers)}]}
+        else:
+            config = load_config(path)
+        engine = RulesEngine(config, default_approvers)
+        _engines[path] = (version, engine)
+        return engine
+
+
+def votes_key(request_id):
+    return f"{VOTES_PREFIX}{request_id}"
+
+
+def record_approval(rd, request_id, approver):
+    """Add one approver's vote; returns the number of distinct approvers so far."""
+    pipe = rd.pipeline()
+    pipe.sadd(votes_key(request_id), approver.lower())
+    pipe.expire(votes_key(request_id), VOTES_TTL)
+    pipe.scard(votes_key(request_id))
+    return pipe.execute()[-1]
+
+
+def cast(rd, request_id, request, approval_action, approver, resolve=None, default_approvers=(), verdict=None):
+    """Check one approver's decision on a stored request and record it if it is a vote.
+
+    Shared by the approve tool and the Jira webhook, so a decision is held to the
+    same rules whichever way it arrives. An approval needing several approvers is
+    recorded as a vote, but only while the request is pending: a vote on a decided
+    request would count towards nothing.
+
+    Args:
+        rd (redis.Redis): Redis client
+        request_id (str): the request ID
+        request (dict): the stored approval request
+        approval_action (str): 'approve'/'approved' or 'deny'/'denied'/'rejected'
+        approver (str): email of the deciding user
+        resolve (callable, optional): resolve(email, kubiya_group_id) -> bool
+        default_approvers (list): approvers when no rules file is deployed
+        verdict (Verdict, optional): replaces the rules' verdict, e.g. for a risk-scored fast lane
+
+    Returns:
+        Ballot: the decision goes ahead unless `status` is set or `votes` is short of
+            verdict.required_approvals
+
+    Raises:
+        RulesError: if the action is unknown or the approver may not make the decision
+    """
+    decision = DECISIONS.get(approval_action)
+    if decision is None:
+        raise RulesError("Invalid approval action. Use 'approve' or 'deny'.")
+    if not request:
+        raise RulesError(f"No pending approval request found for request ID {request_id}.")
+    if verdict is None:
+        verdict = get_engine(default_approvers=default_approvers).evaluate(
+            request.get('aws_account_id'), request['llm_policy'], request.get('ttl_min'), request['user_email'],
+            approver, resolve=resolve, decision=decision)
+    if not verdict.allowed:
+        raise RulesError(f"User {approver} is not authorized to {decision} this request: {verdict.reason}.")
+    if decision != 'approve' or verdict.required_approvals <= 1:
+        return Ballot(decision, verdict, None, None)
+    status = request_state.get_state(rd, request_id)['status']
+    if status != request_state.PENDING:
+        return Ballot(decision, verdict, None, status)
+    return Ballot(decision, verdict, record_approval(rd, request_id, approver), None)
@@ -1,3 +1,4 @@
+import os
 import inspect
 from .base import AWSCliTool, AWSSdkTool
 
@@ -7,7 +8,93 @@ from kubiya_sdk.tools.models import (Tool,
 from kubiya_sdk.tools.registry import tool_registry
 
 from . import (request_access,
-               approve)
+               approve,
+               approval_worker,
+               idempotency,
+               request_state,
+               audit,
+               metrics,
+               risk,
+               rules,
+               directory,
+               policy_gen,
+               policy_stream,
+               records,
+               grants,
+               reaper)
+from shared import slack_notifier, tracing, lazy, resilience
+
+# Helper modules imported by the scripts, shipped flat next to them in /tmp
+HELPER_FILES = [
+    FileSpec(
+        destination="/tmp/slack_notifier.py",
+        content=inspect.getsource(slack_notifier),
+    ),
+    FileSpec(
+        destination="/tmp/tracing.py",
+        content=inspect.getsource(tracing),
+    ),
+    FileSpec(
+        destination="/tmp/lazy.py",
+        content=inspect.getsource(lazy),
+    ),
+    FileSpec(
+        destination="/tmp/resilience.py",
+        content=inspect.getsource(resilience),
+    ),
+    FileSpec(
+        destination="/tmp/idempotency.py",
+        content=inspect.getsource(idempotency),
+    ),
+    FileSpec(
+        destination="/tmp/approval_worker.py",
+        content=inspect.getsource(approval_worker),
+    ),
+    FileSpec(
+        destination="/tmp/request_state.py",
+        content=inspect.getsource(request_state),
+    ),
+    FileSpec(
+        destination="/tmp/audit.py",
+        content=inspect.getsource(audit),
+    ),
+    FileSpec(
+        destination="/tmp/metrics.py",
+        content=inspect.getsource(metrics),
+    ),
+    FileSpec(
+        destination="/tmp/risk.py",
+        content=inspect.getsource(risk),
+    ),
+    FileSpec(
+        destination="/tmp/rules.py",
+        content=inspect.getsource(rules),
+    ),
+    FileSpec(
+        destination="/tmp/directory.py",
+        content=inspect.getsource(directory),
+    ),
+    FileSpec(
+        destination="/tmp/policy_gen.py",
+        content=inspect.getsource(policy_gen),
+    ),
+    FileSpec(
+        destination="/tmp/policy_stream.py",
+        content=inspect.getsource(policy_stream),
+    ),
+    FileSpec(
+        destination="/tmp/records.py",
+        content=inspect.getsource(records),
+    ),
+    FileSpec(
+        destination="/tmp/grants.py",
+        content=inspect.getsource(grants),
+    ),
+    FileSpec(
+        destination="/tmp/approval_rules.json",
+        content=open(os.path.join(os.path.dirname(rules.__file__), 'approval_rules.json')).read(),
+    ),
+]
 
 
 request_access_tool = Tool(
@@ -32,20 +119,40 @@ request_access_tool = Tool(
         'BACKEND_DB',
         'GPT_API_KEY',
         'GPT_ENDPOINT',
+        'OLLAMA_URL',
+        'JIT_LLM_BACKENDS',
+        'JIT_LLM_BULK_MODE',
+        'JIT_LLM_BULK_BATCH_SIZE',
+        'JIT_LLM_BULK_CONCURRENCY',
+        'JIT_LLM_STREAM',
+        'JIT_LLM_STREAM_RETRIES',
         'BACKEND_PASS',
         'KUBIYA_JIT_WEBHOOK',
         'AWS_ACCESS_KEY_ID',
         'AWS_SECRET_ACCESS_KEY',
         'APPROVAL_SLACK_CHANNEL',
-        "KUBI_UUID"
+        "KUBI_UUID",
+        'JIT_TRACE_OUTPUT',
+        'JIT_TIMEOUT_KUBIYA',
+        'JIT_TIMEOUT_IAM',
+        'JIT_TIMEOUT_REDIS',
+        'JIT_RETRY_ATTEMPTS',
+        'JIT_BREAKER_FAILURES',
+        'JIT_BREAKER_RESET',
+        'JIT_RESUME_TTL',
+        'JIT_API_KEY',
+        'JIT_AUTO_APPROVE_THRESHOLD',
+        'JIT_AUTO_APPROVE_MAX_TTL',
         
     ],
     content="""
 pip install redis > /dev/null 2>&1
 pip install boto3 > /dev/null 2>&1
+pip install pytimeparse > /dev/null 2>&1
 pip install argparse > /dev/null 2>&1
 pip install redis > /dev/null 2>&1
 pip install slack_sdk > /dev/null 2>&1
+pip install msgpack zstandard > /dev/null 2>&1
 pip install requests > /dev/null 2>&1
 pip install langchain_ollama > /dev/null 2>&1
 pip install langchain_core > /dev/null 2>&1
@@ -60,7 +167,11 @@ python /tmp/request_access.py --purpose $purpose --ttl $ttl --permission_set_nam
             destination="/tmp/request_access.py",
             content=inspect.getsource(request_access),
         ),
-    ],
+        FileSpec(
+            destination="/tmp/approve.py",  # fast-lane approvals run in the same invocation
+            content=inspect.getsource(approve),
+        ),
+    ] + HELPER_FILES,
 )
 
 approve = Tool(
@@ -70,7 +181,9 @@ approve = Tool(
     description="A tool to request access, generating an IAM policy based on a description and creating an approval request for admins to review",
     args=[
           Arg(name="request_id", description="The request id that is passed via the Kubi API to grab Redis' Json for use in the request.", required=True),
-          Arg(name="approval_action", description="the decision that the approver will make for the just in time request.", required=True),
+          Arg(name="approval_action", description="the decision that the approver will make for the just in time request: approve or deny, extend a provisioned grant, or expire it.", required=True),
+          Arg(name="ttl", description="with extend: how much longer the grant lasts. hours=h, minutes=m", required=False),
+          Arg(name="policy", description="with extend: a new policy document (JSON) replacing the granted one.", required=False),
           ],
     env=[
         "SLACK_THREAD_TS", 
@@ -83,7 +196,18 @@ approve = Tool(
         'BACKEND_DB',
         'BACKEND_PASS',
         'KUBIYA_JIT_WEBHOOK',
-        'JIT_API_KEY'
+        'JIT_API_KEY',
+        'JIT_TRACE_OUTPUT',
+        'JIT_TIMEOUT_KUBIYA',
+        'JIT_TIMEOUT_IAM',
+        'JIT_TIMEOUT_REDIS',
+        'JIT_RETRY_ATTEMPTS',
+        'JIT_BREAKER_FAILURES',
+        'JIT_BREAKER_RESET',
+        'JIT_RESUME_TTL',
+        'JIT_RULES_FILE',
+        'JIT_GROUP_REFRESH',
+        'JIT_GROUP_MAX_STALE',
     ],
     content="""
 pip install pytimeparse > /dev/null 2>&1
@@ -91,6 +215,7 @@ pip install pytimeparse > /dev/null 2>&1
 pip install boto3 > /dev/null 2>&1
 pip install redis > /dev/null 2>&1
 pip install slack_sdk > /dev/null 2>&1
+pip install msgpack zstandard > /dev/null 2>&1
 pip install requests > /dev/null 2>&1
 pip install langchain_ollama > /dev/null 2>&1
 pip install langchain_core > /dev/null 2>&1
@@ -99,14 +224,74 @@ pip install pillow==11.0.0 > /dev/null 2>&1
 pip install tempfile > /dev/null 2>&1
 pip install asyncio > /dev/null 2>&1
 
-python /tmp/approve.py --request_id $request_id --approval_action $approval_action
+python /tmp/approve.py --request_id $request_id --approval_action $approval_action ${ttl:+--ttl "$ttl"} ${policy:+--policy "$policy"}
 """,
     with_files=[
         FileSpec(
             destination="/tmp/approve.py",
             content=inspect.getsource(approve),
         ),
+    ] + HELPER_FILES,
+)
+
+jit_stats = Tool(
+    name="jit_stats",
+    type="docker",
+    image="python:3.12-slim",
+    description="Show JIT request counters and approval, provisioning and time-to-access latency percentiles",
+    args=[
+          Arg(name="format", description="Output format: 'json' (percentiles) or 'prometheus'.", required=False, default="json"),
+          ],
+    env=[
+        'BACKEND_URL',
+        'BACKEND_PORT',
+        'BACKEND_PASS',
     ],
+    content="""
+pip install redis > /dev/null 2>&1
+
+python /tmp/metrics.py --format ${format:-json}
+""",
+    with_files=[
+        FileSpec(
+            destination="/tmp/metrics.py",
+            content=inspect.getsource(metrics),
+        ),
+    ],
+)
+
+jit_reaper = Tool(
+    name="jit_reaper",
+    type="docker",
+    image="python:3.12-slim",
+    description="Delete kubiya-jit-* IAM policies left behind by failed expiries (unknown, expired or revoked requests, or grants past their expiry); dry_run=true only reports them",
+    args=[
+          Arg(name="dry_run", description="'true' to only report the orphaned policies, 'false' to delete them.", required=False, default="true"),
+          Arg(name="concurrency", description="Most deletions in flight; IAM throttling lowers it.", required=False, default="8"),
+          ],
+    env=[
+        'BACKEND_URL',
+        'BACKEND_PORT',
+        'BACKEND_PASS',
+        'AWS_ACCESS_KEY_ID',
+        'AWS_SECRET_ACCESS_KEY',
+        'JIT_REAPER_PREFIX',
+        'JIT_REAPER_GRACE_MINUTES',
+        'JIT_TRACE_OUTPUT',
+    ],
+    content="""
+pip install boto3 > /dev/null 2>&1
+pip install redis > /dev/null 2>&1
+pip install msgpack zstandard > /dev/null 2>&1
+
+python /tmp/reaper.py --concurrency ${concurrency:-8} $([ "${dry_run:-true}" = "false" ] || echo --dry_run)
+""",
+    with_files=[
+        FileSpec(
+            destination="/tmp/reaper.py",
+            content=inspect.getsource(reaper),
+        ),
+    ] + HELPER_FILES,
 )
 
 iam_list_roles = AWSCliTool(
@@ -145,3 +330,5 @@ tool_registry.register("iam_delete_policy", iam_delete_policy)
 
 tool_registry.register("approve", approve)
 tool_registry.register("request_access", request_access_tool)
+tool_registry.register("jit_stats", jit_stats)
+tool_registry.register("jit_reaper", jit_reaper)
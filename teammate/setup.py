@@ -4,6 +4,7 @@ setup(
     name="kubiya-bdr-tools",
     version="0.1.0",
     packages=find_packages(),
+    package_data={"jit_tools": ["approval_rules.json"]},
     install_requires=[
         "kubiya-sdk",
     ],
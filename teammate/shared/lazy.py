@@ -0,0 +1,49 @@
+"""Deferred imports for heavy optional-path dependencies.
+
+The tool scripts start a fresh interpreter per invocation, so every module-level
+import is paid on every call. Modules only needed on some paths (litellm for a
+cache miss, boto3 for an approval) are bound with lazy.module() and imported on
+first attribute access:
+
+    boto3 = lazy.module('boto3')
+    ...
+    boto3.client('iam')  # boto3 is imported here, once
+
+A missing module raises ImportError at that first use rather than at startup.
+"""
+import sys
+import threading
+import importlib
+
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with _lock:  # import_module is thread safe; the lock just avoids redundant lookups
+                module = self.__dict__['_module'] or importlib.import_module(self._name)
+                self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):  # allows monkeypatching e.g. boto3.client in tests
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def module(name):
+    """Return `name` if it is already imported, else a LazyModule importing it on first use."""
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,364 @@
+"""Timeouts, retries, circuit breakers and resume points for the tools' external calls.
+
+Every dependency the tools talk to has its own timeout and retry budget:
+
+    kubiya = resilience.dependency('kubiya', rd)
+    response = kubiya.request(requests, 'POST', url, json=payload)
+    iam = resilience.dependency('iam', rd)
+    iam.call(iam_client.create_policy, PolicyName=name, PolicyDocument=document)
+
+Transient failures (connection errors, timeouts, 429 and 5xx responses, AWS
+throttling and service errors) are retried with full-jitter exponential backoff,
+waiting as long as a Retry-After header asks; a dependency asking for more than
+JIT_RETRY_MAX seconds is not retried. Other errors are raised at once. A call
+that is still failing after its retries raises DependencyError and counts against
+the dependency's circuit breaker: after JIT_BREAKER_FAILURES such calls in a row
+it fails fast with CircuitOpen for JIT_BREAKER_RESET seconds. Given a Redis
+client the breaker state is kept in Redis and read before every call, so all
+processes count failures in a row together and skip a dependency any of them
+found down. Redis itself gets socket timeouts and
+redis-py's own jittered retries (redis_options()).
+
+A Checkpoint is a persistent resume point: the results of the completed stages
+of one multi-step operation, kept in Redis until it finishes, so a retry after a
+failure continues at the first stage that did not complete instead of starting
+over (and, say, generating the policy again):
+
+    checkpoint = resilience.Checkpoint(rd, f"request:{fingerprint}")
+    policy = checkpoint.run('policy', generate_policy, description)
+    checkpoint.run('notified', send_webhook, policy)
+    checkpoint.clear()
+"""
+import os
+import json
+import time
+import random
+import threading
+import email.utils
+from datetime import datetime, timezone
+
+# Constants and configuration
+TIMEOUTS = {  # seconds per attempt
+    'slack': float(os.getenv('JIT_TIMEOUT_SLACK', os.getenv('SLACK_TIMEOUT', '10'))),
+    'kubiya': float(os.getenv('JIT_TIMEOUT_KUBIYA', '10')),
+    'iam': float(os.getenv('JIT_TIMEOUT_IAM', '10')),
+    'redis': float(os.getenv('JIT_TIMEOUT_REDIS', '5')),
+}
+DEFAULT_TIMEOUT = 10.0
+RETRY_ATTEMPTS = int(os.getenv('JIT_RETRY_ATTEMPTS', '4'))  # attempts per call, the first one included
+RETRY_BASE = float(os.getenv('JIT_RETRY_BASE', '0.25'))  # seconds, doubled on every retry
+RETRY_MAX = float(os.getenv('JIT_RETRY_MAX', '20'))  # longest single wait, Retry-After included
+BREAKER_FAILURES = int(os.getenv('JIT_BREAKER_FAILURES', '3'))  # failed calls in a row that open a breaker
+BREAKER_RESET = float(os.getenv('JIT_BREAKER_RESET', '60'))  # seconds before an open breaker lets a call through
+BREAKER_PREFIX = 'jit:breaker:'
+RESUME_PREFIX = 'jit:resume:'
+RESUME_TTL = int(os.getenv('JIT_RESUME_TTL', str(24 * 60 * 60)))  # seconds an unfinished operation can be resumed
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+TRANSIENT_ERRORS = frozenset(('ConnectionError', 'Timeout', 'TimeoutError', 'ConnectTimeoutError',
+                              'ReadTimeoutError', 'EndpointConnectionError', 'ChunkedEncodingError',
+                              'BusyLoadingError'))
+AWS_TRANSIENT_CODES = frozenset(('Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                                 'TooManyRequestsException', 'ServiceUnavailable', 'InternalFailure',
+                                 'InternalError', 'ServiceFailure', 'RequestTimeout'))
+
+
+class DependencyError(Exception):
+    """Raised when a dependency is still failing after its retries."""
+
+    def __init__(self, dependency, message):
+        super().__init__(message)
+        self.dependency = dependency
+
+
+class CircuitOpen(DependencyError):
+    """Raised without calling a dependency whose breaker is open."""
+
+
+class TransientResponse(Exception):
+    """An HTTP response worth retrying (429, 5xx)."""
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} - {response.text[:200]}")
+        self.response = response
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open after `reset` seconds."""
+
+    def __init__(self, threshold=BREAKER_FAILURES, reset=BREAKER_RESET, failures=0, opened_at=0.0):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = failures
+        self.opened_at = opened_at
+
+    @property
+    def state(self):
+        if self.failures < self.threshold:
+            return 'closed'
+        return 'half_open' if time.time() - self.opened_at >= self.reset else 'open'
+
+    def allow(self):
+        return self.state != 'open'
+
+    def success(self):
+        self.failures, self.opened_at = 0, 0.0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.time()  # a failed half-open trial re-opens for another period
+
+    def restore(self, fields):
+        """Take the state stored in Redis, a hash as returned by hgetall; no hash is a closed breaker."""
+        fields = {k.decode() if isinstance(k, bytes) else k: float(v) for k, v in fields.items()}
+        self.failures = int(fields.get('failures', 0))
+        self.opened_at = fields.get('opened_at', 0.0)
+
+    def store(self, pipe, key, ok):
+        """Queue on `pipe` the update of the state stored under `key` for one outcome.
+
+        Processes sharing the hash never write back their own count: a failure is
+        added with HINCRBY, whose result (the first one queued here) is the count
+        all of them have seen, and a success resets it. opened_at only matters once
+        the count reaches the threshold, so every failure stamps it.
+        """
+        if ok:
+            pipe.hset(key, mapping={'failures': 0, 'opened_at': 0.0})
+        else:
+            pipe.hincrby(key, 'failures', 1)
+            pipe.hset(key, 'opened_at', time.time())
+
+    def adopt(self, failures):
+        """Take the stored failure count after this process's outcome, opening if it reaches the threshold."""
+        if failures > self.failures:
+            self.failures = failures
+            if failures >= self.threshold and not self.opened_at:
+                self.opened_at = time.time()
+
+
+def retry_after(value):
+    """Seconds asked for by a Retry-After header (delta-seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (email.utils.parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, wait=None, base=RETRY_BASE, cap=RETRY_MAX):
+    """Seconds to sleep before retry number `attempt` (0 for the first): full jitter, at least `wait`."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if wait is not None:
+        # what the dependency asked for, spread a little so waiting clients don't return in lockstep
+        delay = min(cap, wait) + delay / 4
+    return delay
+
+
+def transient(error):
+    """(whether `error` is worth retrying, seconds the dependency asked to wait or None)."""
+    if isinstance(error, TransientResponse):
+        return True, retry_after(error.response.headers.get('Retry-After'))
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:  # botocore ClientError
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return response['Error'].get('Code') in AWS_TRANSIENT_CODES or status >= 500, None
+    return bool({cls.__name__ for cls in type(error).__mro__} & TRANSIENT_ERRORS), None
+
+
+class Dependency:
+    """Timeout, retry budget and circuit breaker of one external dependency."""
+
+    def __init__(self, name, timeout=None, attempts=RETRY_ATTEMPTS, breaker=None, rd=None):
+        self.name = name
+        self.timeout = timeout or TIMEOUTS.get(name, DEFAULT_TIMEOUT)
+        self.attempts = attempts
+        self.breaker = breaker or CircuitBreaker()
+        self.rd = None
+        self.lock = threading.Lock()
+        if rd is not None:
+            self.share(rd)
+
+    def share(self, rd):
+        """Keep the breaker state in Redis from now on, starting from what is stored there."""
+        if self.rd is not None or self.name == 'redis':
+            return
+        self.rd = rd
+        self._refresh()
+
+    def _refresh(self):
+        # every call starts from the stored state, so failures and successes of other
+        # processes count: a success anywhere ends a run of failures
+        if self.rd is None:
+            return
+        try:
+            fields = self.rd.hgetall(BREAKER_PREFIX + self.name)
+        except Exception:
+            return  # breaker state is best effort
+        with self.lock:
+            self.breaker.restore(fields)
+
+    def _save(self, ok):
+        if self.rd is None:
+            return
+        try:
+            pipe = self.rd.pipeline()
+            self.breaker.store(pipe, BREAKER_PREFIX + self.name, ok)
+            results = pipe.execute()
+        except Exception:
+            return  # breaker state is best effort
+        if not ok:
+            with self.lock:
+                self.breaker.adopt(int(results[0]))
+
+    def _outcome(self, ok):
+        with self.lock:
+            if ok:
+                if not self.breaker.failures:
+                    return  # nothing stored to reset as of this call's refresh
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+        self._save(ok)
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs), retrying transient failures.
+
+        Raises:
+            CircuitOpen: without calling fn while the breaker is open
+            DependencyError: if fn is still failing transiently after the retries
+            Exception: whatever fn raises that is not transient, at once
+        """
+        self._refresh()
+        if not self.breaker.allow():
+            wait = self.breaker.reset - (time.time() - self.breaker.opened_at)
+            raise CircuitOpen(self.name, f"{self.name} is failing; calls are skipped for another {wait:.0f}s")
+        for attempt in range(self.attempts):
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retry, wait = transient(e)
+                if not retry:
+                    raise
+                if attempt + 1 == self.attempts or (wait is not None and wait > RETRY_MAX):
+                    self._outcome(False)
+                    raise DependencyError(self.name, f"{self.name} failed after {attempt + 1} attempts: "
+                                                     f"{type(e).__name__}: {e}") from e
+                time.sleep(backoff(attempt, wait))
+            else:
+                self._outcome(True)
+                return result
+
+    def request(self, http, method, url, **kwargs):
+        """HTTP request through `http` (requests or a Session) with this dependency's timeout.
+
+        429 and 5xx responses are retried like connection errors; any other response
+        is returned for the caller to judge.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        def attempt():
+            response = http.request(method, url, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                raise TransientResponse(response)
+            return response
+        return self.call(attempt)
+
+
+_dependencies = {}
+_lock = threading.Lock()
+
+
+def dependency(name, rd=None):
+    """The process-wide Dependency called `name`; with `rd` its breaker state is shared through Redis."""
+    with _lock:
+        found = _dependencies.get(name)
+        if found is None:
+            found = _dependencies[name] = Dependency(name)
+    if rd is not None:
+        found.share(rd)
+    return found
+
+
+def redis_options(timeout=None, attempts=RETRY_ATTEMPTS):
+    """Keyword arguments for redis.Redis: socket timeouts and jittered retries of connection errors."""
+    from redis.backoff import FullJitterBackoff
+    from redis.retry import Retry
+    from redis.exceptions import BusyLoadingError, ConnectionError, TimeoutError
+    timeout = timeout or TIMEOUTS['redis']
+    return {'socket_timeout': timeout, 'socket_connect_timeout': timeout,
+            'retry': Retry(FullJitterBackoff(cap=RETRY_MAX, base=RETRY_BASE), attempts - 1),
+            'retry_on_error': [BusyLoadingError, ConnectionError, TimeoutError]}
+
+
+def boto_config(name='iam', **kwargs):
+    """botocore Config with the dependency's timeouts and no retries of its own (Dependency.call retries)."""
+    from botocore.config import Config
+    timeout = TIMEOUTS.get(name, DEFAULT_TIMEOUT)
+    return Config(connect_timeout=timeout, read_timeout=timeout, retries={'mode': 'standard', 'max_attempts': 1},
+                  **kwargs)
+
+
+class Checkpoint:
+    """Persistent resume point: the JSON results of the completed stages of one operation.
+
+    Stored as a Redis hash (stage -> result) that expires after RESUME_TTL seconds.
+    Results are read once, on the first get()/run(); mark() writes through.
+    """
+
+    def __init__(self, rd, key, ttl=RESUME_TTL):
+        self.rd = rd
+        self.key = RESUME_PREFIX + key
+        self.ttl = ttl
+        self._stages = None
+
+    def _load(self):
+        if self._stages is None:
+            raw = self.rd.hgetall(self.key)
+            self._stages = {(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in raw.items()}
+        return self._stages
+
+    @property
+    def stages(self):
+        """Completed stages and their results."""
+        return dict(self._load())
+
+    def done(self, stage):
+        return stage in self._load()
+
+    def get(self, stage, default=None):
+        return self._load().get(stage, default)
+
+    def mark(self, stage, result=True, pipe=None):
+        """Record `stage` as completed; `pipe` makes it part of the caller's transaction."""
+        target = pipe if pipe is not None else self.rd.pipeline()
+        target.hset(self.key, stage, json.dumps(result, separators=(',', ':')))
+        target.expire(self.key, self.ttl)
+        if pipe is None:
+            target.execute()
+        if self._stages is not None:
+            self._stages[stage] = result
+        return result
+
+    def run(self, stage, fn, *args, **kwargs):
+        """The stored result of `stage`, or fn(*args, **kwargs) recorded as its result."""
+        stages = self._load()
+        if stage in stages:
+            return stages[stage]
+        return self.mark(stage, fn(*args, **kwargs))
+
+    def forget(self, *stages, pipe=None):
+        """Mark stages as not completed again, e.g. after undoing them."""
+        (pipe if pipe is not None else self.rd).hdel(self.key, *stages)
+        if self._stages is not None:
+            for stage in stages:
+                self._stages.pop(stage, None)
+
+    def clear(self, pipe=None):
+        """The operation finished: nothing left to resume."""
+        (pipe if pipe is not None else self.rd).delete(self.key)
+        self._stages = {}
@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+import requests
+
+try:
+    from shared import tracing, resilience
+except ImportError:  # shipped flat next to this script
+    import tracing
+    import resilience
+
+# Constants and configuration
+SLACK_API_URL = os.getenv('SLACK_API_URL', 'https://slack.com/api/')
+SLACK_RATE_PER_SEC = float(os.getenv('SLACK_RATE_PER_SEC', '1'))  # Slack allows ~1 message/s per channel
+SLACK_BURST = int(os.getenv('SLACK_BURST', '3'))
+SLACK_MAX_RETRIES = int(os.getenv('SLACK_MAX_RETRIES', '5'))
+SLACK_TIMEOUT = resilience.TIMEOUTS['slack']
+SLACK_COALESCE_WINDOW = float(os.getenv('SLACK_COALESCE_WINDOW', '0.25'))
+SLACK_FLUSH_TIMEOUT = float(os.getenv('SLACK_FLUSH_TIMEOUT', '30'))
+SLACK_MESSAGE_LIMIT = 39000  # chat.postMessage truncates text after 40k characters
+
+
+class SlackError(Exception):
+    """Raised when a Slack call still fails after all retries."""
+
+
+class TokenBucket:
+    """Thread safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, used when Slack answers 429 despite the local limit."""
+        with self.lock:
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+
+class SlackNotifier:
+    """Single entry point for every Slack call made by the tools.
+
+    - a token bucket per channel keeps us under Slack's per channel rate limit
+    - 429s are retried after Retry-After, 5xx and connection errors with jittered backoff
+    - a circuit breaker fails calls fast while Slack keeps failing
+    - notify() enqueues and returns immediately; a background thread sends the queue,
+      coalescing messages bound for the same channel/thread into one post
+    - queued messages are flushed at interpreter exit, so short lived scripts don't lose them
+
+    Example:
+        >>> notifier = get_notifier(SLACK_API_TOKEN)
+        >>> notifier.notify(channel_id, "✅ Policy created")       # non blocking
+        >>> notifier.post_message(channel_id, "sync message")     # blocking, returns the response
+    """
+
+    def __init__(self, token, rate=SLACK_RATE_PER_SEC, burst=SLACK_BURST,
+                 max_retries=SLACK_MAX_RETRIES, coalesce_window=SLACK_COALESCE_WINDOW):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.coalesce_window = coalesce_window
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {token}"
+        self.breaker = resilience.CircuitBreaker()
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        atexit.register(self.flush, SLACK_FLUSH_TIMEOUT)
+
+    def _bucket(self, channel):
+        with self._buckets_lock:
+            bucket = self._buckets.get(channel)
+            if bucket is None:
+                bucket = self._buckets[channel] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def call(self, method, channel=None, json_body=None, data=None):
+        """Call a Slack Web API method with rate limiting and retries.
+
+        Args:
+            method (str): Web API method, e.g. 'chat.postMessage'
+            channel (str, optional): channel the call is rate limited against
+            json_body (dict, optional): JSON payload
+            data (dict, optional): form payload, for methods that don't accept JSON
+
+        Returns:
+            dict: the Slack response body (ok is True)
+
+        Raises:
+            SlackError: if the call still fails after max_retries attempts, or at once
+                while the circuit breaker is open
+        """
+        with tracing.span(f"slack.{method}", channel=channel) as span:
+            return self._call(method, channel, json_body, data, span)
+
+    def _call(self, method, channel, json_body, data, span):
+        if not self.breaker.allow():
+            raise SlackError(f"{method} skipped: Slack failed {self.breaker.failures} calls in a row")
+        bucket = self._bucket(channel) if channel else None
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            span.set_attribute('attempts', attempt + 1)
+            if bucket:
+                bucket.acquire()
+            try:
+                response = self.session.post(SLACK_API_URL.rstrip('/') + '/' + method,
+                                             json=json_body, data=data, timeout=SLACK_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = f"{type(e).__name__}: {e}"
+                time.sleep(resilience.backoff(attempt))
+                continue
+            if response.status_code == 429:
+                last_error = "429 rate limited"
+                if bucket:
+                    bucket.drain()
+                time.sleep(_retry_delay(attempt, response))
+                continue
+            if response.status_code >= 500:
+                last_error = f"{response.status_code} - {response.text}"
+                time.sleep(resilience.backoff(attempt))
+                continue
+            self.breaker.success()
+            body = response.json() if response.content else {}
+            if body.get('ok'):
+                return body
+            if body.get('error') == 'ratelimited':
+                last_error = "ratelimited"
+                time.sleep(_retry_delay(attempt, response))
+                continue
+            raise SlackError(f"{method} failed: {response.status_code} - {body.get('error') or response.text}")
+        if last_error and 'rate' not in last_error:
+            self.breaker.failure()  # rate limits mean Slack is up
+        raise SlackError(f"{method} failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def post_message(self, channel, text, thread_ts=None):
+        """Post a message synchronously and return the Slack response."""
+        payload = {'channel': channel, 'text': text}
+        if thread_ts:
+            payload['thread_ts'] = thread_ts
+        return self.call('chat.postMessage', channel=channel, json_body=payload)
+
+    def upload_file(self, channel, file_path, initial_comment=None, thread_ts=None, title=None):
+        """Upload a file to a channel/thread synchronously (the files_upload_v2 flow).
+
+        Returns:
+            dict: files.completeUploadExternal response, with 'file' set to the uploaded file
+        """
+        filename = os.path.basename(file_path)
+        ticket = self.call('files.getUploadURLExternal', channel=channel,
+                           data={'filename': filename, 'length': os.path.getsize(file_path)})
+        with open(file_path, 'rb') as file:
+            response = self.session.post(ticket['upload_url'], files={'file': (filename, file)},
+                                         timeout=SLACK_TIMEOUT)
+        if response.status_code != 200:
+            raise SlackError(f"Upload of {filename} failed: {response.status_code} - {response.text}")
+        data = {'files': json.dumps([{'id': ticket['file_id'], 'title': title or filename}]),
+                'channel_id': channel}
+        if initial_comment:
+            data['initial_comment'] = initial_comment
+        if thread_ts:
+            data['thread_ts'] = thread_ts
+        body = self.call('files.completeUploadExternal', channel=channel, data=data)
+        if len(body.get('files') or []) == 1:
+            body['file'] = body['files'][0]
+        return body
+
+    def notify(self, channel, text, thread_ts=None):
+        """Queue a message for the background sender and return immediately."""
+        self._ensure_worker()
+        self._queue.put((channel, thread_ts, text, tracing.current_context()))
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been sent (or given up on).
+
+        Returns:
+            bool: True if the queue drained within `timeout`
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"❌ {self._queue.unfinished_tasks} Slack notifications not sent before timeout")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='slack-notifier', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Pick up everything that arrives within the window so bursts become one post
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_batch(self, batch):
+        grouped, contexts = {}, {}
+        for channel, thread_ts, text, context in batch:
+            grouped.setdefault((channel, thread_ts), []).append(text)
+            contexts.setdefault((channel, thread_ts), context)
+        for (channel, thread_ts), texts in grouped.items():
+            for text in _join_messages(texts):
+                try:
+                    # attribute the post to the trace of the first message in it
+                    with tracing.use_context(contexts[(channel, thread_ts)]):
+                        self.post_message(channel, text, thread_ts)
+                    print("✅ Slack notification sent successfully")
+                except SlackError as e:
+                    print(f"❌ Error sending Slack notification: {e}")
+
+
+def _retry_delay(attempt, response):
+    """Backoff after a rate limited response: what Retry-After asks for, 1s if it is missing."""
+    return resilience.backoff(attempt, resilience.retry_after(response.headers.get('Retry-After')) or 1)
+
+
+def _join_messages(texts):
+    """Join queued texts into as few posts as fit the Slack message limit."""
+    chunk = ''
+    for text in texts:
+        if chunk and len(chunk) + len(text) + 1 > SLACK_MESSAGE_LIMIT:
+            yield chunk
+            chunk = ''
+        chunk = f"{chunk}\n{text}" if chunk else text
+    if chunk:
+        yield chunk
+
+
+_notifiers = {}
+
+
+def get_notifier(token):
+    """Return the process wide notifier for `token`, so buckets and the queue are shared."""
+    notifier = _notifiers.get(token)
+    if notifier is None:
+        notifier = _notifiers[token] = SlackNotifier(token)
+    return notifier
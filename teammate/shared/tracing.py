@@ -0,0 +1,186 @@
+"""Lightweight per-stage tracing with OpenTelemetry-compatible span output.
+
+Spans are written as one JSON object per line, shaped like OTLP/JSON spans
+(traceId, spanId, parentSpanId, startTimeUnixNano, endTimeUnixNano, attributes,
+status), so they can be loaded into any OTel tooling. Output goes to
+JIT_TRACE_OUTPUT: 'stdout', 'stderr' or a file path; tracing is a no-op when unset.
+
+A trace crosses process boundaries as a W3C `traceparent` string:
+
+    with tracing.span('request_access') as root:
+        payload['traceparent'] = tracing.traceparent()
+
+    # in the next process
+    tracing.start_trace(traceparent)
+    with tracing.span('approve'):
+        ...
+"""
+import os
+import sys
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Constants and configuration
+TRACE_OUTPUT = os.getenv('JIT_TRACE_OUTPUT', '')
+SERVICE_NAME = os.getenv('JIT_SERVICE_NAME') or os.path.splitext(os.path.basename(sys.argv[0] or 'jit'))[0]
+
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current = contextvars.ContextVar('jit_trace_context', default=(None, None))  # (trace_id, span_id)
+_lock = threading.Lock()
+_file = None
+
+
+def new_trace_id():
+    return secrets.token_hex(16)
+
+
+def new_span_id():
+    return secrets.token_hex(8)
+
+
+def parse_traceparent(value):
+    """Return (trace_id, parent_span_id) from a W3C traceparent, or (None, None) if invalid."""
+    parts = (value or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def start_trace(traceparent=None):
+    """Continue the trace from `traceparent`, or start a new one. Returns the trace ID."""
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if trace_id is None:
+        trace_id, parent_id = new_trace_id(), None
+    _current.set((trace_id, parent_id))
+    return trace_id
+
+
+def current_context():
+    """(trace_id, span_id) of the active span, for handing to another thread."""
+    return _current.get()
+
+
+@contextmanager
+def use_context(context):
+    """Run a block under a context captured with current_context() in another thread."""
+    token = _current.set(context or (None, None))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def trace_id():
+    return _current.get()[0]
+
+
+def traceparent():
+    """W3C traceparent of the active span, for propagating the trace to another process.
+
+    Returns None outside a span: a made-up parent id would point at a span that is never exported.
+    """
+    trace, span_id = _current.get()
+    if trace is None or span_id is None:
+        return None
+    return f"00-{trace}-{span_id}-01"
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _output():
+    global _file
+    if TRACE_OUTPUT == 'stdout':
+        return sys.stdout
+    if TRACE_OUTPUT == 'stderr':
+        return sys.stderr
+    if _file is None:
+        # left open for the life of the process: atexit Slack flushes still emit spans
+        _file = open(TRACE_OUTPUT, 'a', encoding='utf-8')
+    return _file
+
+
+def export(record):
+    if not TRACE_OUTPUT:
+        return
+    line = json.dumps(record, separators=(',', ':'))
+    with _lock:
+        out = _output()
+        out.write(line + '\n')
+        out.flush()
+
+
+class Span:
+    """One timed operation; use through span()."""
+
+    def __init__(self, name, trace, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.status = (STATUS_UNSET, None)
+        self.start_ns = time.time_ns()
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = (STATUS_ERROR, message)
+
+    def end(self):
+        code, message = self.status
+        record = {
+            'resource': {'service.name': SERVICE_NAME},
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(time.time_ns()),
+            'attributes': [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            'status': {'code': code, **({'message': message} if message else {})},
+        }
+        export(record)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the active span; starts a trace if there is none.
+
+    Exceptions mark the span as an error and are re-raised.
+
+    Example:
+        >>> with tracing.span('iam.create_policy', policy_name=name) as s:
+        ...     response = iam_client.create_policy(...)
+        ...     s.set_attribute('policy_arn', response['Policy']['Arn'])
+    """
+    trace, parent_id = _current.get()
+    if trace is None:
+        trace = new_trace_id()
+    current = Span(name, trace, parent_id, attributes)
+    token = _current.set((trace, current.span_id))
+    try:
+        yield current
+        if current.status[0] == STATUS_UNSET:
+            current.status = (STATUS_OK, None)
+    except BaseException as e:
+        current.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
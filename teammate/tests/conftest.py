@@ -0,0 +1,44 @@
+"""Fixtures shared by the tests: fakeredis, the local fake upstreams and fresh dependency state.
+
+The tools read their endpoints from the environment when they are imported, so
+tests that talk to the fakes import the tools inside the test, after the `fakes`
+fixture has pointed the environment at them.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeServices  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def fakes():
+    services = FakeServices().start()
+    os.environ.update(services.environ())
+    yield services
+    # Slack notifications are sent in the background; send them before the fakes go
+    from shared import slack_notifier
+    for notifier in slack_notifier._notifiers.values():
+        notifier.flush(60)
+    services.stop()
+
+
+@pytest.fixture
+def rd():
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(autouse=True)
+def fresh_dependencies():
+    """Every test starts with closed breakers that are not bound to another test's Redis."""
+    from shared import resilience
+    resilience._dependencies.clear()
+    yield
+    resilience._dependencies.clear()
@@ -0,0 +1,83 @@
+"""Approver group lookups through the Kubiya dependency and the Redis cache."""
+import time
+
+import pytest
+
+from jit_tools import directory
+from shared import resilience
+
+MEMBERS = {'members': [{'email': 'Approver@Example.com'}, {'name': 'no email'}]}
+
+
+class Response:
+    def __init__(self, status_code, document=None):
+        self.status_code, self.document, self.text, self.headers = status_code, document, '', {}
+
+    def json(self):
+        return self.document
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise directory.requests.HTTPError(f"{self.status_code} error")
+
+
+class GroupsApi:
+    """Answers with the queued statuses, then 200 with MEMBERS."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        status = self.statuses.pop(0) if self.statuses else 200
+        return Response(status, MEMBERS if status == 200 else None)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, 'backoff', lambda attempt, wait=None: 0)
+
+
+def test_fetch_group_retries_unavailable_api():
+    api = GroupsApi(503)
+
+    assert directory.fetch_group('approvers', api) == {'approver@example.com'}
+    assert len(api.calls) == 2
+    method, url, kwargs = api.calls[0]
+    assert (method, url.rsplit('/', 1)[-1]) == ('GET', 'approvers')
+    assert kwargs['timeout'] == resilience.TIMEOUTS['kubiya']
+
+
+def test_fetch_group_raises_other_error_responses_at_once():
+    api = GroupsApi(404)
+
+    with pytest.raises(directory.requests.HTTPError):
+        directory.fetch_group('approvers', api)
+    assert len(api.calls) == 1
+
+
+def test_fetch_group_is_skipped_while_the_kubiya_breaker_is_open(rd):
+    rd.hset(resilience.BREAKER_PREFIX + 'kubiya',
+            mapping={'failures': resilience.BREAKER_FAILURES, 'opened_at': time.time()})  # opened by another process
+    api = GroupsApi()
+
+    with pytest.raises(resilience.CircuitOpen):
+        directory.refresh(rd, 'approvers', api)
+    assert api.calls == []
+
+
+def test_stale_group_is_served_while_the_api_is_down(rd):
+    directory.store_group(rd, 'approvers', {'approver@example.com'},
+                          fetched_at=time.time() - directory.GROUP_REFRESH - 1)
+    api = GroupsApi(*[503] * resilience.RETRY_ATTEMPTS)
+
+    assert directory.is_member(rd, 'approvers', 'approver@example.com', api, background=False)
+    assert len(api.calls) == resilience.RETRY_ATTEMPTS
+
+
+def test_uncached_group_and_api_down_raises(rd):
+    api = GroupsApi(*[503] * resilience.RETRY_ATTEMPTS)
+
+    with pytest.raises(directory.DirectoryError, match='approvers'):
+        directory.is_member(rd, 'approvers', 'approver@example.com', api)
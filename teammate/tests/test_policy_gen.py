@@ -0,0 +1,161 @@
+"""Router ranking, hedging, circuit breakers and shared health, against stub backends."""
+import time
+import threading
+
+import pytest
+
+from jit_tools import policy_gen
+
+POLICY = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': ['s3:GetObject'], 'Resource': '*'}]}
+
+
+class StubBackend(policy_gen.Backend):
+    """Answers after `delay` seconds, or raises `error`."""
+
+    def __init__(self, name, delay=0.0, error=None):
+        super().__init__(name)
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.called = threading.Event()
+
+    def generate(self, description, timeout):
+        with self.lock:
+            self.calls += 1
+        self.called.set()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return dict(POLICY, Id=self.name)
+
+
+def test_fastest_healthy_backend_is_called_first():
+    slow, fast = StubBackend('slow'), StubBackend('fast')
+    router = policy_gen.Router([slow, fast], hedge=False)
+    router.health['slow'] = policy_gen.Health([2.0] * 10)
+    router.health['fast'] = policy_gen.Health([0.1] * 10)
+
+    policy, name = router.generate('read s3')
+
+    assert name == 'fast' and policy['Id'] == 'fast'
+    assert slow.calls == 0
+
+
+def test_error_rate_lowers_the_rank():
+    flaky, steady = StubBackend('flaky'), StubBackend('steady')
+    router = policy_gen.Router([flaky, steady], hedge=False)
+    router.health['flaky'] = policy_gen.Health([0.1] * 10, error_rate=1.0)
+    router.health['steady'] = policy_gen.Health([0.3] * 10)
+
+    assert [b.name for b in router.ranked()] == ['steady', 'flaky']
+
+
+def test_slow_backend_is_hedged_after_its_p90():
+    primary, backup = StubBackend('primary', delay=3.0), StubBackend('backup')
+    router = policy_gen.Router([primary, backup])
+    router.health['primary'] = policy_gen.Health([0.01] * 10)  # hedges after HEDGE_MIN
+    router.health['backup'] = policy_gen.Health([0.5] * 10)
+
+    began = time.monotonic()
+    _, name = router.generate('read s3')
+
+    assert name == 'backup'
+    assert time.monotonic() - began < 2.0
+    assert primary.calls == 1 and backup.calls == 1
+
+
+def test_no_hedge_when_disabled():
+    primary, backup = StubBackend('primary', delay=0.5), StubBackend('backup')
+    router = policy_gen.Router([primary, backup], hedge=False)
+    router.health['primary'] = policy_gen.Health([0.01] * 10)
+    router.health['backup'] = policy_gen.Health([0.5] * 10)
+
+    _, name = router.generate('read s3')
+
+    assert name == 'primary'
+    assert backup.calls == 0
+
+
+def test_failed_backend_falls_through_to_the_next():
+    broken, working = StubBackend('broken', error=ConnectionError('refused')), StubBackend('working')
+    router = policy_gen.Router([broken, working], hedge=False)
+    router.health['working'] = policy_gen.Health([0.5] * 10)
+
+    _, name = router.generate('read s3')
+
+    assert name == 'working'
+    assert broken.calls == 1
+
+
+def test_consecutive_failures_open_the_breaker(rd):
+    broken, working = StubBackend('broken', error=ConnectionError('refused')), StubBackend('working')
+    router = policy_gen.Router([broken, working], rd=rd, hedge=False)
+
+    for _ in range(policy_gen.BREAKER_FAILURES):
+        assert router.generate('read s3')[1] == 'working'
+    assert router.health['broken'].breaker.state == 'open'
+
+    router.generate('read s3')
+    assert broken.calls == policy_gen.BREAKER_FAILURES  # skipped while open
+
+    # a later invocation sharing the Redis skips it too
+    later = policy_gen.Router([StubBackend('broken'), StubBackend('working')], rd=rd, hedge=False)
+    assert [b.name for b in later.ranked()] == ['working']
+
+
+def test_half_open_trial_closes_the_breaker_on_success(rd):
+    backend = StubBackend('recovering')
+    router = policy_gen.Router([backend], rd=rd, hedge=False)
+    breaker = router.health['recovering'].breaker
+    breaker.failures, breaker.opened_at = policy_gen.BREAKER_FAILURES, time.time() - policy_gen.BREAKER_RESET - 1
+    assert breaker.state == 'half_open'
+
+    router.generate('read s3')
+
+    assert breaker.state == 'closed'
+    assert int(rd.hget(policy_gen._health_key('recovering'), 'failures')) == 0
+
+
+def test_unusable_output_does_not_open_the_breaker(rd):
+    rambling = StubBackend('rambling', error=ValueError('no JSON object in the completion'))
+    router = policy_gen.Router([rambling, policy_gen.RuleBasedBackend('rules')], rd=rd, hedge=False)
+
+    for _ in range(policy_gen.BREAKER_FAILURES + 1):
+        assert router.generate('read from the s3 bucket')[1] == 'rules'
+
+    health = router.health['rambling']
+    assert health.breaker.state == 'closed'
+    assert health.error_rate > 0.5
+
+
+def test_failures_from_concurrent_invocations_all_count(rd):
+    routers = [policy_gen.Router([StubBackend('broken', error=ConnectionError('refused'))], rd=rd, hedge=False)
+               for _ in range(policy_gen.BREAKER_FAILURES)]
+
+    for router in routers:  # each saw no failures when it loaded the shared health
+        with pytest.raises(policy_gen.PolicyGenerationError):
+            router.generate('read s3')
+
+    assert int(rd.hget(policy_gen._health_key('broken'), 'failures')) == policy_gen.BREAKER_FAILURES
+    assert policy_gen.load_health(rd, ['broken'])['broken'].breaker.state == 'open'
+    assert routers[-1].health['broken'].breaker.state == 'open'
+
+
+def test_rule_based_fallback_answers_when_every_model_backend_is_open():
+    broken = StubBackend('broken')
+    router = policy_gen.Router([broken, policy_gen.RuleBasedBackend('rules')], hedge=False)
+    router.health['broken'].breaker.failures = policy_gen.BREAKER_FAILURES
+    router.health['broken'].breaker.opened_at = time.time()
+
+    policy, name = router.generate('read objects from the s3 bucket')
+
+    assert name == 'rules' and broken.calls == 0
+    assert policy['Statement'][0]['Action'] == ['s3:GetObject', 's3:ListBucket']
+
+
+def test_every_backend_failing_raises():
+    router = policy_gen.Router([StubBackend('a', error=ConnectionError('a down')),
+                                StubBackend('b', error=ConnectionError('b down'))], hedge=False)
+
+    with pytest.raises(policy_gen.PolicyGenerationError, match='a down'):
+        router.generate('read s3')
@@ -0,0 +1,153 @@
+"""The reaper's verdict for every request state, against the IAM fake, and closing out what it reaps."""
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from jit_tools import records, request_state, idempotency
+from shared import resilience
+
+APPROVER = 'adsaunde1@gmail.com'
+REQUESTER = 'engineer@example.com'
+POLICY = json.dumps({'Version': '2012-10-17',
+                     'Statement': [{'Effect': 'Allow', 'Action': ['s3:GetObject'], 'Resource': '*'}]})
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+NOW = datetime.now(timezone.utc)
+NO_RECORD = object()
+
+
+@pytest.fixture
+def reaper(fakes):
+    from jit_tools import reaper
+    return reaper
+
+
+@pytest.fixture
+def prefix():
+    """A policy name prefix of this test's own, so policies other tests left in the fake are not swept."""
+    return f"kubiya-jit-{uuid.uuid4().hex[:8]}-"
+
+
+def store(rd, request_id, ttl_min=60):
+    record = {'policy_name': request_id, 'permission_set_name': 'test', 'llm_policy': POLICY,
+              'requested_at': NOW.isoformat(), 'user_email': REQUESTER, 'slack_channel_id': 'CTEST',
+              'slack_thread_ts': None, 'purpose': 'test'}
+    if ttl_min is not None:
+        record['ttl_min'] = ttl_min
+    records.store_request(rd, request_id, record)
+
+
+def set_state(rd, request_id, status, **fields):
+    rd.hset(request_state.state_key(request_id), mapping=dict(status=status, version=1, **fields))
+
+
+def add_policy(fakes, name, age):
+    return fakes.add_policy(name, POLICY, (NOW - age).strftime(TIME_FORMAT))['arn']
+
+
+def minutes(n):
+    return timedelta(minutes=n)
+
+
+def iso(delta):
+    return (NOW + delta).isoformat()
+
+
+# case: (stored record's ttl_min or NO_RECORD, request state or None, policy age, action, kind)
+CASES = {
+    'unknown': (NO_RECORD, None, minutes(180), 'deleted', 'unknown'),
+    'unknown-but-new': (NO_RECORD, None, minutes(5), 'kept', 'new'),
+    'stateless-within-ttl': (60, None, minutes(30), 'kept', 'active'),
+    'stateless-in-grace': (60, None, minutes(70), 'kept', 'active'),
+    'stateless-past-ttl': (60, None, minutes(180), 'deleted', 'grant expired'),
+    'stateless-without-ttl': (None, None, minutes(180), 'kept', 'no expiry'),
+    'pending': (60, {'status': request_state.PENDING}, minutes(180), 'deleted', 'never provisioned'),
+    'denied': (60, {'status': request_state.DENIED}, minutes(180), 'deleted', 'never provisioned'),
+    'expired': (60, {'status': request_state.EXPIRED}, minutes(180), 'deleted', 'expired'),
+    'revoked': (60, {'status': request_state.REVOKED}, minutes(180), 'deleted', 'revoked'),
+    'approved': (60, {'status': request_state.APPROVED}, minutes(60), 'deleted', 'provisioning died'),
+    'approved-but-new': (60, {'status': request_state.APPROVED}, minutes(5), 'kept', 'new'),
+    'provisioned-active': (60, {'status': request_state.PROVISIONED, 'expires_at': iso(minutes(60))},
+                           minutes(30), 'kept', 'active'),
+    'provisioned-in-grace': (60, {'status': request_state.PROVISIONED, 'expires_at': iso(minutes(-5))},
+                             minutes(65), 'kept', 'active'),
+    'provisioned-expired': (60, {'status': request_state.PROVISIONED, 'expires_at': iso(minutes(-60))},
+                            minutes(120), 'deleted', 'grant expired'),
+    'provisioned-extended': (60, {'status': request_state.PROVISIONED, 'expires_at': iso(minutes(120))},
+                             minutes(240), 'kept', 'active'),
+    'provisioned-by-ttl': (60, {'status': request_state.PROVISIONED, 'provisioned_at': iso(minutes(-120))},
+                           minutes(120), 'deleted', 'grant expired'),
+    'provisioned-without-expiry': (None, {'status': request_state.PROVISIONED, 'provisioned_at': iso(minutes(-120))},
+                                   minutes(120), 'kept', 'no expiry'),
+}
+NEXT_STATUS = {request_state.PROVISIONED: request_state.EXPIRED, request_state.APPROVED: request_state.PENDING}
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_verdict_by_request_state(reaper, fakes, rd, prefix, case):
+    ttl_min, state, age, action, kind = CASES[case]
+    request_id = prefix + case
+    if ttl_min is not NO_RECORD:
+        store(rd, request_id, ttl_min)
+    if state is not None:
+        set_state(rd, request_id, **state)
+    add_policy(fakes, request_id, age)
+
+    report = reaper.sweep(rd, reaper.create_iam_client(), prefix=prefix, dry_run=False, now=NOW)
+
+    entry, = report['policies']
+    assert (entry['action'], entry['kind']) == (action, kind), entry['reason']
+    assert (request_id in fakes.policies) == (action == 'kept')
+    if state is not None:
+        status = state['status']
+        expected = NEXT_STATUS.get(status, status) if action == 'deleted' else status
+        assert request_state.get_state(rd, request_id)['status'] == expected
+
+
+def test_dry_run_deletes_nothing(reaper, fakes, rd, prefix):
+    add_policy(fakes, prefix + 'orphan', minutes(180))
+    add_policy(fakes, 'kubiya-jit-elsewhere-' + prefix, minutes(180))
+
+    report = reaper.sweep(rd, reaper.create_iam_client(), prefix=prefix, dry_run=True, now=NOW)
+
+    assert report['matched'] == 1 and report['counts'] == {'would_delete': 1}
+    assert prefix + 'orphan' in fakes.policies
+
+
+def test_attached_policy_is_detached_before_deletion(reaper, fakes, rd, prefix):
+    arn = add_policy(fakes, prefix + 'attached', minutes(180))
+    iam_client = reaper.create_iam_client()
+    iam_client.attach_user_policy(UserName='engineer', PolicyArn=arn)
+    iam_client.attach_role_policy(RoleName='on-call', PolicyArn=arn)
+
+    report = reaper.sweep(rd, iam_client, prefix=prefix, dry_run=False, now=NOW)
+
+    assert report['counts'] == {'deleted': 1}
+    assert prefix + 'attached' not in fakes.policies
+
+
+def test_died_provisioning_is_reopened_and_can_be_approved_again(reaper, fakes, rd, prefix):
+    from jit_tools import approve
+    request_id = prefix + 'died'
+    store(rd, request_id)
+    request_state.create_state(rd, request_id, user_email=REQUESTER)
+    request_state.transition(rd, request_id, request_state.APPROVED, fields={'decided_by': APPROVER})
+    arn = add_policy(fakes, request_id, minutes(60))
+    checkpoint = resilience.Checkpoint(rd, f"approve:{request_id}")
+    checkpoint.mark('approved_by', APPROVER)
+    checkpoint.mark('policy', {'arn': arn, 'expires_at': iso(minutes(60))})
+    idempotency.claim(rd, request_id, f"decision:approve:{APPROVER}")
+
+    reaper.sweep(rd, reaper.create_iam_client(), prefix=prefix, dry_run=False, now=NOW)
+
+    assert request_state.get_state(rd, request_id)['status'] == request_state.PENDING
+    assert not resilience.Checkpoint(rd, f"approve:{request_id}").stages
+    first, _ = idempotency.claim(rd, request_id, f"decision:approve:{APPROVER}")
+    assert first  # the decision claim was released
+    idempotency.release(rd, request_id, f"decision:approve:{APPROVER}")
+
+    result = approve.process_decision(rd, request_id, 'approve', APPROVER, iam_client=approve.create_iam_client())
+
+    assert request_state.get_state(rd, request_id)['status'] == request_state.PROVISIONED
+    assert result['policy_arn'] and request_id in fakes.policies
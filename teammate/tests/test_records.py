@@ -0,0 +1,214 @@
+"""Record codec round trips, legacy records, and decoding records in every deployment that reads them."""
+import os
+import re
+import ast
+import sys
+import json
+import subprocess
+
+import pytest
+
+from jit_tools import records
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATEMENT = {'Effect': 'Allow', 'Action': [f"s3:Get{i}" for i in range(100)], 'Resource': '*'}
+POLICY = {'Version': '2012-10-17', 'Statement': [STATEMENT]}
+RECORD = {'user_email': 'engineer@example.com', 'ttl_min': 60, 'purpose': 'on-call', 'llm_policy': POLICY}
+CANONICAL = json.dumps(POLICY, sort_keys=True, separators=(',', ':'))
+
+codecs = pytest.mark.skipif(records.msgpack is None or records.zstandard is None,
+                            reason="msgpack and zstandard are needed to encode the sample records")
+
+
+@codecs
+def test_round_trip_with_msgpack_and_zstd():
+    blob = records.encode('r-1', RECORD)
+    view = records.RecordView(blob)
+
+    assert view.flags & records.POLICY_ZSTD and not view.flags & records.FIELDS_JSON
+    request_id, record = records.decode(blob)
+    assert request_id == 'r-1'
+    assert record == dict(RECORD, llm_policy=CANONICAL)
+
+
+def test_small_policy_is_not_compressed():
+    small = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:GetObject', 'Resource': '*'}]}
+    view = records.RecordView(records.encode('r-1', dict(RECORD, llm_policy=small)))
+
+    assert not view.flags & records.POLICY_ZSTD
+    assert view.policy_document == small
+
+
+def test_fields_fall_back_to_json_without_msgpack(monkeypatch):
+    monkeypatch.setattr(records, 'msgpack', None)
+    blob = records.encode('r-1', RECORD)
+
+    assert records.RecordView(blob).flags & records.FIELDS_JSON
+    assert records.decode(blob)[1]['user_email'] == 'engineer@example.com'
+
+
+@codecs
+def test_missing_codecs_are_reported(monkeypatch):
+    blob = records.encode('r-1', RECORD)
+    monkeypatch.setattr(records, 'zstandard', None)
+    with pytest.raises(records.RecordError, match='zstandard'):
+        records.decode(blob)
+    monkeypatch.setattr(records, 'msgpack', None)
+    with pytest.raises(records.RecordError, match='msgpack'):
+        records.RecordView(blob).fields
+
+
+def test_identical_policies_encode_identically():
+    reordered = {'Statement': [dict(reversed(list(STATEMENT.items())))], 'Version': '2012-10-17'}
+    assert records.canonical_policy(POLICY) == records.canonical_policy(json.dumps(reordered, indent=2))
+
+
+@pytest.mark.parametrize('stored', [
+    json.dumps({'r-1': dict(RECORD, llm_policy=json.dumps(POLICY))}),
+    json.dumps({'r-1': dict(RECORD, llm_policy=str(POLICY))}),  # the policy as a Python repr
+    str({'r-1': RECORD}),  # the whole record as a Python repr
+], ids=['json', 'policy-repr', 'record-repr'])
+def test_legacy_records_decode_with_a_canonical_policy(stored):
+    request_id, record = records.decode(stored.encode())
+
+    assert request_id == 'r-1'
+    assert record['llm_policy'] == CANONICAL
+
+
+@pytest.mark.parametrize('blob, message', [
+    (b'JR', 'shorter than its header'),
+    (records.HEADER.pack(records.MAGIC, 9, 0, 0), 'unsupported record version'),
+    (b'\xff\xfe', 'unreadable record'),
+])
+def test_undecodable_records_raise(blob, message):
+    with pytest.raises(records.RecordError, match=message):
+        records.decode(blob)
+
+
+def test_store_and_load(rd):
+    records.store_request(rd, 'r-1', RECORD)
+
+    assert records.load_request(rd, 'r-1') == {'r-1': dict(RECORD, llm_policy=CANONICAL)}
+    assert records.load_request(rd, 'r-2') is None
+
+
+# --- every deployment that runs a script importing records.py can decode records --- #
+
+# optional codec modules of records.py, by the package that installs them
+CODEC_PACKAGES = {'msgpack': 'msgpack', 'zstandard': 'zstandard'}
+IMPORTS_RECORDS = re.compile(r'^\s*(from \S+ )?import [^\n]*\brecords\b', re.MULTILINE)
+SCRIPT = re.compile(r'python3? /tmp/(\w+)\.py')
+PIP_INSTALL = re.compile(r'pip3? install (.+?)(?:\s*>|$)', re.MULTILINE)
+
+DECODE = """
+import sys, importlib.abc
+blocked = set(sys.argv[2].split(',')) - {''}
+
+class Block(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in blocked:
+            raise ImportError(f"{name} is not installed in this deployment")
+
+sys.meta_path.insert(0, Block())
+from jit_tools import records
+request_id, record = records.decode(bytes.fromhex(sys.argv[1]))
+assert request_id == 'check' and record['user_email'] == 'engineer@example.com', record
+assert records.canonical_policy(record['llm_policy']), record
+"""
+
+
+def packages(text):
+    """Distribution names from requirement lines or pip install arguments, lower-cased and unpinned."""
+    names = set()
+    for token in text.split():
+        if token.startswith('-'):
+            continue
+        names.add(re.split(r'[=<>\[;]', token)[0].strip().lower().replace('_', '-'))
+    return names - {''}
+
+
+def reads_records(script):
+    """Whether /tmp/<script>.py imports records.py."""
+    for package in ('jit_tools', 'jira_tools'):
+        path = os.path.join(ROOT, package, f"{script}.py")
+        if os.path.exists(path):
+            with open(path) as f:
+                return bool(IMPORTS_RECORDS.search(f.read()))
+    return False
+
+
+def requirement_file(path):
+    with open(os.path.join(ROOT, path)) as f:
+        return packages(' '.join(line.split('#')[0] for line in f))
+
+
+def tool_deployments(tool_def, requirements=None):
+    """{tool name: packages} for the Tools in `tool_def` that run a script reading records."""
+    with open(os.path.join(ROOT, tool_def)) as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'Tool'):
+            continue
+        keywords = {k.arg: k.value for k in node.keywords}
+        content, name = keywords.get('content'), keywords.get('name')
+        if not isinstance(content, ast.Constant) or not isinstance(name, ast.Constant):
+            continue
+        if not any(reads_records(script) for script in SCRIPT.findall(content.value)):
+            continue
+        installed = set()
+        for arguments in PIP_INSTALL.findall(content.value):
+            if '-r /tmp/requirements.txt' in arguments and requirements:
+                installed |= requirement_file(requirements)  # shipped as /tmp/requirements.txt
+            else:
+                installed |= packages(arguments)
+        found[f"{tool_def}:{name.value}"] = installed
+    return found
+
+
+def dockerfile(path):
+    """Packages a Dockerfile installs with pip, following -r to requirement files in the build context."""
+    with open(os.path.join(ROOT, path)) as f:
+        text = f.read()
+    installed = set()
+    copies = dict(re.findall(r'^COPY (\S+) (\S+)$', text, re.MULTILINE))
+    for arguments in re.findall(r'^RUN pip3? install (.+)$', text, re.MULTILINE):
+        match = re.search(r'-r (\S+)', arguments)
+        if match:
+            source = next((src for src, dest in copies.items() if dest == match.group(1)), None)
+            installed |= requirement_file(source) if source else set()
+        else:
+            installed |= packages(arguments)
+    return installed
+
+
+def deployments():
+    found = {
+        'jit_tools/Dockerfile': dockerfile('jit_tools/Dockerfile'),
+        'jira_tools/Dockerfile': dockerfile('jira_tools/Dockerfile'),
+    }
+    found.update(tool_deployments('jit_tools/tool_def.py'))
+    found.update(tool_deployments('jira_tools/tool_def.py', requirements='jira_tools/requirements.txt'))
+    return found
+
+
+DEPLOYMENTS = deployments()
+
+
+def test_tools_reading_records_are_found():
+    assert any(name.startswith('jit_tools/tool_def.py:') for name in DEPLOYMENTS)
+    assert any(name.startswith('jira_tools/tool_def.py:') for name in DEPLOYMENTS)
+
+
+@codecs
+@pytest.mark.parametrize('name', sorted(DEPLOYMENTS))
+def test_deployment_decodes_records(name):
+    """A record with msgpack fields and a zstd policy decodes where only that deployment's packages import."""
+    blob = records.encode('check', RECORD)
+    assert records.RecordView(blob).flags & records.POLICY_ZSTD
+    blocked = sorted(module for module, package in CODEC_PACKAGES.items() if package not in DEPLOYMENTS[name])
+
+    result = subprocess.run([sys.executable, '-c', DECODE, blob.hex(), ','.join(blocked)],
+                            cwd=ROOT, capture_output=True, text=True)
+
+    assert result.returncode == 0, f"{name} cannot decode a record: {result.stderr.strip()}"
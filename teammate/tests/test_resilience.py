@@ -0,0 +1,152 @@
+"""Retries, circuit breakers shared through Redis, and resume points."""
+import time
+
+import pytest
+
+from shared import resilience
+
+
+class Flaky:
+    """Raises `error` for the first `failures` calls, then returns 'ok'."""
+
+    def __init__(self, failures, error=TimeoutError('timed out')):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return 'ok'
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, 'backoff', lambda attempt, wait=None: 0)
+
+
+def fail(dependency):
+    with pytest.raises(resilience.DependencyError):
+        dependency.call(Flaky(dependency.attempts))
+
+
+def test_transient_failures_are_retried():
+    flaky = Flaky(resilience.RETRY_ATTEMPTS - 1)
+
+    assert resilience.Dependency('test').call(flaky) == 'ok'
+    assert flaky.calls == resilience.RETRY_ATTEMPTS
+
+
+def test_other_errors_are_raised_at_once():
+    flaky = Flaky(1, KeyError('bad input'))
+
+    with pytest.raises(KeyError):
+        resilience.Dependency('test').call(flaky)
+    assert flaky.calls == 1
+
+
+def test_failed_calls_in_a_row_open_the_breaker():
+    dependency = resilience.Dependency('test', attempts=1)
+    for _ in range(resilience.BREAKER_FAILURES):
+        fail(dependency)
+
+    flaky = Flaky(0)
+    with pytest.raises(resilience.CircuitOpen):
+        dependency.call(flaky)
+    assert flaky.calls == 0
+
+
+def test_breaker_lets_a_trial_through_after_the_reset():
+    dependency = resilience.Dependency('test', breaker=resilience.CircuitBreaker(threshold=1, reset=0.05))
+    fail(dependency)
+    assert dependency.breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert dependency.call(Flaky(0)) == 'ok'
+    assert dependency.breaker.state == 'closed'
+
+
+def test_failures_of_instances_sharing_redis_add_up(rd):
+    first, second = (resilience.Dependency('shared', attempts=1, rd=rd) for _ in range(2))
+
+    fail(first)
+    fail(second)
+    fail(first)
+
+    assert int(rd.hget(resilience.BREAKER_PREFIX + 'shared', 'failures')) == 3
+    with pytest.raises(resilience.CircuitOpen):
+        second.call(Flaky(0))  # it failed only once itself
+
+
+def test_success_of_one_instance_resets_the_failures_of_another(rd):
+    first, second = (resilience.Dependency('shared', attempts=1, rd=rd) for _ in range(2))
+    for _ in range(resilience.BREAKER_FAILURES - 1):
+        fail(first)
+
+    assert second.call(Flaky(0)) == 'ok'  # it saw no failure of its own
+    fail(first)
+
+    assert int(rd.hget(resilience.BREAKER_PREFIX + 'shared', 'failures')) == 1
+    assert first.breaker.state == 'closed'
+
+
+def test_breaker_opened_elsewhere_is_seen_by_a_running_instance(rd):
+    running = resilience.Dependency('shared', attempts=1, rd=rd)
+    assert running.call(Flaky(0)) == 'ok'
+
+    other = resilience.Dependency('shared', attempts=1, rd=rd)
+    for _ in range(resilience.BREAKER_FAILURES):
+        fail(other)
+
+    with pytest.raises(resilience.CircuitOpen):
+        running.call(Flaky(0))
+
+
+def test_breaker_state_survives_redis_errors():
+    class Down:
+        def hgetall(self, key):
+            raise ConnectionError('redis is down')
+
+        def pipeline(self):
+            raise ConnectionError('redis is down')
+
+    dependency = resilience.Dependency('test', attempts=1, rd=Down())
+    fail(dependency)
+
+    assert dependency.breaker.failures == 1
+    assert dependency.call(Flaky(0)) == 'ok'
+
+
+@pytest.mark.parametrize('status, retried', [(429, True), (503, True), (404, False), (200, False)])
+def test_http_statuses(status, retried):
+    class Response:
+        def __init__(self, status_code):
+            self.status_code, self.text, self.headers = status_code, '', {}
+
+    class Http:
+        calls = 0
+
+        def request(self, method, url, **kwargs):
+            Http.calls += 1
+            return Response(status if Http.calls == 1 else 200)
+
+    response = resilience.Dependency('test').request(Http(), 'GET', 'http://example.invalid')
+
+    assert response.status_code == (200 if retried else status)
+    assert Http.calls == (2 if retried else 1)
+
+
+@pytest.mark.parametrize('value, seconds', [('3', 3.0), ('-1', 0.0), ('soon', None), (None, None)])
+def test_retry_after(value, seconds):
+    assert resilience.retry_after(value) == seconds
+
+
+def test_checkpoint_resumes_completed_stages(rd):
+    checkpoint = resilience.Checkpoint(rd, 'request:abc')
+    checkpoint.mark('policy', {'Version': '2012-10-17'})
+
+    resumed = resilience.Checkpoint(rd, 'request:abc')
+    assert resumed.done('policy') and resumed.get('policy') == {'Version': '2012-10-17'}
+    resumed.clear()
+    assert not resilience.Checkpoint(rd, 'request:abc').stages
@@ -0,0 +1,69 @@
+"""Static risk scores of actions, resources and policies."""
+import pytest
+
+from jit_tools import risk
+
+
+def allow(action, resource='arn:aws:s3:::logs/app.log'):
+    return {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': action, 'Resource': resource}]}
+
+
+@pytest.mark.parametrize('action, level', [
+    ('s3:GetObject', risk.READ),
+    ('ec2:DescribeInstances', risk.LIST),
+    ('ec2:TerminateInstances', risk.DESTRUCTIVE),
+    ('iam:PassRole', risk.PERMISSIONS),
+    ('iam:AttachRolePolicy', risk.PERMISSIONS),
+    ('ec2:Describe*', risk.LIST),
+    ('s3:Get*', risk.READ),
+])
+def test_action_levels(action, level):
+    assert risk.classify_action(action)[0] == level
+
+
+@pytest.mark.parametrize('action', [
+    'iam:Attach*', 'iam:*Policy', 'iam:Put*Policy', 'iam:*RolePolicy', 'iam:Pass*', 'iam:*Role',
+    'iam:?assRole', 's3:Put*Acl', 'sts:*Role', '*:PassRole',
+])
+def test_wildcards_matching_permissions_actions_anywhere(action):
+    assert risk.classify_action(action)[0] == risk.PERMISSIONS
+
+
+@pytest.mark.parametrize('action, level', [('iam:List*', risk.LIST), ('s3:*Object', risk.WRITE)])
+def test_wildcards_matching_no_permissions_action_keep_their_verb(action, level):
+    assert risk.classify_action(action)[0] == level
+
+
+@pytest.mark.parametrize('resource, wildcard', [
+    ('*', True),
+    ('arn:aws:s3:::*', True),
+    ('arn:aws:s3:::*/*', True),
+    ('arn:aws:ec2:*:*:instance/*', True),
+    ('arn:aws:iam::123456789012:role/*', True),
+    ('arn:aws:lambda:us-east-1:123456789012:function:*', True),
+    ('arn:aws:sqs:us-east-1:123456789012:*', True),
+    ('arn:aws:s3:::logs', False),
+    ('arn:aws:s3:::logs/*', False),
+    ('arn:aws:s3:::logs-*', False),
+    ('arn:aws:iam::123456789012:role/team/*', False),
+    ('arn:aws:ec2:us-east-1:123456789012:instance/i-0abc', False),
+])
+def test_wildcard_resources(resource, wildcard):
+    assert risk.wildcard_resource(resource) == wildcard
+
+
+def test_arn_wildcard_resource_scores_like_a_bare_wildcard():
+    bare = risk.score_policy(allow('s3:PutObject', '*'))
+    arn = risk.score_policy(allow('s3:PutObject', 'arn:aws:s3:::*'))
+    scoped = risk.score_policy(allow('s3:PutObject', 'arn:aws:s3:::logs/*'))
+
+    assert arn.score == bare.score > scoped.score
+    assert 'Resource "arn:aws:s3:::*"' in arn.reasons
+
+
+def test_wildcard_permissions_action_is_high_risk():
+    assert risk.score_policy(allow('iam:Put*Policy', '*')).level == 'high'
+
+
+def test_unparsable_policy_scores_the_maximum():
+    assert risk.score_policy('not a policy') == risk.RiskReport(risk.MAX_SCORE, 'high', ['unparsable policy'])
@@ -0,0 +1,97 @@
+"""Signature checks of the resident Jira webhook receiver."""
+import json
+import asyncio
+
+import pytest
+
+SECRET = 'test-webhook-secret'
+
+
+@pytest.fixture
+def server(fakes, monkeypatch):
+    from jira_tools import webhook_server
+    monkeypatch.setattr(webhook_server, 'JIRA_WEBHOOK_SECRET', SECRET)
+    monkeypatch.setattr(webhook_server, 'JIRA_WEBHOOK_INSECURE', False)
+    return webhook_server
+
+
+@pytest.fixture
+def event():
+    from jira_tools import jira_event_gen
+    body = json.dumps(jira_event_gen.make_event(1)).encode()
+    return body, jira_event_gen.sign(body, SECRET)
+
+
+def deliver(server, body, signature=None):
+    """Status of one POST of `body` to the receiver."""
+    headers = [(b'content-type', b'application/json')]
+    if signature is not None:
+        headers.append((b'x-hub-signature', signature.encode()))
+    scope = {'type': 'http', 'path': server.JIRA_WEBHOOK_PATH, 'method': 'POST', 'headers': headers}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(server.app(scope, receive, send))
+    return sent[0]['status']
+
+
+def start(server):
+    """The lifespan message the receiver answers startup with."""
+    messages = [{'type': 'lifespan.startup'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'lifespan.shutdown'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(server.app({'type': 'lifespan'}, receive, send))
+    return sent[0]
+
+
+@pytest.fixture
+def redis_stub(server, monkeypatch):
+    aioredis = pytest.importorskip('fakeredis').aioredis
+    monkeypatch.setattr(server, 'get_redis', aioredis.FakeRedis)
+
+
+def test_signed_delivery_is_accepted(server, event, redis_stub):
+    body, signature = event
+    assert deliver(server, body, signature) == 202
+
+
+@pytest.mark.parametrize('signature', [None, 'sha256=0000', 'sha1=abc'])
+def test_unsigned_or_badly_signed_delivery_is_refused(server, event, signature):
+    body, _ = event
+    assert deliver(server, body, signature) == 401
+
+
+def test_without_a_secret_every_delivery_is_refused(server, event, monkeypatch):
+    monkeypatch.setattr(server, 'JIRA_WEBHOOK_SECRET', None)
+    body, signature = event
+
+    assert deliver(server, body, signature) == 401
+    assert deliver(server, body) == 401
+
+
+def test_without_a_secret_the_server_does_not_start(server, monkeypatch):
+    monkeypatch.setattr(server, 'JIRA_WEBHOOK_SECRET', None)
+
+    message = start(server)
+
+    assert message['type'] == 'lifespan.startup.failed'
+    assert 'JIRA_WEBHOOK_SECRET' in message['message']
+
+
+def test_insecure_opt_in_accepts_unsigned_deliveries(server, event, redis_stub, monkeypatch):
+    monkeypatch.setattr(server, 'JIRA_WEBHOOK_SECRET', None)
+    monkeypatch.setattr(server, 'JIRA_WEBHOOK_INSECURE', True)
+    body, _ = event
+
+    assert deliver(server, body) == 202